@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+# Bytes per database element for each primitive type, e.g.:
+#   python -m Benchmarks.ElementMemory -n 2000 -o memory.json
+
+import gc
+import sys
+import json
+import types
+import optparse
+
+from Database.Primitives import *
+from Database.CellViews import *
+from Database.Cells import *
+from Database.Layers import Layers
+
+def makeElements(kind, diagram, layers, n):
+    "n elements of a kind, set up the way the gEDA reader builds them"
+    elems = []
+    for i in range(n):
+        if kind == 'Line':
+            e = Line(diagram, layers, i, 0, i + 100, 100)
+        elif kind == 'Rect':
+            e = Rect(diagram, layers, i, 0, 400, 300)
+        elif kind == 'CustomPath':
+            e = CustomPath(diagram, layers)
+            e.moveTo(i, 0)
+            e.lineTo(i + 100, 100)
+            e.curveTo(i, 0, i + 10, 10, i + 20, 0)
+            e.closePath()
+        elif kind == 'Ellipse':
+            e = Ellipse(diagram, layers, i, 0, 200, 200)
+        elif kind == 'EllipseArc':
+            e = EllipseArc(diagram, layers, i, 0, 200, 200, 0, 90)
+        elif kind == 'Label':
+            e = Label(diagram, layers)
+            e.setXY(i, 0)
+            e.setTextSize(10 * 13.888)
+            e.setText('label %d' % i)
+            e.setVisible(True)
+        elif kind == 'AttributeLabel':
+            e = AttributeLabel(diagram, layers, 'refdes', 'U%d' % i)
+            e.setXY(i, 0)
+            e.setTextSize(10 * 13.888)
+            e.setVisible(i % 2 == 0)
+            e.setVisibleKey(False)
+        elif kind == 'NetSegment':
+            e = NetSegment(diagram, layers, i, 0, i, 1000)
+        elif kind == 'SolderDot':
+            e = SolderDot(diagram, layers, i, 0)
+        elif kind == 'Instance':
+            e = Instance(diagram, layers)
+            e.setXY(i, 0)
+            e.setInstanceCell('', 'res', 'symbol')
+        elif kind == 'Pin':
+            e = Pin(diagram, layers, i, 0, i + 300, 0)
+        elif kind == 'SymbolPin':
+            e = SymbolPin(diagram, layers, i, 0, i + 300, 0)
+        elems.append(e)
+    return elems
+
+kinds = ['Line', 'Rect', 'CustomPath', 'Ellipse', 'EllipseArc', 'Label',
+         'AttributeLabel', 'NetSegment', 'SolderDot', 'Instance', 'Pin',
+         'SymbolPin']
+
+def reachable(obj, boundary):
+    "ids and sizes of the objects reachable from obj without crossing boundary"
+    seen = {}
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or id(o) in boundary:
+            continue
+        if isinstance(o, (type, types.ClassType, types.ModuleType,
+                          types.FunctionType, types.MethodType)):
+            continue
+        seen[id(o)] = sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return seen
+
+def ownedBytes(elems, boundary):
+    """
+    Average bytes per element of the objects owned by just one of the
+    elements (the element itself, its __dict__, containers, floats...),
+    objects shared by several elements, like default values, interned
+    strings or layers, are not counted.
+    """
+    boundary = set(boundary) | set(id(e) for e in elems)
+    reached = [reachable(e, boundary - set([id(e)])) for e in elems]
+    owners = {}
+    for r in reached:
+        for i in r:
+            owners[i] = owners.get(i, 0) + 1
+    total = 0
+    for r in reached:
+        for (i, size) in r.items():
+            if owners[i] == 1:
+                total += size
+    return float(total) / max(len(elems), 1)
+
+def measure(n=1000):
+    database = Database()
+    layers = Layers()
+    database.setLayers(layers)
+    library = database.makeLibraryFromPath('/bench')
+    cell = Cell('bench', library)
+    schematic = Schematic('schematic', cell)
+    symbol = Symbol('symbol', cell)
+    boundary = [id(database), id(layers), id(library), id(cell),
+                id(schematic), id(symbol)]
+    boundary += [id(l) for l in layers.layers()]
+    results = {}
+    for kind in kinds:
+        diagram = schematic
+        if kind == 'SymbolPin':
+            diagram = symbol
+        elems = makeElements(kind, diagram, layers, n)
+        results[kind] = ownedBytes(elems, boundary)
+    return results
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--elements', type='int', default=1000,
+                      help='elements created of each type')
+    parser.add_option('-o', '--output', help='write the results as JSON')
+    (opts, args) = parser.parse_args(argv)
+    results = measure(opts.elements)
+    for kind in kinds:
+        print '%-16s %8.1f bytes/element' % (kind, results[kind])
+    if opts.output:
+        f = open(opts.output, 'w')
+        json.dump({'elements': opts.elements, 'bytesPerElement': results},
+                  f, indent=1, sort_keys=True)
+        f.write('\n')
+        f.close()
+
+if __name__ == "__main__":
+    main()
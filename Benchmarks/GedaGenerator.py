@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import random
+
+class GedaLibraryGenerator():
+    """
+    Writes a synthetic gEDA symbol and schematic library tree.
+    The same parameters and seed always produce the same files.
+    """
+    version = 'v 20081231 1\n'
+
+    def __init__(self, directory, symbols=50, schematics=20, components=100,
+                 titleLines=40, paths=4, pathSegments=16, libraries=1, seed=0):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.symbols = symbols
+        self.schematics = schematics
+        self.components = components
+        self.titleLines = titleLines
+        self.paths = paths
+        self.pathSegments = pathSegments
+        self.libraries = max(1, libraries)
+        self.seed = seed
+        self.files = 0
+        self.lines = 0
+        self.bytes = 0
+
+    def parameters(self):
+        return {
+            'symbols': self.symbols,
+            'schematics': self.schematics,
+            'components': self.components,
+            'titleLines': self.titleLines,
+            'paths': self.paths,
+            'pathSegments': self.pathSegments,
+            'libraries': self.libraries,
+            'seed': self.seed,
+            }
+
+    def generate(self):
+        """
+        Write the libraries and return (componentList, sourceList)
+        ready to be passed to GedaImporter.importLibraryList.
+        """
+        self.random = random.Random(self.seed)
+        self.files = self.lines = self.bytes = 0
+        componentList = []
+        sourceList = []
+        symbolNames = []
+        for l in range(self.libraries):
+            d = self.makeDirectory('sym', 'lib%d' % l)
+            componentList.append(['/sym/lib%d' % l, d])
+            for s in range(l, self.symbols, self.libraries):
+                name = 'sym%d.sym' % s
+                self.writeFile(os.path.join(d, name), self.symbol(s))
+                symbolNames.append(name)
+        for l in range(self.libraries):
+            d = self.makeDirectory('sch', 'lib%d' % l)
+            sourceList.append(['/sch/lib%d' % l, d])
+            for s in range(l, self.schematics, self.libraries):
+                name = 'sheet%d.sch' % s
+                self.writeFile(os.path.join(d, name),
+                               self.schematic(s, symbolNames))
+        return (componentList, sourceList)
+
+    def makeDirectory(self, *path):
+        d = os.path.join(self.directory, *path)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        return d
+
+    def writeFile(self, fileName, lines):
+        data = ''.join(lines)
+        f = open(fileName, 'w')
+        f.write(data)
+        f.close()
+        self.files += 1
+        self.lines += len(lines)
+        self.bytes += len(data)
+
+    def line(self, x1, y1, x2, y2):
+        return 'L %d %d %d %d 3 0 0 0 -1 -1\n' % (x1, y1, x2, y2)
+
+    def box(self, x, y, w, h):
+        return 'B %d %d %d %d 3 0 0 0 -1 -1 0 -1 -1 -1 -1 -1\n' % (x, y, w, h)
+
+    def text(self, x, y, lines, visible=1):
+        return (['T %d %d 8 10 %d 1 0 0 %d\n' % (x, y, visible, len(lines))] +
+                [l + '\n' for l in lines])
+
+    def path(self, x, y):
+        r = self.random
+        lines = ['M %d,%d\n' % (x, y)]
+        for i in range(self.pathSegments - 2):
+            x += r.randint(10, 100)
+            y += r.randint(-100, 100)
+            if i % 2:
+                lines.append('L %d,%d\n' % (x, y))
+            else:
+                lines.append('C %d,%d %d,%d %d,%d\n' % (x-5, y-5, x+5, y+5, x, y))
+        lines.append('z\n')
+        return (['H 3 0 0 0 -1 -1 0 -1 -1 -1 -1 -1 %d\n' % len(lines)] +
+                lines)
+
+    def symbol(self, n):
+        r = self.random
+        pins = r.randint(2, 8)
+        height = pins * 100
+        lines = [self.version, self.box(100, 0, 400, height)]
+        for p in range(pins):
+            y = p * 100 + 50
+            if p % 2:
+                lines.append('P 500 %d 800 %d 1 0 1\n' % (y, y))
+            else:
+                lines.append('P 100 %d -200 %d 1 0 1\n' % (y, y))
+            lines.append('{\n')
+            lines += self.text(0, y + 20, ['pinnumber=%d' % (p + 1)], 0)
+            lines += self.text(0, y + 20, ['pinlabel=P%d' % (p + 1)], 0)
+            lines.append('}\n')
+        lines.append('V 300 %d 50 3 0 0 0 -1 -1 0 -1 -1 -1 -1 -1\n' % (height / 2))
+        lines.append('A 300 %d 80 0 90 3 0 0 0 -1 -1\n' % (height / 2))
+        for i in range(self.paths):
+            lines += self.path(100 + i * 10, height)
+        lines += self.text(100, height + 100, ['refdes=U?'])
+        lines += self.text(100, height + 200, ['device=SYM%d' % n], 0)
+        return lines
+
+    def titleBlock(self, n):
+        lines = [self.line(0, 0, 17000, 0), self.line(17000, 0, 17000, 11000),
+                 self.line(17000, 11000, 0, 11000), self.line(0, 11000, 0, 0)]
+        notes = ['Synthetic sheet %d note line %d' % (n, i)
+                 for i in range(self.titleLines)]
+        lines += self.text(13000, 200, notes)
+        lines += self.text(13000, 100, ['sheet %d' % n])
+        return lines
+
+    def schematic(self, n, symbolNames):
+        r = self.random
+        lines = [self.version]
+        lines += self.titleBlock(n)
+        for c in range(self.components):
+            x = 1000 + (c % 20) * 800
+            y = 1000 + (c / 20) * 1200
+            lines.append('C %d %d 1 %d %d %s\n' % (
+                x, y, r.choice([0, 90, 180, 270]), r.randint(0, 1),
+                r.choice(symbolNames)))
+            lines.append('{\n')
+            lines += self.text(x, y + 500, ['refdes=U%d' % (c + 1)])
+            lines.append('}\n')
+            lines.append('N %d %d %d %d 4\n' % (x - 200, y + 50, x - 400, y + 50))
+            lines.append('N %d %d %d %d 4\n' % (x - 400, y + 50, x - 400, y + 600))
+        for i in range(self.paths):
+            lines += self.path(500 + i * 100, 500)
+        return lines
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+# Headless gEDA import benchmark, e.g.:
+#   python -m Benchmarks.ImportBenchmark -d /tmp/bench -s 200 -S 50 \
+#       -e dispatch -e regexp -o results.json
+
+import os
+import sys
+import time
+import json
+import shutil
+import resource
+import platform
+import tempfile
+import optparse
+import multiprocessing
+
+from Database.Reader import GedaReader, GedaImporter
+from Database.Cells import Database
+from Database.Layers import Layers
+from Benchmarks.GedaGenerator import GedaLibraryGenerator
+
+def countElements(database):
+    """
+    Count the elements of all loaded cell views, lazy views that
+    were never opened are not loaded just to be counted.
+    """
+    cellViews = 0
+    elements = 0
+    libs = list(database.libraries())
+    while libs:
+        lib = libs.pop()
+        libs.extend(lib.libraries())
+        for c in lib.cells():
+            for cv in c.cellViews():
+                if hasattr(cv, 'loaded') and not cv.loaded():
+                    continue
+                cellViews += 1
+                elements += len(cv.elems())
+    return (cellViews, elements)
+
+def peakMemory():
+    """Peak resident set size in kB of this process and of its children."""
+    scale = 1
+    if sys.platform == 'darwin':
+        scale = 1024 # bytes instead of kB
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+def importRun(componentList, sourceList, options):
+    """
+    Import the libraries once and return the measurements.
+    Runs in a fresh process so that the peak memory is its own.
+    """
+    (baseline, dummy) = peakMemory()
+    database = Database()
+    database.setLayers(Layers())
+    importer = GedaImporter(database, **options)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        importer.importLibraryList(componentList, sourceList)
+        elapsed = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    (peak, childPeak) = peakMemory()
+    (cellViews, elements) = countElements(database)
+    return {
+        'seconds': elapsed,
+        'cellViews': cellViews,
+        'elements': elements,
+        'baselineKB': baseline,
+        'peakKB': peak,
+        'childPeakKB': childPeak,
+        'stats': importer.stats.totals(),
+        }
+
+def _importWorker(queue, componentList, sourceList, options):
+    try:
+        queue.put(importRun(componentList, sourceList, options))
+    except Exception, e:
+        queue.put({'error': repr(e)})
+
+def isolatedImportRun(componentList, sourceList, options):
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_importWorker,
+                                args=(queue, componentList, sourceList, options))
+    p.start()
+    result = queue.get()
+    p.join()
+    return result
+
+class ImportBenchmark():
+    """
+    Times GedaImporter.importLibraryList on a generated library for
+    a list of importer configurations.
+    """
+    def __init__(self, generator, configurations, repeat=3, cacheDirectory=None):
+        self.generator = generator
+        self.configurations = configurations
+        self.repeat = repeat
+        self.cacheDirectory = cacheDirectory
+
+    def run(self, report=None):
+        (componentList, sourceList) = self.generator.generate()
+        files = self.generator.files
+        results = []
+        for conf in self.configurations:
+            options = dict(conf)
+            cached = options.pop('cache', False)
+            if cached:
+                options['cacheDirectory'] = self.cacheDirectory
+                if os.path.isdir(self.cacheDirectory):
+                    shutil.rmtree(self.cacheDirectory)
+            runs = [isolatedImportRun(componentList, sourceList, options)
+                    for i in range(self.repeat)]
+            result = self.summary(conf, runs, files)
+            results.append(result)
+            if report:
+                report(result)
+        return {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'readerVersion': GedaReader.version,
+            'library': dict(self.generator.parameters(),
+                            files=files,
+                            lines=self.generator.lines,
+                            bytes=self.generator.bytes),
+            'results': results,
+            }
+
+    def summary(self, conf, runs, files):
+        errors = [r['error'] for r in runs if 'error' in r]
+        if errors:
+            return {'configuration': conf, 'error': errors[0]}
+        best = min(runs, key=lambda r: r['seconds'])
+        seconds = max(best['seconds'], 1e-9)
+        return {
+            'configuration': conf,
+            'runs': [r['seconds'] for r in runs],
+            'seconds': best['seconds'],
+            'filesPerSecond': files / seconds,
+            'elementsPerSecond': best['elements'] / seconds,
+            'cellViews': best['cellViews'],
+            'elements': best['elements'],
+            'peakKB': max(r['peakKB'] for r in runs),
+            'childPeakKB': max(r['childPeakKB'] for r in runs),
+            'baselineKB': best['baselineKB'],
+            'stats': best['stats'],
+            }
+
+def printResult(result):
+    conf = ' '.join('%s=%s' % kv for kv in sorted(result['configuration'].items()))
+    if 'error' in result:
+        print '%-40s error: %s' % (conf, result['error'])
+        return
+    print '%-40s %8.3fs %10.1f files/s %12.1f elems/s %8d kB peak' % (
+        conf, result['seconds'], result['filesPerSecond'],
+        result['elementsPerSecond'], max(result['peakKB'], result['childPeakKB']))
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-d', '--directory', help='library directory (default: temporary)')
+    parser.add_option('-s', '--symbols', type='int', default=50)
+    parser.add_option('-S', '--schematics', type='int', default=20)
+    parser.add_option('-c', '--components', type='int', default=100,
+                      help='components per schematic sheet')
+    parser.add_option('-t', '--title-lines', type='int', default=40, dest='titleLines',
+                      help='lines of the title block text')
+    parser.add_option('-p', '--paths', type='int', default=4,
+                      help='H paths per file')
+    parser.add_option('--path-segments', type='int', default=16, dest='pathSegments')
+    parser.add_option('-l', '--libraries', type='int', default=1)
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('-e', '--engine', action='append', dest='engines',
+                      choices=GedaReader.engines,
+                      help='reader engine, may be repeated (default: all)')
+    parser.add_option('-j', '--processes', type='int', action='append',
+                      help='importer processes, may be repeated (default: 1)')
+    parser.add_option('--lazy', action='store_true', default=False)
+    parser.add_option('--cache', action='store_true', default=False,
+                      help='also run with a cold and a warm parse cache')
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    parser.add_option('-o', '--output', help='write the results as JSON')
+    (opts, args) = parser.parse_args(argv)
+
+    directory = opts.directory or tempfile.mkdtemp(prefix='pschem-bench-')
+    generator = GedaLibraryGenerator(
+        os.path.join(directory, 'libs'), opts.symbols, opts.schematics,
+        opts.components, opts.titleLines, opts.paths, opts.pathSegments,
+        opts.libraries, opts.seed)
+    configurations = []
+    for engine in opts.engines or GedaReader.engines:
+        for processes in opts.processes or [1]:
+            conf = {'engine': engine, 'processes': processes, 'lazy': opts.lazy}
+            configurations.append(conf)
+            if opts.cache:
+                # the first run of the set fills the cache
+                configurations.append(dict(conf, cache=True))
+    benchmark = ImportBenchmark(generator, configurations, opts.repeat,
+                                os.path.join(directory, 'cache'))
+    results = benchmark.run(printResult)
+    if opts.output:
+        f = open(opts.output, 'w')
+        json.dump(results, f, indent=1, sort_keys=True)
+        f.write('\n')
+        f.close()
+    if not opts.directory:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
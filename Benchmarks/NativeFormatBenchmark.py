@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem.
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with PSchem.  If not, see <http://www.gnu.org/licenses/>.
+
+# Loading schematic sheets saved in the native format against parsing
+# their gEDA source again, e.g.:
+#   python -m Benchmarks.NativeFormatBenchmark -S 20 -c 200 -o native.json
+
+import os
+import sys
+import time
+import json
+import shutil
+import tempfile
+import optparse
+
+from Database.Reader import GedaReader, GedaImporter
+from Database.CellViews import Schematic
+from Database.Cells import Database, Cell
+from Database.Layers import Layers
+from Benchmarks.GedaGenerator import GedaLibraryGenerator
+
+def sheets(database, sourceList):
+    "(gEDA file, schematic) of the generated sheets"
+    result = []
+    for (libPath, directory) in sourceList:
+        for f in sorted(os.listdir(directory)):
+            if f.endswith('.sch'):
+                schematic = database.cellViewByName(libPath, f[:-4], 'schematic')
+                if schematic:
+                    result.append((os.path.join(directory, f), schematic))
+    return result
+
+def measure(generator, directory, repeat=3):
+    (componentList, sourceList) = generator.generate()
+    database = Database()
+    database.setLayers(Layers())
+    importer = GedaImporter(database)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        importer.importLibraryList(componentList, sourceList)
+        files = sheets(database, sourceList)
+        saved = []
+        start = time.time()
+        for (n, (f, schematic)) in enumerate(files):
+            fileName = os.path.join(directory, 'sheet%d.xml' % n)
+            schematic.save(fileName)
+            saved.append(fileName)
+        saveSeconds = time.time() - start
+        scratch = Cell('scratch', database.makeLibraryFromPath('/scratch'))
+        gedaRuns = []
+        nativeRuns = []
+        for i in range(repeat):
+            start = time.time()
+            for (f, schematic) in files:
+                view = Schematic('geda', scratch)
+                GedaReader(importer).parseSchematic(f, view)
+                view.remove()
+            gedaRuns.append(time.time() - start)
+            start = time.time()
+            for fileName in saved:
+                view = Schematic('native', scratch)
+                view.restore(fileName)
+                view.remove()
+            nativeRuns.append(time.time() - start)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return {
+        'sheets': len(files),
+        'elements': sum(len(s.elems()) for (f, s) in files),
+        'gedaBytes': sum(os.path.getsize(f) for (f, s) in files),
+        'nativeBytes': sum(os.path.getsize(f) for f in saved),
+        'saveSeconds': saveSeconds,
+        'gedaSeconds': min(gedaRuns),
+        'nativeSeconds': min(nativeRuns),
+        }
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-d', '--directory', help='library directory (default: temporary)')
+    parser.add_option('-s', '--symbols', type='int', default=50)
+    parser.add_option('-S', '--schematics', type='int', default=20)
+    parser.add_option('-c', '--components', type='int', default=100,
+                      help='components per schematic sheet')
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    parser.add_option('-o', '--output', help='write the results as JSON')
+    (opts, args) = parser.parse_args(argv)
+
+    directory = opts.directory or tempfile.mkdtemp(prefix='pschem-bench-')
+    generator = GedaLibraryGenerator(
+        os.path.join(directory, 'libs'), opts.symbols, opts.schematics,
+        opts.components, seed=opts.seed)
+    saved = os.path.join(directory, 'native')
+    if not os.path.isdir(saved):
+        os.makedirs(saved)
+    results = measure(generator, saved, opts.repeat)
+    print '%d sheets, %d elements' % (results['sheets'], results['elements'])
+    print 'gEDA   %8.3fs %10d bytes' % (results['gedaSeconds'], results['gedaBytes'])
+    print 'native %8.3fs %10d bytes (saved in %.3fs)' % (
+        results['nativeSeconds'], results['nativeBytes'], results['saveSeconds'])
+    if opts.output:
+        f = open(opts.output, 'w')
+        json.dump(dict(results, parameters=generator.parameters()),
+                  f, indent=1, sort_keys=True)
+        f.write('\n')
+        f.close()
+    if not opts.directory:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+#
+# python package directory
+#
+__all__ = [
+#    'GedaGenerator',
+#    'ImportBenchmark',
+    ]
@@ -20,7 +20,8 @@
 #from Database.Cells import *
 from xml.etree import ElementTree as et
 
-class Attribute():
+class Attribute(object):
+    __slots__ = ('_name', '_val', '_type', '_editable', '_parent')
     AString   = 'string'
     AInteger   = 'int'
     AFloat   = 'float'
@@ -17,13 +17,18 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
 
-print 'CellViews in'
+#print 'CellViews in'
 
+import sys
+import itertools
+from xml.sax.saxutils import quoteattr
 from Database.Primitives import *
+from Database.Geometry import DiagramGeometry, SpatialIndex, AxisPoints, uniteBoxes
+from Database.Nets import SchematicNets
 #from Database.Design import *
 from xml.etree import ElementTree as et
 
-print 'CellViews out'
+#print 'CellViews out'
 
 class CellView():
     def __init__(self, name, cell):
@@ -54,14 +59,12 @@ class CellView():
         pass
 
     def remove(self):
-        for a in list(self.attributes()):
-            a.remove()
         self.cell().cellViewRemoved(self)
 
 class Diagram(CellView):
     def __init__(self, name, cell):
         CellView.__init__(self, name, cell)
-        #self._elems = set()
+        self._elems = set()
         self._items = set()
         self._lines = set()
         self._rects = set()
@@ -70,10 +73,96 @@ class Diagram(CellView):
         self._ellipseArcs = set()
         self._labels = set()
         self._attributeLabels = set()
+        # element kind -> set of its elements, all kept in _elems too
+        self._kinds = {
+            'lines': self._lines,
+            'rects': self._rects,
+            'customPaths': self._customPaths,
+            'ellipses': self._ellipses,
+            'ellipseArcs': self._ellipseArcs,
+            'labels': self._labels,
+            'attributeLabels': self._attributeLabels,
+            }
         #self._uu = 160 # default DB units per user units
         self._attribs['uu'] = 160 # default DB units per user units
         #self._name = 'diagram'
         self._designUnits = set()
+        self._loader = None
+        self._loading = False
+        self._geometry = None
+        self._spatialIndex = None
+
+    def setLoader(self, loader):
+        """
+        Defer reading the contents of the diagram,
+        loader(diagram) is called the first time they are needed
+        """
+        self._loader = loader
+
+    def loaded(self):
+        return self._loader is None
+
+    def load(self):
+        if self._loader:
+            loader = self._loader
+            self._loader = None
+            self._loading = True
+            try:
+                loader(self)
+            finally:
+                self._loading = False
+
+    def loading(self):
+        "the loader is filling in the contents, they are not edits"
+        return self._loading
+
+    def geometry(self, useNumpy=True):
+        """
+        Columnar store of the coordinates of the lines, net segments and
+        pins, created on first use and then kept up to date
+        """
+        if self._geometry is None:
+            self.load()
+            geometry = DiagramGeometry(useNumpy)
+            for e in self.elems():
+                geometry.add(e)
+            self._geometry = geometry
+        return self._geometry
+
+    def releaseGeometry(self):
+        self._geometry = None
+
+    def spatialIndex(self, cellSize=None):
+        """
+        Grid index of the element bounding boxes by kind, created on
+        first use and then kept up to date. cellSize defaults to
+        ten user units.
+        """
+        if self._spatialIndex is None:
+            self.load()
+            index = SpatialIndex(cellSize or 10 * self.uu())
+            for (kind, elems) in self._kinds.items():
+                for e in elems:
+                    index.add(kind, e)
+            self._spatialIndex = index
+        return self._spatialIndex
+
+    def releaseSpatialIndex(self):
+        self._spatialIndex = None
+
+    def elemKind(self, elem):
+        "registry kind of an element of the diagram, e.g. 'lines'"
+        for (kind, elems) in self._kinds.iteritems():
+            if elem in elems:
+                return kind
+        return None
+
+    def boundingBox(self):
+        "(x1, y1, x2, y2) of all elements or None if there are none"
+        if self._spatialIndex is not None:
+            index = self._spatialIndex
+            return uniteBoxes(index.boundingBox(e) for e in self.elems())
+        return uniteBoxes(e.boundingBox() for e in self.elems())
 
     def addedInstanceItem(self, view):
         self._items.add(view)
@@ -94,6 +183,9 @@ class Diagram(CellView):
     def designUnitRemoved(self, designUnit):
         self._designUnits.remove(designUnit)
 
+    def designUnits(self):
+        return self._designUnits
+
     #def updateDesignUnits(self):
     #    for d in self._designUnits:
     #        d.updateDesignUnit()
@@ -106,135 +198,227 @@ class Diagram(CellView):
         return self._items
         
     def elems(self):
-        return self.lines() | self.rects() | self.labels() | \
-            self.attributeLabels() | self.customPaths() | \
-            self.ellipses() | self.ellipseArcs()
-            
+        """
+        All elements, kept up to date by the *Added and *Removed hooks.
+        The set is the diagram's own, iterate over a copy when adding
+        or removing elements on the way.
+        """
+        self.load()
+        return self._elems
+
+    def kinds(self):
+        return sorted(self._kinds.keys())
+
+    def iterElems(self, *kinds):
+        "iterate over the elements of the given kinds, e.g. 'lines', or all"
+        self.load()
+        if not kinds:
+            return iter(self._elems)
+        return itertools.chain(*[self._kinds[k] for k in kinds])
+
+    def elemCount(self, *kinds):
+        "number of elements of the given kinds or of all"
+        self.load()
+        if not kinds:
+            return len(self._elems)
+        return sum(len(self._kinds[k]) for k in kinds)
+
     def elementAdded(self, elem):
+        "show a new element in the open scenes and instance items"
         for designUnit in self._designUnits:
             elem.addToDesignUnit(designUnit)
+        for item in self._items:
+            elem.addToView(item)
 
     def elementRemoved(self, elem):
-        for designUnit in self._designUnits:
-            elem.removeFromDesignUnit(designUnit)
+        "take a removed element off the open scenes and instance items"
+        elem.removeFromViews()
         
     def addElem(self, elem):
         "main entry point for adding new elements to diagram"
-        #self._elems.add(elem)
         elem.addToDiagram(self)
-        for designUnit in self._designUnits:
-            elem.addToDesignUnit(designUnit)
+        if self._geometry is not None:
+            self._geometry.add(elem)
+        if self._spatialIndex is not None:
+            self._spatialIndex.add(self.elemKind(elem), elem)
+        self.elementAdded(elem)
 
     def removeElem(self, elem):
         "main entry point for removing elements from diagram"
-        for designUnit in self._designUnits:
-            elem.removeFromDesignUnit(designUnit)
+        self.elementRemoved(elem)
         elem.removeFromDiagram(self)
+        if self._geometry is not None:
+            self._geometry.remove(elem)
+        if self._spatialIndex is not None:
+            self._spatialIndex.remove(elem)
+
+    def elementMoved(self, elem):
+        "an element moved or changed its shape"
+        if self._geometry is not None:
+            self._geometry.update(elem)
+        if self._spatialIndex is not None:
+            self._spatialIndex.update(elem)
+
+    def elementChanged(self, elem):
+        "the text or the attributes of an element changed"
+        pass
+
+    def clear(self):
+        "remove all elements, keeping the cell view and its design units"
+        for e in list(self.elems()):
+            if e in self._elems: # not taken along by an earlier one
+                self.removeElem(e)
 
     def lineAdded(self, line):
         self._lines.add(line)
+        self._elems.add(line)
         
     def lineRemoved(self, line):
         self._lines.remove(line)
+        self._elems.remove(line)
         
     def lines(self):
+        self.load()
         return self._lines
 
     def rectAdded(self, rect):
         self._rects.add(rect)
+        self._elems.add(rect)
         
     def rectRemoved(self, rect):
         self._rects.remove(rect)
+        self._elems.remove(rect)
         
     def rects(self):
+        self.load()
         return self._rects
 
     def customPathAdded(self, customPath):
         self._customPaths.add(customPath)
+        self._elems.add(customPath)
         
     def customPathRemoved(self, customPath):
         self._customPaths.remove(customPath)
+        self._elems.remove(customPath)
         
     def customPaths(self):
+        self.load()
         return self._customPaths
 
     def ellipseAdded(self, ellipse):
         self._ellipses.add(ellipse)
+        self._elems.add(ellipse)
         
     def ellipseRemoved(self, ellipse):
         self._ellipses.remove(ellipse)
+        self._elems.remove(ellipse)
         
     def ellipses(self):
+        self.load()
         return self._ellipses
 
     def ellipseArcAdded(self, ellipseArc):
         self._ellipseArcs.add(ellipseArc)
+        self._elems.add(ellipseArc)
         
     def ellipseArcRemoved(self, ellipseArc):
         self._ellipseArcs.remove(ellipseArc)
+        self._elems.remove(ellipseArc)
         
     def ellipseArcs(self):
+        self.load()
         return self._ellipseArcs
 
     def labelAdded(self, label):
         self._labels.add(label)
+        self._elems.add(label)
         
     def labelRemoved(self, label):
         self._labels.remove(label)
+        self._elems.remove(label)
         
     def labels(self):
+        self.load()
         return self._labels
 
     def attributeLabelAdded(self, attributeLabel):
         self._attributeLabels.add(attributeLabel)
+        self._elems.add(attributeLabel)
         
     def attributeLabelRemoved(self, attributeLabel):
         self._attributeLabels.remove(attributeLabel)
+        self._elems.remove(attributeLabel)
         
     def attributeLabels(self):
+        self.load()
         return self._attributeLabels
 
+    def topAttributeLabels(self):
+        "attribute labels not attached to an element, e.g. a symbol's refdes"
+        attached = set()
+        for e in self.elems():
+            attached.update(e.attributes())
+        return self.attributeLabels() - attached
+
     def uu(self):
+        self.load()
         return self._attribs['uu']
 
     def remove(self):
+        self._loader = None # contents never loaded need no removal
         for e in list(self.elems()):
-            e.remove()
+            if e in self._elems: # not taken along by an earlier one
+                e.remove()
             #self.removeElem(e)
         for du in list(self.designUnits()):
             du.remove()
             #self.removeDesignUnit(o)
         CellView.remove(self)
 
-    def save(self):
-        root = et.Element(self._name)
-        tree = et.ElementTree(root)
-        for a in sorted(self.attribs()):
-            root.attrib[str(a)] = str(self.attribs()[a])
-        for e in sorted(self.elems(), key=Element.name):
-            xElem = e.toXml()
-            root.append(xElem)
-        self._indentET(tree.getroot())
-        et.dump(tree)
-        #return tree
-        
-    def restore(self):
-        pass
-    
-    def _indentET(self, elem, level=0):
-        i = "\n" + level*"  "
-        if len(elem):
-            if not elem.text or not elem.text.strip():
-                elem.text = i + "  "
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-            for elem in elem:
-                self._indentET(elem, level+1)
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
+    # element kinds in the order they are saved, the net segments ahead
+    # of the solder dots they bring along when they are restored
+    saveOrder = ['lines', 'rects', 'customPaths', 'ellipses', 'ellipseArcs',
+                 'netSegments', 'solderDots', 'pins', 'symbolPins',
+                 'instances', 'labels', 'attributeLabels']
+
+    def save(self, fileName=None):
+        """
+        Write the diagram in the native xml format, to stdout without
+        fileName. The elements are written one at a time, the attribute
+        labels attached to an element inside it.
+        """
+        self.load()
+        if fileName:
+            f = open(fileName, 'w')
         else:
-            if level and (not elem.tail or not elem.tail.strip()):
-                elem.tail = i
+            f = sys.stdout
+        try:
+            f.write("<?xml version='1.0' encoding='us-ascii'?>\n")
+            f.write('<' + self._name)
+            for a in sorted(self._attribs):
+                f.write(' %s=%s' % (a, quoteattr(xmlValue(self._attribs[a]))))
+            f.write('>\n')
+            kinds = [k for k in self.saveOrder if self._kinds.has_key(k)]
+            kinds += sorted(k for k in self._kinds if not k in self.saveOrder)
+            for kind in kinds:
+                elems = self._kinds[kind]
+                if kind == 'attributeLabels':
+                    elems = self.topAttributeLabels()
+                for e in sorted(elems, key=lambda e: (e.x(), e.y())):
+                    f.write(et.tostring(e.toXml()))
+                    f.write('\n')
+            f.write('</%s>\n' % self._name)
+        finally:
+            if fileName:
+                f.close()
+
+    def restore(self, fileName):
+        "replace the contents with those saved to fileName, see save()"
+        from Database.Reader import NativeReader
+        self._loader = None # the saved contents replace any pending ones
+        with self.database().bulkUpdate():
+            self.clear()
+            NativeReader(self.database()).parseDiagram(fileName, self)
     
 class Schematic(Diagram):
     def __init__(self, name, cell):
@@ -244,7 +428,16 @@ class Schematic(Diagram):
         self._instances = set()
         self._netSegments = set()
         self._solderDots = set()
-        self._nets = set()
+        self._connectivity = None
+        self._kinds['pins'] = self._pins
+        self._kinds['instances'] = self._instances
+        self._kinds['netSegments'] = self._netSegments
+        self._kinds['solderDots'] = self._solderDots
+        # net segment end point -> number of segments ending there,
+        # a solder dot is kept at every point with three or more
+        self._endpointDegrees = {}
+        self._segmentEndpoints = {} # net segment -> its counted end points
+        self._junctionDots = {}     # junction point -> its solder dot
 
     def designUnitAdded(self, designUnit):
         self._designUnits.add(designUnit)
@@ -259,122 +452,250 @@ class Schematic(Diagram):
     #    components = map(lambda i: i.cell(), self.instances())
     #    return components.sort()
 
-    def elems(self):
-        return Diagram.elems(self) | self.pins() | self.instances() | self.netSegments() | self.solderDots()
 
     def pinAdded(self, pin):
         self._pins.add(pin)
+        self._elems.add(pin)
        
     def pinRemoved(self, pin):
         self._pins.remove(pin)
+        self._elems.remove(pin)
         
     def pins(self):
+        self.load()
         return self._pins
 
     def instanceAdded(self, instance):
         self._instances.add(instance)
+        self._elems.add(instance)
+        if not self._loading:
+            self.database().designs().instancesChanged(self)
         
     def instanceRemoved(self, instance):
         self._instances.remove(instance)
+        self._elems.remove(instance)
+        if not self._loading:
+            self.database().designs().instancesChanged(self)
         
     def instances(self):
+        self.load()
         return self._instances
 
-    #def addNet(self, net):
-    #    "call only from addToDiagram"
-    #    self._nets.add(net)
-        
-    #def removeNet(self, net):
-    #    "call only from removeFromDiagram"
-    #    self._nets.remove(net)
-        
-    #def nets(self):
-    #    return self._nets #filter(lambda e: isinstance(e, CNet), self.elems())
+    def resolveInstances(self):
+        """
+        Resolve the cell views of all instances, once per distinct
+        (library path, cell, cell view), returns the unresolved instances
+        """
+        database = self.database()
+        byKey = {}
+        for i in self.instances():
+            byKey.setdefault(i.resolutionKey(), []).append(i)
+        unresolved = []
+        for (key, instances) in byKey.iteritems():
+            if not database.resolveCellView(*key):
+                unresolved.extend(instances)
+        return unresolved
+
+    def connectivity(self):
+        """
+        Nets of the net segments, pins and instances, extracted on first
+        use and then kept up to date, see SchematicNets
+        """
+        if self._connectivity is None:
+            self.load()
+            self._connectivity = SchematicNets(self)
+        return self._connectivity
+
+    def extractedConnectivity(self):
+        "the nets if they have been extracted, None otherwise"
+        return self._connectivity
+
+    def releaseConnectivity(self):
+        self._connectivity = None
+
+    def nets(self):
+        return self.connectivity().nets()
+
+    def elementAdded(self, elem):
+        Diagram.elementAdded(self, elem)
+        if self._connectivity is not None:
+            self._connectivity.update(elem)
+
+    def elementRemoved(self, elem):
+        if self._connectivity is not None:
+            self._connectivity.update(elem, False)
+        Diagram.elementRemoved(self, elem)
+
+    def elementChanged(self, elem):
+        if self._connectivity is not None:
+            self._connectivity.update(elem)
+
+    def clear(self):
+        # one extraction instead of following every removal
+        connectivity = self._connectivity
+        self._connectivity = None
+        Diagram.clear(self)
+        if connectivity is not None:
+            self._connectivity = connectivity
+            connectivity.rebuild()
+
+    def remove(self):
+        self._connectivity = None
+        Diagram.remove(self)
 
     def netSegmentAdded(self, netSegment):
         self._netSegments.add(netSegment)
+        self._elems.add(netSegment)
+        self.countEndpoints(netSegment)
         
     def netSegmentRemoved(self, netSegment):
         self._netSegments.remove(netSegment)
+        self._elems.remove(netSegment)
+        self.uncountEndpoints(netSegment)
+
+    def countEndpoints(self, netSegment):
+        points = set([(netSegment.x1(), netSegment.y1()),
+                      (netSegment.x2(), netSegment.y2())])
+        self._segmentEndpoints[netSegment] = points
+        for p in points:
+            degree = self._endpointDegrees.get(p, 0) + 1
+            self._endpointDegrees[p] = degree
+            if degree == 3 and not p in self._junctionDots:
+                SolderDot(self, netSegment.layers(), p[0], p[1])
+
+    def uncountEndpoints(self, netSegment):
+        for p in self._segmentEndpoints.pop(netSegment):
+            degree = self._endpointDegrees[p] - 1
+            if degree:
+                self._endpointDegrees[p] = degree
+            else:
+                del self._endpointDegrees[p]
+            if degree == 2 and p in self._junctionDots:
+                self._junctionDots[p].remove()
+
+    def endpointDegree(self, x, y):
+        "number of net segments ending at x, y"
+        self.load()
+        return self._endpointDegrees.get((x, y), 0)
+
+    def junctions(self):
+        "points where three or more net segments end"
+        self.load()
+        return [p for (p, d) in self._endpointDegrees.iteritems() if d > 2]
+
+    def elementMoved(self, elem):
+        if elem in self._segmentEndpoints:
+            self.uncountEndpoints(elem)
+            self.countEndpoints(elem)
+        elif elem in self._solderDots:
+            for (p, dot) in self._junctionDots.items():
+                if dot is elem:
+                    del self._junctionDots[p]
+            self._junctionDots.setdefault((elem.x(), elem.y()), elem)
+        Diagram.elementMoved(self, elem)
+        if self._connectivity is not None:
+            self._connectivity.update(elem)
         
     def netSegments(self):
+        self.load()
         return self._netSegments
 
     def solderDotAdded(self, solderDot):
         self._solderDots.add(solderDot)
+        self._elems.add(solderDot)
+        self._junctionDots.setdefault((solderDot.x(), solderDot.y()), solderDot)
         
     def solderDotRemoved(self, solderDot):
         self._solderDots.remove(solderDot)
+        self._elems.remove(solderDot)
+        p = (solderDot.x(), solderDot.y())
+        if self._junctionDots.get(p) is solderDot:
+            del self._junctionDots[p]
         
     def solderDots(self):
+        self.load()
         return self._solderDots
 
+    def solderDotAt(self, x, y):
+        "the junction solder dot at x, y or None"
+        self.load()
+        return self._junctionDots.get((x, y))
+
     def checkNetSegments(self, segments = None):
+        """
+        Split the net segments at the end points of other segments
+        lying inside them (T-junctions). With segments given, only
+        those and the segments their end points lie inside are checked.
+        """
+        allSegments = self.netSegments()
+        endpoints = AxisPoints(self.netSegmentEndpoints(allSegments))
         if not segments:
-            segments = self.netSegments()
-        origNetSegments = segments
-        for n in list(origNetSegments):
-            splitPoints = set()
-            for n2 in origNetSegments:
-                if n.containsInside(n2.x1(), n2.y1()):
-                    splitPoints.add((n2.x1(), n2.y1()))
-                    #print n.x1(), n.y1()
-                if n.containsInside(n2.x2(), n2.y2()):
-                    splitPoints.add((n2.x2(), n2.y2()))
-                    #print n.x2(), n.y2()
-            if splitPoints:
-                splitPoints.add((n.x1(), n.y1()))
-                splitPoints.add((n.x2(), n.y2()))
-                pointList = list(splitPoints)
-                if (n.x1() != n.x2()):
-                    pointList.sort(lambda p1, p2: cmp(p1[0], p2[0]))
-                else:
-                    pointList.sort(lambda p1, p2: cmp(p1[1], p2[1]))
+            segments = list(allSegments)
+        else:
+            segments = set(segments) & allSegments
+            probe = AxisPoints(self.netSegmentEndpoints(segments))
+            for n in allSegments:
+                if probe.inside(n.x1(), n.y1(), n.x2(), n.y2()):
+                    segments.add(n)
+        # splitting keeps the set of end points, so it is built once
+        for n in segments:
+            (x1, y1, x2, y2) = (n.x1(), n.y1(), n.x2(), n.y2())
+            inner = endpoints.inside(x1, y1, x2, y2)
+            if inner:
+                pointList = sorted([(x1, y1), (x2, y2)])
+                pointList[1:1] = inner
                 prevPoint = pointList[0]
+                pieces = []
                 for p in pointList[1:]:
                     newSegment = NetSegment(n.diagram(), n.layers(), prevPoint[0], prevPoint[1], p[0], p[1])
-                    #self.addElem(newSegment)
-                    #print prevPoint[0], p[0], prevPoint[1], p[1]
+                    pieces.append(newSegment)
                     prevPoint = p
+                # the attributes, e.g. netname, go to the piece nearest to them
+                for a in n.attributes():
+                    min(pieces, key=lambda piece: self.distance(piece, a.x(), a.y())).addAttribute(a)
                 n.remove() #self.removeElem(n)
 
+    def distance(self, segment, x, y):
+        "squared distance of a point from a horizontal or vertical segment"
+        cx = min(max(x, segment.minX()), segment.maxX())
+        cy = min(max(y, segment.minY()), segment.maxY())
+        return (x - cx) ** 2 + (y - cy) ** 2
+
+    def netSegmentEndpoints(self, segments):
+        for n in segments:
+            yield (n.x1(), n.y1())
+            yield (n.x2(), n.y2())
+
     def checkSolderDots(self, segments = None):
+        """
+        Solder dots follow the net segments as they are added and
+        removed, this only removes dots away from junctions and
+        duplicate ones, at the end points of segments or everywhere
+        """
         if not segments:
-            segments = self.netSegments()
-        origNetSegments = segments
-        origSolderDots = self.solderDots()
-        for n in origNetSegments:
-            count1 = -1
-            count2 = -1
-            solder1 = filter(lambda sd: sd.x() == n.x1() and sd.y() == n.x2, origSolderDots)
-            solder2 = filter(lambda sd: sd.x() == n.x1() and sd.y() == n.x2, origSolderDots)
-            for n2 in origNetSegments:
-                if ((n.x1() == n2.x1() and n.y1() == n2.y1()) or
-                    (n.x1() == n2.x2() and n.y1() == n2.y2())):
-                    count1 += 1
-                if ((n.x2() == n2.x1() and n.y2() == n2.y1()) or
-                    (n.x2() == n2.x2() and n.y2() == n2.y2())):
-                    count2 += 1
-            if count1 > 1:
-                if not solder1:
-                    solder = SolderDot(n.diagram(), n.layers(), n.x1(), n.y1())
-                    #self.addElem(solder)
-            elif solder1:
-                    solder1.remove()
-                    #self.removeElem(solder1)
-            if count2 > 1:
-                if not solder2:
-                    solder = SolderDot(n.diagram(), n.layers(), n.x2(), n.y2())
-                    #self.addElem(solder)
-            elif solder2:
-                    solder2.remove()
-                    #self.removeElem(solder2)
+            points = None
+        else:
+            points = set(self.netSegmentEndpoints(segments))
+        dots = {}
+        for dot in list(self.solderDots()):
+            p = (dot.x(), dot.y())
+            if points is not None and not p in points:
+                continue
+            if self._endpointDegrees.get(p, 0) < 3 or p in dots:
+                dot.remove()
+            else:
+                dots[p] = dot
+                self._junctionDots[p] = dot
+        for p in self.junctions():
+            if (points is None or p in points) and not p in dots:
+                SolderDot(self, self.database().layers(), p[0], p[1])
                 
 class Symbol(Diagram):
     def __init__(self, name, cell):
         Diagram.__init__(self, name, cell)
         #self._name = 'symbol'
         self._symbolPins = set()
+        self._kinds['symbolPins'] = self._symbolPins
 
     def designUnitAdded(self, designUnit):
         self._designUnits.add(designUnit)
@@ -382,16 +703,16 @@ class Symbol(Diagram):
         for e in self.elems():
             e.addToView(scene)
 
-    def elems(self):
-        return Diagram.elems(self) | self.symbolPins()
-        
     def symbolPinAdded(self, symbolPin):
         self._symbolPins.add(symbolPin)
+        self._elems.add(symbolPin)
        
     def symbolPinRemoved(self, symbolPin):
         self._symbolPins.remove(symbolPin)
+        self._elems.remove(symbolPin)
         
     def symbolPins(self):
+        self.load()
         return self._symbolPins
 
 class Netlist(CellView):
@@ -22,9 +22,48 @@
 #from Database.CellViews import *
 from Database.Design import *
 from xml.etree import ElementTree as et
+import contextlib
 
 #print 'Cells out'
 
+_normalizedPaths = {}   # library path -> normalized absolute path
+_concatenatedPaths = {} # (library path, relative path) -> library path
+_pathCacheSize = 10000
+
+def internPath(path):
+    if isinstance(path, str):
+        return intern(path)
+    return path
+
+def normalizeLibraryPath(libraryPath):
+    """
+    Absolute library path without empty, '.' and '..' parts, e.g.
+    'sym/./analog/' -> '/sym/analog', None if it leads above the root.
+    An empty part inside the path ('//') starts again from the root.
+    The results are interned and cached.
+    """
+    if _normalizedPaths.has_key(libraryPath):
+        return _normalizedPaths[libraryPath]
+    parts = []
+    normalized = None
+    split = libraryPath.split('/')
+    for (i, part) in enumerate(split):
+        if part == '..':
+            if not parts:
+                break
+            parts.pop()
+        elif part == '' and 0 < i < len(split) - 1:
+            parts = []
+        elif part != '' and part != '.':
+            parts.append(part)
+    else:
+        if parts:
+            normalized = internPath('/' + '/'.join(parts))
+    if len(_normalizedPaths) > _pathCacheSize:
+        _normalizedPaths.clear()
+    _normalizedPaths[libraryPath] = normalized
+    return normalized
+
 class Cell():
     def __init__(self, name, library):
         self._cellViews = set()
@@ -60,11 +99,13 @@ class Cell():
     def cellViewAdded(self, cellView):
         self._cellViews.add(cellView)
         self._cellViewNames[cellView.name()] = cellView
+        self.database().cellViewIndexed(cellView)
         self.library().cellChanged(self)
 
     def cellViewRemoved(self, cellView):
         self._cellViews.remove(cellView)
         del self._cellViewNames[cellView.name()]
+        self.database().cellViewUnindexed(cellView)
         self.library().cellChanged(self)
         
     def cellViewChanged(self, cellView):
@@ -88,6 +129,7 @@ class Cell():
     def remove(self):
         for c in list(self.cellViews()):
             c.remove()
+        self.library().cellRemoved(self)
 
 class Library():
     def __init__(self, name, database, parentLibrary = None):
@@ -97,6 +139,7 @@ class Library():
         self._libraryNames = {}
         self._parentLibrary = parentLibrary
         self._name = name
+        self._path = None
         self._database = database
         if parentLibrary:
             parentLibrary.libraryAdded(self)
@@ -112,11 +155,13 @@ class Library():
     def cellAdded(self, cell):
         self._cells.add(cell)
         self._cellNames[cell.name()] = cell
+        self.database().cellIndexed(cell)
         self.database().libraryChanged(self)
 
     def cellRemoved(self, cell):
         self._cells.remove(cell)
         del self._cellNames[cell.name()]
+        self.database().cellUnindexed(cell)
         self.database().libraryChanged(self)
         
     def cellChanged(self, cell):
@@ -125,11 +170,13 @@ class Library():
     def libraryAdded(self, library):
         self._libraries.add(library)
         self._libraryNames[library.name()] = library
+        self.database().libraryIndexed(library)
         self.database().libraryChanged(self)
 
     def libraryRemoved(self, library):
         self._libraries.remove(library)
         del self._libraryNames[library.name()]
+        self.database().libraryUnindexed(library)
         self.database().libraryChanged(self)
         
     def libraryChanged(self, library):
@@ -142,23 +189,26 @@ class Library():
         return self._libraryNames.keys()
 
     def libraryByPath(self, libraryPath):
-        (first, sep, rest) = libraryPath.partition('/')
-        if first == '..':
-            return self.parentLibrary().libraryByPath(rest)
-        elif first == '.':
-            return self.libraryByPath(rest)
-        elif first == '':
-            return self.database().libraryByPath(rest)
-        elif self._libraryNames.has_key(first):
-            if rest == '':
-                return self._libraryNames[first]
-            else:
-                return self._libraryNames[first].libraryByPath(rest)
-        else:
+        "library at a path relative to this one, e.g. '../sym/analog'"
+        if libraryPath == '':
             return None
+        path = Library.concatenateLibraryPaths(self.path(), libraryPath)
+        return self.database().libraryByPath(path)
 
     @classmethod
     def concatenateLibraryPaths(cls, libPath1, libPath2):
+        "libPath2 relative to libPath1, the results are interned and cached"
+        key = (libPath1, libPath2)
+        if _concatenatedPaths.has_key(key):
+            return _concatenatedPaths[key]
+        path = internPath(cls._concatenateLibraryPaths(libPath1, libPath2))
+        if len(_concatenatedPaths) > _pathCacheSize:
+            _concatenatedPaths.clear()
+        _concatenatedPaths[key] = path
+        return path
+
+    @classmethod
+    def _concatenateLibraryPaths(cls, libPath1, libPath2):
         (beginning1, sep, last1) = libPath1.rpartition('/')
         (first2, sep, rest2) = libPath2.partition('/') 
         if libPath2.find('/') == 0: #is absolute
@@ -166,9 +216,9 @@ class Library():
         elif len(libPath2) == 0:
             return libPath1
         elif first2 == '.':
-            return Library.concatenateLibraryPaths(libPath1, rest2)
+            return Library._concatenateLibraryPaths(libPath1, rest2)
         elif first2 == '..' and beginning1 != '':
-            return Library.concatenateLibraryPaths(beginning1, rest2)
+            return Library._concatenateLibraryPaths(beginning1, rest2)
         elif first2 == '..':
             return '/' + libPath2
         else:
@@ -191,10 +241,13 @@ class Library():
         return self._name
 
     def path(self):
-        if self.parentLibrary():
-            return self.parentLibrary().path() + '/' + self.name()
-        else:
-            return '/' + self.name()
+        if self._path is None: # libraries are never moved or renamed
+            if self.parentLibrary():
+                path = self.parentLibrary().path() + '/' + self.name()
+            else:
+                path = '/' + self.name()
+            self._path = internPath(path)
+        return self._path
 
     def database(self):
         if not self._database:
@@ -224,6 +277,14 @@ class Database():
         self._databaseViews = set()
         self._layers = None
         self._designs = Designs()
+        self._updateLevel = 0
+        self._pendingPreparation = False
+        self._pendingUpdate = False
+        self._cellIndex = {}        # cell name -> libraries
+        self._cellViewIndex = {}    # (cell name, cell view name) -> libraries
+        self._libraryPaths = {}     # normalized library path -> library
+        self._resolved = {}         # (library path, cell name, cell view name) -> cell view or None
+        self._resolvedPaths = {}    # (cell name, cell view name) -> resolved library paths
 
     def installUpdateDatabaseViewsHook(self, view):
         self._databaseViews.add(view)
@@ -233,32 +294,70 @@ class Database():
         Some views may require notification before layout
         of the database changes
         """
+        if self._updateLevel > 0:
+            self._pendingPreparation = True
+            return
         for v in self._databaseViews:
             v.prepareForUpdate()
         
     def updateDatabaseViews(self):
         "Notify views that the database layout has changed"
+        if self._updateLevel > 0:
+            self._pendingUpdate = True
+            return
         for v in self._databaseViews:
             v.update()
 
-    def updateDatabaseViewsPreparation(self):
+    def beginUpdate(self):
         """
-        Some views may require notification before layout
-        of the design hierarchy changes
+        Start a bulk update: database and hierarchy view notifications
+        are held back and sent once by the matching endUpdate.
+        Bulk updates may be nested.
         """
-        for v in self._databaseViews:
-            v.prepareForUpdate()
+        self._updateLevel += 1
+        self._designs.beginUpdate()
+
+    def endUpdate(self):
+        self._updateLevel -= 1
+        if self._updateLevel == 0:
+            preparation = self._pendingPreparation
+            update = self._pendingUpdate
+            self._pendingPreparation = False
+            self._pendingUpdate = False
+            if preparation:
+                self.updateDatabaseViewsPreparation()
+            if update:
+                self.updateDatabaseViews()
+        self._designs.endUpdate()
+
+    @contextlib.contextmanager
+    def bulkUpdate(self):
+        "beginUpdate/endUpdate pair for use in a with statement"
+        self.beginUpdate()
+        try:
+            yield self
+        finally:
+            self.endUpdate()
         
     def libraryAdded(self, library):
         self._libraries.add(library)
         #library.setDatabase(self)
         self._libraryNames[library.name()] = library
+        self.libraryIndexed(library)
         self.updateDatabaseViews()
 
     def libraryRemoved(self, library):
         self._libraries.remove(library)
         del self._libraryNames[library.name()]
+        self.libraryUnindexed(library)
         self.updateDatabaseViews()
+
+    def libraryIndexed(self, library):
+        self._libraryPaths[library.path()] = library
+
+    def libraryUnindexed(self, library):
+        if self._libraryPaths.get(library.path()) is library:
+            del self._libraryPaths[library.path()]
         
     def libraryChanged(self, library):
         self.updateDatabaseViews()
@@ -288,18 +387,104 @@ class Database():
         return self.makeLibraryFromPath(rest, lib)
         
     def libraryByPath(self, libraryPath):
-        if libraryPath == '':
+        "library at a path from the root, resolved through the path index"
+        path = normalizeLibraryPath(libraryPath)
+        if path is None:
             return None
-        (first, sep, rest) = libraryPath.partition('/')
-        if first == '' or first == '.':
-            return self.libraryByPath(rest)
-        elif self._libraryNames.has_key(first):
-            if rest == '':
-                return self._libraryNames[first]
-            else:
-                return self._libraryNames[first].libraryByPath(rest)
-        else:
+        return self._libraryPaths.get(path)
+
+    def cellIndexed(self, cell):
+        libs = self._cellIndex.setdefault(cell.name(), set())
+        libs.add(cell.library())
+
+    def cellUnindexed(self, cell):
+        for cellView in cell.cellViews():
+            self.cellViewUnindexed(cellView)
+        libs = self._cellIndex.get(cell.name())
+        if libs:
+            libs.discard(cell.library())
+            if len(libs) == 0:
+                del self._cellIndex[cell.name()]
+
+    def cellViewIndexed(self, cellView):
+        key = (cellView.cell().name(), cellView.name())
+        libs = self._cellViewIndex.setdefault(key, set())
+        libs.add(cellView.library())
+        self.unresolve(key)
+
+    def cellViewUnindexed(self, cellView):
+        key = (cellView.cell().name(), cellView.name())
+        libs = self._cellViewIndex.get(key)
+        if libs:
+            libs.discard(cellView.library())
+            if len(libs) == 0:
+                del self._cellViewIndex[key]
+        self.unresolve(key)
+
+    def resolveCellView(self, libraryPath, cellName, cellViewName):
+        """
+        cellViewByName through the resolution table, misses are kept
+        too until a cell view of that name is added or removed.
+        """
+        key = (libraryPath, cellName, cellViewName)
+        if self._resolved.has_key(key):
+            return self._resolved[key]
+        cellView = self.cellViewByName(libraryPath, cellName, cellViewName)
+        self._resolved[key] = cellView
+        self._resolvedPaths.setdefault((cellName, cellViewName), set()).add(libraryPath)
+        return cellView
+
+    def unresolve(self, (cellName, cellViewName)):
+        "drop the resolved entries of a cell view name"
+        paths = self._resolvedPaths.pop((cellName, cellViewName), ())
+        for path in paths:
+            del self._resolved[(path, cellName, cellViewName)]
+
+    def librariesByCellName(self, cellName, cellViewName=None):
+        "libraries holding a cell (or its cell view) of the given name"
+        if cellViewName is None:
+            return self._cellIndex.get(cellName, set())
+        return self._cellViewIndex.get((cellName, cellViewName), set())
+
+    def nearestLibrary(self, cellName, cellViewName, library, checkAbove=True):
+        """
+        Find the library holding the cell view that is nearest to library:
+        library itself or its sub-libraries first, then the sub-libraries
+        of its parent and further ancestors and finally all libraries.
+        Only the branches leading to a library with the cell view
+        are descended, in the same order as a full search would.
+        """
+        candidates = self.librariesByCellName(cellName, cellViewName)
+        if len(candidates) == 0:
             return None
+        if library in candidates:
+            return library
+        ancestry = set()  # candidates and all their parent libraries
+        for lib in candidates:
+            while lib and not lib in ancestry:
+                ancestry.add(lib)
+                lib = lib.parentLibrary()
+        lib = library
+        while lib:
+            if lib in ancestry:
+                return self._nearestInLibrary(lib, candidates, ancestry)
+            if not checkAbove:
+                return None
+            lib = lib.parentLibrary()
+        return self._nearestInLibraries(self.libraries(), candidates, ancestry)
+
+    def _nearestInLibrary(self, library, candidates, ancestry):
+        if library in candidates:
+            return library
+        return self._nearestInLibraries(library.libraries(), candidates, ancestry)
+
+    def _nearestInLibraries(self, libraries, candidates, ancestry):
+        for lib in libraries:
+            if lib in ancestry:
+                found = self._nearestInLibrary(lib, candidates, ancestry)
+                if found:
+                    return found
+        return None
 
     def cellByName(self, libraryPath, cellName):
         lib = self.libraryByPath(libraryPath)
@@ -309,6 +494,8 @@ class Database():
             return None
 
     def cellViewByName(self, libraryPath, cellName, cellViewName):
+        if not self._cellViewIndex.has_key((cellName, cellViewName)):
+            return None
         lib = self.libraryByPath(libraryPath)
         if lib:
             return lib.cellViewByName(cellName, cellViewName)
@@ -22,15 +22,25 @@
 #from Database.Primitives import *
 #from Database.Cells import *
 #from Database.Attributes import *
+import weakref
 from xml.etree import ElementTree as et
 
 #print 'Design out'
 
 class DesignUnit():
+    """
+    A node of the occurrence tree: the occurrence of an instance below
+    its parent design unit. Nodes are created on demand, one per
+    (parent, instance), and the parent only keeps weak references to
+    them, so a subtree lives as long as a scene or a hierarchy view
+    holds one of its nodes. Children keep their parents alive.
+    """
     def __init__(self, instance, parentDesignUnit):
         self._instance = instance
         self._parentDesignUnit = parentDesignUnit
-        self._childDesignUnits = {} #set()
+        self._childDesignUnits = None # instance -> child, weak references
+        self._childInstances = None   # None until expanded
+        self._childRows = None        # instance -> row
         self._design = parentDesignUnit.design()
         self._scene = None
         parentDesignUnit.childDesignUnitAdded(self)
@@ -39,28 +49,80 @@ class DesignUnit():
         self._scene = scene
         self.cellView().designUnitAdded(self)
 
+    def childInstances(self):
+        """
+        Instances of the child design units in row order, looked up
+        once, even if there are none, until childrenChanged()
+        """
+        if self._childInstances is None:
+            instances = []
+            schematic = self.schematic()
+            if schematic:
+                instances = sorted(schematic.instances(),
+                                   key=lambda i: (i.name(), i.x(), i.y()))
+            self._childInstances = instances
+            self._childRows = dict((i, n) for (n, i) in enumerate(instances))
+        return self._childInstances
+
+    def schematic(self):
+        "the schematic the child design units come from or None"
+        cellView = self.cellView()
+        return cellView and cellView.cell().cellViewByName("schematic")
+
+    def childrenChanged(self):
+        "instances were added to or removed from the schematic"
+        self._childInstances = None
+        self._childRows = None
+
+    def isExpanded(self):
+        return self._childInstances is not None
+
+    def childCount(self):
+        return len(self.childInstances())
+
+    def childDesignUnit(self, instance):
+        "the child design unit of an instance, created if it is not alive"
+        if self._childDesignUnits is not None:
+            designUnit = self._childDesignUnits.get(instance)
+            if designUnit is not None:
+                return designUnit
+        return DesignUnit(instance, self)
+
+    def childDesignUnitAt(self, row):
+        instances = self.childInstances()
+        if 0 <= row < len(instances):
+            return self.childDesignUnit(instances[row])
+        return None
+
+    def childRow(self, designUnit):
+        self.childInstances()
+        return self._childRows.get(designUnit.instance(), -1)
+
+    def row(self):
+        "row of the design unit below its parent"
+        return self.parentDesignUnit().childRow(self)
+
     def childDesignUnits(self):
         """
-        Get a dictionary of child design units (instance->designUnit)
-        The dictionary is computed lazily by this function
-        (so that it descends down the hierarchy only when the user wants to see it)
-        and is cached for future invocations.
+        Get a dictionary of all child design units (instance->designUnit),
+        they are alive as long as the dictionary or other holders are.
         """
-        if len(self._childDesignUnits) > 0:   #cache
-            return self._childDesignUnits
-        schematic = self.cellView().cell().cellViewByName("schematic")
-        
-        if schematic:
-            for i in schematic.instances():
-                DesignUnit(i, self) # it should add itself to parent design unit
-                #self._childDesignUnits[i] = DesignUnit(i, self)
-        return self._childDesignUnits
+        return dict((i, self.childDesignUnit(i)) for i in self.childInstances())
+
+    def aliveDesignUnits(self):
+        "child design units that exist already"
+        if self._childDesignUnits is None:
+            return []
+        return self._childDesignUnits.values()
 
     def childDesignUnitAdded(self, designUnit):
+        if self._childDesignUnits is None:
+            self._childDesignUnits = weakref.WeakValueDictionary()
         self._childDesignUnits[designUnit.instance()] = designUnit
         
     def childDesignUnitRemoved(self, designUnit):
-        del self._childDesignUnits[designUnit.instance()]
+        if self._childDesignUnits is not None:
+            self._childDesignUnits.pop(designUnit.instance(), None)
 
     def parentDesignUnit(self):
         return self._parentDesignUnit
@@ -82,31 +144,34 @@ class DesignUnit():
             self.scene().updateItem()
 
     def addInstance(self, instance):
-        #designUnit = self._childDesignUnits.get(instance)
-        #if not designUnit:
-        designUnit = DesignUnit(instance, self)
-        self._childDesignUnits[instance] = designUnit
-        self.scene().addInstance(designUnit)
+        self.childrenChanged()
+        designUnit = self.childDesignUnit(instance)
+        if self.scene():
+            self.scene().addInstance(designUnit)
     
     def removeInstance(self, instance):
-        designUnit = self._childDesignUnits.get(instance)
+        self.childrenChanged()
+        designUnit = self._childDesignUnits and self._childDesignUnits.get(instance)
         if designUnit:
-            self.scene().removeInstance(designUnit)
-            del self._childDesignUnits[instance]
+            if self.scene():
+                self.scene().removeInstance(designUnit)
+            self.childDesignUnitRemoved(designUnit)
             
     def remove(self):
-        for co in self.childDesignUnits().values():
+        for co in self.aliveDesignUnits():
             co.remove()
         if self.scene():
             self.scene().instanceRemoved()
-            self.cellView().DesignUnitRemoved(self)
+            self.cellView().designUnitRemoved(self)
         self.parentDesignUnit().childDesignUnitRemoved(self)
         
 class Design(DesignUnit):
     def __init__(self, cellView, designs):
         self._cellView = cellView
         self._designs = designs
-        self._childDesignUnits = {}
+        self._childDesignUnits = None
+        self._childInstances = None
+        self._childRows = None
         self._scene = None
         designs.designAdded(self)
             
@@ -130,12 +195,15 @@ class Design(DesignUnit):
 
     def parentDesignUnit(self):
         return None
+
+    def row(self):
+        return -1
     
     def designs(self):
         return self._designs
         
     def remove(self):
-        for co in self.childDesignUnits().values():
+        for co in self.aliveDesignUnits():
             co.remove()
         if self.scene():
             self.scene().designRemoved()
@@ -146,15 +214,54 @@ class Designs(set):
     def __init__(self):
         #self._designs = set()
         self._hierarchyViews = set()
+        self._updateLevel = 0
+        self._pendingUpdate = False
+        self._changedSchematics = set()
        
     def installUpdateHierarchyViewsHook(self, view):
         self._hierarchyViews.add(view)
 
     def updateHierarchyViews(self):
         "Notify views that the design hierarchy layout has changed"
+        if self._updateLevel > 0:
+            self._pendingUpdate = True
+            return
         for v in self._hierarchyViews:
             v.update()
 
+    def beginUpdate(self):
+        "hold back hierarchy view notifications until endUpdate"
+        self._updateLevel += 1
+
+    def endUpdate(self):
+        self._updateLevel -= 1
+        if self._updateLevel == 0 and self._pendingUpdate:
+            self._pendingUpdate = False
+            schematics = self._changedSchematics
+            self._changedSchematics = set()
+            self.childrenChanged(schematics)
+            self.updateHierarchyViews()
+
+    def instancesChanged(self, schematic):
+        "instances were added to or removed from a schematic"
+        if self._updateLevel > 0:
+            self._changedSchematics.add(schematic)
+            self._pendingUpdate = True
+            return
+        self.childrenChanged(set([schematic]))
+        self.updateHierarchyViews()
+
+    def childrenChanged(self, schematics):
+        "let the expanded design units of the schematics look up their children again"
+        if not schematics:
+            return
+        designUnits = list(self)
+        while designUnits:
+            d = designUnits.pop()
+            if d.isExpanded() and d.schematic() in schematics:
+                d.childrenChanged()
+            designUnits.extend(d.aliveDesignUnits())
+
     def designAdded(self, design):
         #self._designs.add(design)
         self.add(design)
@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import array
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def rotation(angle):
+    "cosine and sine of angle degrees, exact for multiples of 90"
+    angle = angle % 360
+    if angle % 90 == 0:
+        return [(1, 0), (0, 1), (-1, 0), (0, -1)][angle / 90]
+    return (math.cos(math.radians(angle)), math.sin(math.radians(angle)))
+
+def transformPoint(x, y, angle=0, mirror=False, dx=0, dy=0):
+    """
+    x, y mirrored about the y axis, then rotated counterclockwise by
+    angle degrees and translated, the way a symbol is placed by an instance
+    """
+    (c, s) = rotation(angle)
+    if mirror:
+        x = -x
+    tx = c * x - s * y + dx
+    ty = s * x + c * y + dy
+    if isinstance(tx, float):
+        return (int(round(tx)), int(round(ty)))
+    return (tx, ty)
+
+def transformBox(box, angle=0, mirror=False, dx=0, dy=0):
+    "bounding box of a transformed box (x1, y1, x2, y2)"
+    points = [transformPoint(x, y, angle, mirror, dx, dy)
+              for x in (box[0], box[2]) for y in (box[1], box[3])]
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def uniteBoxes(boxes):
+    "bounding box of boxes, None if there are none"
+    boxes = list(boxes)
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+class AxisPoints():
+    """
+    Points bucketed by x and by y, for finding the ones lying
+    strictly inside horizontal and vertical segments
+    """
+    def __init__(self, points):
+        byX = {}
+        byY = {}
+        for (x, y) in points:
+            byX.setdefault(x, set()).add(y)
+            byY.setdefault(y, set()).add(x)
+        self._byX = dict((x, sorted(ys)) for (x, ys) in byX.iteritems())
+        self._byY = dict((y, sorted(xs)) for (y, xs) in byY.iteritems())
+
+    def inside(self, x1, y1, x2, y2):
+        "points strictly inside the segment, in ascending order"
+        if x1 == x2 and y1 != y2:
+            ys = self._byX.get(x1)
+            if not ys:
+                return []
+            i = bisect.bisect_right(ys, min(y1, y2))
+            j = bisect.bisect_left(ys, max(y1, y2))
+            return [(x1, y) for y in ys[i:j]]
+        if y1 == y2 and x1 != x2:
+            xs = self._byY.get(y1)
+            if not xs:
+                return []
+            i = bisect.bisect_right(xs, min(x1, x2))
+            j = bisect.bisect_left(xs, max(x1, x2))
+            return [(x, y1) for x in xs[i:j]]
+        return []
+
+
+class SegmentColumns():
+    """
+    Integer x1, y1, x2, y2 columns of two-point elements (lines, net
+    segments, pins) next to the list of the elements themselves.
+    The columns are NumPy arrays when NumPy is available and packed
+    array.array columns otherwise. A removed row is filled with the
+    last one, so rows are not stable across removals.
+    """
+    def __init__(self, useNumpy=True):
+        self._numpy = useNumpy and numpy is not None
+        self._elems = []
+        self._rows = {}
+        if self._numpy:
+            self._coords = numpy.zeros((4, 16), dtype=numpy.int64)
+        else:
+            self._coords = [array.array('l') for i in range(4)]
+
+    def __len__(self):
+        return len(self._elems)
+
+    def __contains__(self, elem):
+        return elem in self._rows
+
+    def usesNumpy(self):
+        return self._numpy
+
+    def elements(self):
+        "elements in row order"
+        return tuple(self._elems)
+
+    def arrays(self):
+        "read-only x1, y1, x2, y2 columns in row order"
+        n = len(self._elems)
+        if self._numpy:
+            coords = self._coords[:, :n]
+            coords.flags.writeable = False
+            return tuple(coords)
+        return tuple(tuple(c) for c in self._coords)
+
+    def add(self, elem):
+        if elem in self._rows:
+            self.update(elem)
+            return
+        row = len(self._elems)
+        self._rows[elem] = row
+        self._elems.append(elem)
+        values = (elem.x1(), elem.y1(), elem.x2(), elem.y2())
+        if self._numpy:
+            if row == self._coords.shape[1]:
+                self._coords = numpy.concatenate(
+                    (self._coords, numpy.zeros_like(self._coords)), axis=1)
+            self._coords[:, row] = values
+        else:
+            for (c, v) in zip(self._coords, values):
+                c.append(v)
+
+    def remove(self, elem):
+        row = self._rows.pop(elem, None)
+        if row is None:
+            return
+        last = len(self._elems) - 1
+        lastElem = self._elems.pop()
+        if row != last:
+            self._elems[row] = lastElem
+            self._rows[lastElem] = row
+        if self._numpy:
+            self._coords[:, row] = self._coords[:, last]
+        else:
+            for c in self._coords:
+                c[row] = c[last]
+                c.pop()
+
+    def update(self, elem):
+        "take over the coordinates of a moved element"
+        row = self._rows.get(elem)
+        if row is None:
+            return
+        values = (elem.x1(), elem.y1(), elem.x2(), elem.y2())
+        if self._numpy:
+            self._coords[:, row] = values
+        else:
+            for (c, v) in zip(self._coords, values):
+                c[row] = v
+
+    def _select(self, test):
+        "elements whose coordinates pass test(x1, y1, x2, y2)"
+        n = len(self._elems)
+        if self._numpy:
+            (x1, y1, x2, y2) = self._coords[:, :n]
+            mask = test(x1, y1, x2, y2)
+            return [self._elems[i] for i in numpy.flatnonzero(mask)]
+        (cx1, cy1, cx2, cy2) = self._coords
+        return [self._elems[i] for i in xrange(n)
+                if test(cx1[i], cy1[i], cx2[i], cy2[i])]
+
+    def _all(self, *conditions):
+        if self._numpy:
+            return reduce(numpy.logical_and, conditions)
+        for c in conditions:
+            if not c:
+                return False
+        return True
+
+    def _min(self, a, b):
+        if self._numpy:
+            return numpy.minimum(a, b)
+        return min(a, b)
+
+    def _max(self, a, b):
+        if self._numpy:
+            return numpy.maximum(a, b)
+        return max(a, b)
+
+    def atEndpoint(self, x, y):
+        "elements with an end point at x, y"
+        if self._numpy:
+            return self._select(lambda x1, y1, x2, y2:
+                ((x1 == x) & (y1 == y)) | ((x2 == x) & (y2 == y)))
+        return self._select(lambda x1, y1, x2, y2:
+            (x1 == x and y1 == y) or (x2 == x and y2 == y))
+
+    def touching(self, x, y):
+        "elements passing through x, y, end points included"
+        return self._select(lambda x1, y1, x2, y2: self._all(
+            (x2 - x1) * (y - y1) == (y2 - y1) * (x - x1),
+            self._min(x1, x2) <= x, x <= self._max(x1, x2),
+            self._min(y1, y2) <= y, y <= self._max(y1, y2)))
+
+    def inside(self, left, bottom, right, top):
+        "elements with both end points inside the rectangle, border included"
+        (left, right) = (min(left, right), max(left, right))
+        (bottom, top) = (min(bottom, top), max(bottom, top))
+        return self._select(lambda x1, y1, x2, y2: self._all(
+            left <= x1, x1 <= right, left <= x2, x2 <= right,
+            bottom <= y1, y1 <= top, bottom <= y2, y2 <= top))
+
+    def collinear(self, x1, y1, x2, y2):
+        """
+        elements lying on the line through x1, y1 and x2, y2, for a
+        zero length segment the ones touching its point
+        """
+        dx = x2 - x1
+        dy = y2 - y1
+        if dx == 0 and dy == 0:
+            return self.touching(x1, y1)
+        return self._select(lambda ex1, ey1, ex2, ey2: self._all(
+            dx * (ey1 - y1) == dy * (ex1 - x1),
+            dx * (ey2 - y1) == dy * (ex2 - x1)))
+
+    def transformed(self, angle=0, mirror=False, dx=0, dy=0):
+        """
+        New x1, y1, x2, y2 columns of all rows mirrored about the y axis,
+        then rotated counterclockwise by angle degrees and translated,
+        the way a symbol is placed by an instance
+        """
+        n = len(self._elems)
+        if self._numpy:
+            (c, s) = rotation(angle)
+            m = -1 if mirror else 1
+            (x1, y1, x2, y2) = self._coords[:, :n]
+            def point(x, y):
+                tx = c * m * x - s * y + dx
+                ty = s * m * x + c * y + dy
+                if tx.dtype != numpy.int64:
+                    tx = numpy.rint(tx).astype(numpy.int64)
+                    ty = numpy.rint(ty).astype(numpy.int64)
+                return (tx, ty)
+            return point(x1, y1) + point(x2, y2)
+        columns = ([], [], [], [])
+        for (x1, y1, x2, y2) in zip(*self._coords):
+            row = (transformPoint(x1, y1, angle, mirror, dx, dy) +
+                   transformPoint(x2, y2, angle, mirror, dx, dy))
+            for (column, v) in zip(columns, row):
+                column.append(v)
+        return tuple(array.array('l', column) for column in columns)
+
+
+class DiagramGeometry():
+    """
+    Columnar copy of the two-point elements of a diagram, kept up to
+    date by the diagram once it has been created by Diagram.geometry().
+    Elements are sorted into columns by Element.addToGeometry.
+    """
+    def __init__(self, useNumpy=True):
+        self._lines = SegmentColumns(useNumpy)
+        self._netSegments = SegmentColumns(useNumpy)
+        self._pins = SegmentColumns(useNumpy)
+        self._symbolPins = SegmentColumns(useNumpy)
+        self._columns = [self._lines, self._netSegments,
+                         self._pins, self._symbolPins]
+
+    def add(self, elem):
+        elem.addToGeometry(self)
+
+    def remove(self, elem):
+        for c in self._columns:
+            c.remove(elem)
+
+    def update(self, elem):
+        for c in self._columns:
+            c.update(elem)
+
+    def lineAdded(self, line):
+        self._lines.add(line)
+
+    def netSegmentAdded(self, netSegment):
+        self._netSegments.add(netSegment)
+
+    def pinAdded(self, pin):
+        self._pins.add(pin)
+
+    def symbolPinAdded(self, symbolPin):
+        self._symbolPins.add(symbolPin)
+
+    def lines(self):
+        return self._lines
+
+    def netSegments(self):
+        return self._netSegments
+
+    def pins(self):
+        return self._pins
+
+    def symbolPins(self):
+        return self._symbolPins
+
+
+class SpatialIndex():
+    """
+    Uniform grid over the bounding boxes (x1, y1, x2, y2, in database
+    units) of the elements of a diagram, with one grid per element
+    kind. Elements spanning more than maxCells grid cells, like sheet
+    frames, are kept in a plain per-kind list instead.
+    Queries take the element kinds to look at, all kinds by default.
+    """
+    def __init__(self, cellSize=1000, maxCells=64):
+        self._cellSize = cellSize
+        self._maxCells = maxCells
+        self._grids = {}    # kind -> {(i, j): set of elements}
+        self._large = {}    # kind -> set of elements
+        self._entries = {}  # element -> (kind, box, cells or None)
+        self._extent = None # (i1, j1, i2, j2) of all cells ever used
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, elem):
+        return elem in self._entries
+
+    def cellSize(self):
+        return self._cellSize
+
+    def kinds(self):
+        return sorted(set(self._grids.keys()) | set(self._large.keys()))
+
+    def boundingBox(self, elem):
+        "the box the element is indexed with"
+        return self._entries[elem][1]
+
+    def _cellRange(self, box):
+        s = float(self._cellSize)
+        return (int(math.floor(box[0] / s)), int(math.floor(box[1] / s)),
+                int(math.floor(box[2] / s)), int(math.floor(box[3] / s)))
+
+    def add(self, kind, elem):
+        if elem in self._entries:
+            self.remove(elem)
+        box = elem.boundingBox()
+        (i1, j1, i2, j2) = self._cellRange(box)
+        if (i2 - i1 + 1) * (j2 - j1 + 1) > self._maxCells:
+            cells = None
+            self._large.setdefault(kind, set()).add(elem)
+        else:
+            cells = [(i, j) for i in range(i1, i2 + 1) for j in range(j1, j2 + 1)]
+            grid = self._grids.setdefault(kind, {})
+            for c in cells:
+                grid.setdefault(c, set()).add(elem)
+            if self._extent is None:
+                self._extent = (i1, j1, i2, j2)
+            else:
+                e = self._extent
+                self._extent = (min(e[0], i1), min(e[1], j1),
+                                max(e[2], i2), max(e[3], j2))
+        self._entries[elem] = (kind, box, cells)
+
+    def remove(self, elem):
+        entry = self._entries.pop(elem, None)
+        if not entry:
+            return
+        (kind, box, cells) = entry
+        if cells is None:
+            self._large[kind].discard(elem)
+            return
+        grid = self._grids[kind]
+        for c in cells:
+            elems = grid[c]
+            elems.discard(elem)
+            if not elems:
+                del grid[c]
+
+    def update(self, elem):
+        "reindex a moved or reshaped element"
+        entry = self._entries.get(elem)
+        if entry:
+            self.add(entry[0], elem)
+
+    def _kinds(self, kinds):
+        if kinds is None:
+            return self.kinds()
+        if isinstance(kinds, basestring):
+            return [kinds]
+        return kinds
+
+    def _candidates(self, box, kinds):
+        "elements in the grid cells overlapping box and the large ones"
+        found = set()
+        (i1, j1, i2, j2) = self._cellRange(box)
+        for kind in self._kinds(kinds):
+            found.update(self._large.get(kind, ()))
+            grid = self._grids.get(kind)
+            if not grid:
+                continue
+            if (i2 - i1 + 1) * (j2 - j1 + 1) > len(grid):
+                for (c, elems) in grid.iteritems():
+                    if i1 <= c[0] <= i2 and j1 <= c[1] <= j2:
+                        found.update(elems)
+            else:
+                for i in range(i1, i2 + 1):
+                    for j in range(j1, j2 + 1):
+                        elems = grid.get((i, j))
+                        if elems:
+                            found.update(elems)
+        return found
+
+    def at(self, x, y, kinds=None, tolerance=0):
+        "elements whose bounding box contains x, y within tolerance"
+        box = (x - tolerance, y - tolerance, x + tolerance, y + tolerance)
+        return self.inRect(box[0], box[1], box[2], box[3], kinds)
+
+    def inRect(self, x1, y1, x2, y2, kinds=None, inside=False):
+        """
+        elements whose bounding box intersects the rectangle,
+        or lies inside it with inside set, borders included
+        """
+        box = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        result = []
+        for elem in self._candidates(box, kinds):
+            b = self._entries[elem][1]
+            if inside:
+                if (box[0] <= b[0] and b[2] <= box[2] and
+                    box[1] <= b[1] and b[3] <= box[3]):
+                    result.append(elem)
+            elif (b[0] <= box[2] and box[0] <= b[2] and
+                  b[1] <= box[3] and box[1] <= b[3]):
+                result.append(elem)
+        return result
+
+    def distance(self, elem, x, y):
+        """
+        distance of x, y from the element: from the segment of
+        two-point elements (lines, net segments, pins), from the
+        bounding box of the others
+        """
+        if hasattr(elem, 'x2'):
+            return segmentDistance(x, y, elem.x1(), elem.y1(), elem.x2(), elem.y2())
+        b = self._entries[elem][1]
+        dx = max(b[0] - x, 0, x - b[2])
+        dy = max(b[1] - y, 0, y - b[3])
+        return math.hypot(dx, dy)
+
+    def nearest(self, x, y, kinds=None, n=1, maxDistance=None):
+        """
+        up to n (distance, element) pairs nearest to x, y, closest first,
+        searching rings of grid cells around x, y
+        """
+        kinds = self._kinds(kinds)
+        best = {}
+        for kind in kinds:
+            for elem in self._large.get(kind, ()):
+                best[elem] = self.distance(elem, x, y)
+        (ci, cj, ci2, cj2) = self._cellRange((x, y, x, y))
+        extent = self._extent
+        r = 0
+        while extent:
+            reach = max(abs(ci - extent[0]), abs(ci - extent[2]),
+                        abs(cj - extent[1]), abs(cj - extent[3]))
+            if r > reach:
+                break
+            ring = [(i, cj - r) for i in range(ci - r, ci + r + 1)]
+            if r > 0:
+                ring += [(i, cj + r) for i in range(ci - r, ci + r + 1)]
+                ring += [(ci - r, j) for j in range(cj - r + 1, cj + r)]
+                ring += [(ci + r, j) for j in range(cj - r + 1, cj + r)]
+            for kind in kinds:
+                grid = self._grids.get(kind)
+                if not grid:
+                    continue
+                for c in ring:
+                    for elem in grid.get(c, ()):
+                        if not elem in best:
+                            best[elem] = self.distance(elem, x, y)
+            # anything not seen yet is at least r cells away
+            bound = r * self._cellSize
+            if maxDistance is not None and bound > maxDistance:
+                break
+            if len(best) >= n:
+                if sorted(best.values())[n - 1] <= bound:
+                    break
+            r += 1
+        pairs = sorted((d, e) for (e, d) in best.iteritems()
+                       if maxDistance is None or d <= maxDistance)
+        return pairs[:n]
+
+
+def segmentDistance(x, y, x1, y1, x2, y2):
+    "distance of x, y from the segment x1, y1 - x2, y2"
+    dx = x2 - x1
+    dy = y2 - y1
+    length = dx * dx + dy * dy
+    if length == 0:
+        return math.hypot(x - x1, y - y1)
+    t = max(0.0, min(1.0, float((x - x1) * dx + (y - y1) * dy) / length))
+    return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
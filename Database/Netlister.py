@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+# Headless use, e.g.:
+#   python -m Database.Netlister -y /sym=../sym -s /sch=../sch \
+#       -o top.cir /sch top
+
+import re
+import sys
+import optparse
+from collections import deque
+
+from Database.Primitives import *
+from Database.CellViews import *
+from Database.Cells import *
+from Database.Design import Design
+from Database.Nets import pinNumber
+
+
+def numberKey(number):
+    "pin numbers in numeric order, non numeric ones after them"
+    if number is None:
+        return (2, '')
+    if number.isdigit():
+        return (0, int(number))
+    return (1, number)
+
+
+class SpiceNetlister():
+    """
+    Writes a hierarchical SPICE netlist of a design to a stream while
+    walking it. Every cell with a schematic below the top one becomes
+    a single .subckt, however many times it is instantiated, the
+    subcircuits are written after the top level as they are reached.
+
+    An instance is a subcircuit when the schematic named by its source
+    attribute or the schematic of its symbol's cell exists, otherwise
+    it is a device. A device line is the spice attribute of the
+    instance or of its symbol, in which @name is replaced by the value
+    of an attribute, %n by the node of pin number n and %pins by all
+    nodes in pin order; without one it is "@refdes %pins @value".
+    Instances without a refdes, e.g. power symbols, only name nets.
+    Pin order follows the pinseq attributes, then the pin numbers.
+    """
+    ground = frozenset(['GND', 'gnd', '0'])
+    pattr = re.compile(r'@([\w\-]+)|%(pins|[\w\-]+)')
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._subcircuits = {}  # schematic -> subcircuit name
+        self._names = set()     # subcircuit names in use
+        self._pending = deque()
+        self._symbols = {}      # symbol -> (attributes, pins, ports)
+        self.subcircuits = 0
+        self.devices = 0
+        self.calls = 0
+        self.warnings = []
+
+    def write(self, line):
+        self._stream.write(line + '\n')
+
+    def warn(self, message):
+        self.warnings.append(message)
+        self.write('* warning: ' + message)
+
+    def netlistDesign(self, design):
+        self.netlist(design.cellView())
+
+    def netlist(self, schematic):
+        "write the whole netlist of a top level schematic"
+        cell = schematic.cell()
+        self._names.add(cell.name())
+        self._subcircuits[schematic] = cell.name()
+        self.write('* %s/%s' % (cell.library().path(), cell.name()))
+        self.writeBody(schematic)
+        while self._pending:
+            self.writeSubcircuit(self._pending.popleft())
+        self.write('.end')
+
+    def writeSubcircuit(self, (schematic, symbol)):
+        self.write('')
+        ports = [self.port(schematic, name) for (number, name) in self.symbolInfo(symbol)[2]]
+        self.write(' '.join(['.subckt', self._subcircuits[schematic]] + ports))
+        self.writeBody(schematic)
+        self.write('.ends %s' % self._subcircuits[schematic])
+        self.subcircuits += 1
+
+    def port(self, schematic, name):
+        """
+        node of a subcircuit port: the net of the schematic pin with the
+        port's name, or else the net named like the port
+        """
+        connectivity = schematic.connectivity()
+        for pin in connectivity.pins():
+            if pin.name() == name and pin.net():
+                return self.node(pin.net().name())
+        net = connectivity.netByName(name)
+        if net:
+            return self.node(net.name())
+        self.warn('port %s of %s is not connected' % (name, self._subcircuits[schematic]))
+        return self.node(name)
+
+    def writeBody(self, schematic):
+        connectivity = schematic.connectivity()
+        instances = [(self.attribute(i, 'refdes') or '', i.x(), i.y(), i)
+                     for i in schematic.instances()]
+        instances.sort(key=lambda (refdes, x, y, i): (refdes, x, y))
+        for (refdes, x, y, i) in instances:
+            if refdes:
+                self.writeInstance(connectivity, i, refdes)
+
+    def symbolInfo(self, symbol):
+        """
+        attribute -> value of the symbol, its pin numbers in pin order
+        and the (pin number, port name) list of its pins
+        """
+        if not symbol in self._symbols:
+            attributes = dict((a.key(), a.value()) for a in symbol.topAttributeLabels())
+            pins = []
+            for p in symbol.symbolPins():
+                number = pinNumber(p)
+                seq = p.attributeValue('pinseq')
+                order = (seq is None, numberKey(seq), numberKey(number))
+                pins.append((order, number, p.attributeValue('pinlabel', number)))
+            pins.sort()
+            for (i, (order, number, label)) in enumerate(pins):
+                if label is None:
+                    pins[i] = (order, number, 'p%d' % (i + 1))
+            self._symbols[symbol] = (attributes,
+                                     [number for (order, number, label) in pins],
+                                     [(number, label) for (order, number, label) in pins])
+        return self._symbols[symbol]
+
+    def attribute(self, instance, key):
+        value = instance.attributeValue(key)
+        if value is None:
+            symbol = instance.instanceCellView()
+            if symbol and hasattr(symbol, 'symbolPins'):
+                value = self.symbolInfo(symbol)[0].get(key)
+        return value
+
+    def node(self, name):
+        if name in self.ground:
+            return '0'
+        return name
+
+    def nodes(self, connectivity, instance, symbol):
+        """
+        pin number -> node, the nodes of the symbol pins in pin order
+        and the nodes of the pins only named by net attributes
+        """
+        byNumber = {}
+        hidden = []
+        for pin in connectivity.instancePins(instance):
+            byNumber[pin.name()] = self.node(pin.net().name())
+            if pin.symbolPin() is None:
+                hidden.append(pin.name())
+        ordered = [byNumber.get(number, '?') for number in self.symbolInfo(symbol)[1]]
+        hidden.sort(key=numberKey)
+        return (byNumber, ordered, [byNumber[number] for number in hidden])
+
+    def subcircuitOf(self, instance, symbol):
+        "the schematic implementing an instance or None"
+        source = self.attribute(instance, 'source')
+        if source:
+            name = source.split(',')[0].strip()
+            if name.endswith('.sch'):
+                name = name[:-4]
+            database = instance.database()
+            lib = database.nearestLibrary(name, 'schematic', instance.library())
+            if lib:
+                return lib.cellViewByName(name, 'schematic')
+            self.warn('source %s of %s not found' % (source, self.attribute(instance, 'refdes')))
+            return None
+        return symbol.cell().cellViewByName('schematic')
+
+    def subcircuitName(self, schematic, symbol):
+        if not schematic in self._subcircuits:
+            name = base = schematic.cell().name()
+            count = 1
+            while name in self._names:
+                count += 1
+                name = '%s_%d' % (base, count)
+            self._names.add(name)
+            self._subcircuits[schematic] = name
+            self._pending.append((schematic, symbol))
+        return self._subcircuits[schematic]
+
+    def writeInstance(self, connectivity, instance, refdes):
+        symbol = instance.instanceCellView()
+        if not symbol or not hasattr(symbol, 'symbolPins'):
+            self.warn('%s has no symbol' % refdes)
+            return
+        (byNumber, ordered, hidden) = self.nodes(connectivity, instance, symbol)
+        schematic = self.subcircuitOf(instance, symbol)
+        if schematic:
+            if not refdes[0] in 'xX':
+                refdes = 'X' + refdes
+            name = self.subcircuitName(schematic, symbol)
+            self.write(' '.join([refdes] + ordered + [name]))
+            self.calls += 1
+            return
+        ordered += hidden
+        template = self.attribute(instance, 'spice') or '@refdes %pins @value'
+        def replace(m):
+            if m.group(1):
+                if m.group(1) == 'refdes':
+                    return refdes
+                return self.attribute(instance, m.group(1)) or ''
+            if m.group(2) == 'pins':
+                return ' '.join(ordered)
+            return byNumber.get(m.group(2), '?')
+        self.write(' '.join(self.pattr.sub(replace, template).split()))
+        self.devices += 1
+
+
+def netlistToFile(design, fileName):
+    "write the netlist of a design or top level schematic, returns the netlister"
+    f = open(fileName, 'w')
+    try:
+        netlister = SpiceNetlister(f)
+        if isinstance(design, Design):
+            netlister.netlistDesign(design)
+        else:
+            netlister.netlist(design)
+    finally:
+        f.close()
+    return netlister
+
+def main(argv=None):
+    from Database.Reader import GedaImporter
+    from Database.Layers import Layers
+    parser = optparse.OptionParser(
+        usage='%prog [options] library cell')
+    parser.add_option('-y', '--symbols', action='append', default=[],
+                      help='symbol library as path=directory, may be repeated')
+    parser.add_option('-s', '--schematics', action='append', default=[],
+                      help='schematic library as path=directory, may be repeated')
+    parser.add_option('-o', '--output', help='netlist file (default: stdout)')
+    (opts, args) = parser.parse_args(argv)
+    if len(args) != 2:
+        parser.error('library and cell expected')
+    database = Database()
+    database.setLayers(Layers())
+    importer = GedaImporter(database, lazy=True)
+    stdout = sys.stdout
+    sys.stdout = sys.stderr # the importer reports on stdout
+    try:
+        importer.importLibraryList([l.split('=', 1) for l in opts.symbols],
+                                   [l.split('=', 1) for l in opts.schematics])
+    finally:
+        sys.stdout = stdout
+    schematic = database.cellViewByName(args[0], args[1], 'schematic')
+    if not schematic:
+        parser.error('no schematic %s/%s' % (args[0], args[1]))
+    design = Design(schematic, database.designs())
+    if opts.output:
+        netlister = netlistToFile(design, opts.output)
+    else:
+        netlister = SpiceNetlister(sys.stdout)
+        netlister.netlistDesign(design)
+    for w in netlister.warnings:
+        print >> sys.stderr, 'warning:', w
+
+if __name__ == "__main__":
+    main()
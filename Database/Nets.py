@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+from Database.Primitives import CNet, CPin, CInstancePin
+from Database.Geometry import AxisPoints, transformPoint
+
+
+class PointSets():
+    """
+    Disjoint sets (union-find) of connection points, (x, y) tuples,
+    and of net names, strings, with path halving and union by size
+    """
+    def __init__(self):
+        self._parent = {}
+        self._size = {}
+
+    def __contains__(self, key):
+        return key in self._parent
+
+    def add(self, key):
+        if not key in self._parent:
+            self._parent[key] = key
+            self._size[key] = 1
+
+    def find(self, key):
+        parent = self._parent
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(self, key1, key2):
+        self.add(key1)
+        self.add(key2)
+        root1 = self.find(key1)
+        root2 = self.find(key2)
+        if root1 == root2:
+            return root1
+        if self._size[root1] < self._size[root2]:
+            (root1, root2) = (root2, root1)
+        self._parent[root2] = root1
+        self._size[root1] += self._size.pop(root2)
+        return root1
+
+    def keys(self):
+        return self._parent.iterkeys()
+
+    def groups(self):
+        "root -> list of the keys in its set"
+        groups = {}
+        for key in self._parent:
+            groups.setdefault(self.find(key), []).append(key)
+        return groups
+
+
+def pinNumber(symbolPin):
+    return symbolPin.attributeValue('pinnumber', symbolPin.attributeValue('pinlabel'))
+
+def netAttributes(labels):
+    """
+    pin number -> net name of gEDA net attributes, e.g. net=GND:1,2
+    """
+    nets = {}
+    for a in labels:
+        if a.key() != 'net' or not ':' in a.value():
+            continue
+        (name, numbers) = a.value().split(':', 1)
+        for number in numbers.split(','):
+            if name.strip() and number.strip():
+                nets[number.strip()] = name.strip()
+    return nets
+
+def labelName(label):
+    "a single line label names the net it is placed on"
+    text = label.text().strip()
+    if text and not '\n' in text:
+        return text
+    return None
+
+
+class SchematicNets():
+    """
+    Nets of a schematic: the net segments joined at their end points
+    and at T-junctions, with the schematic pins and the symbol pins
+    of the instances ending on them. Nets with the same name are one.
+    Once built the nets follow the edits of the schematic: only the
+    nets an added, moved or removed element was or is now part of are
+    taken apart and joined again, the others keep their CNet objects.
+    Listeners installed with installUpdateHook are called with
+    netsUpdated(added, changed, removed) after every change.
+    """
+    def __init__(self, schematic):
+        self._schematic = schematic
+        self._nets = set()
+        self._netByName = {}
+        self._netByPoint = {}
+        self._segments = {}     # net segment -> (end point, end point, netname)
+        self._netBySegment = {}
+        self._pins = {}         # schematic pin -> CPin
+        self._instancePins = {} # instance -> [(CInstancePin, point or name, netname)]
+        self._labels = {}       # label -> (point, name)
+        self._netByLabel = {}   # label -> net, floating labels are left out
+        self._symbols = {}      # symbol -> (symbol pin, pin number) list
+        self._count = 0         # of the generated net names
+        self._listeners = set()
+        self.build()
+
+    def installUpdateHook(self, listener):
+        self._listeners.add(listener)
+
+    def removeUpdateHook(self, listener):
+        self._listeners.discard(listener)
+
+    def symbolPins(self, symbol):
+        if not symbol in self._symbols:
+            pins = [(p, pinNumber(p)) for p in symbol.symbolPins()]
+            pins.sort(key=lambda (p, number): (number, p.x1(), p.y1()))
+            self._symbols[symbol] = pins
+        return self._symbols[symbol]
+
+    def placeInstance(self, instance):
+        """
+        (CInstancePin, point or net name it joins, netname) of the pins
+        of an instance, pins only named by a net attribute of the
+        instance or its symbol (power pins) have no point
+        """
+        schematic = self._schematic
+        symbol = instance.instanceCellView()
+        if not symbol or not hasattr(symbol, 'symbolPins'):
+            return []
+        nets = netAttributes(symbol.topAttributeLabels())
+        nets.update(netAttributes(instance.attributes()))
+        pins = []
+        for (sp, number) in self.symbolPins(symbol):
+            (x, y) = transformPoint(sp.x1(), sp.y1(), instance.angle(),
+                                    instance.hMirror(), instance.x(), instance.y())
+            pin = CInstancePin(schematic, instance, sp, number, x, y)
+            pins.append((pin, (x, y), nets.pop(number, None)))
+        for (number, name) in sorted(nets.items()):
+            pins.append((CInstancePin(schematic, instance, None, number), name, None))
+        return pins
+
+    def addElement(self, elem):
+        """
+        Record the connection points and names of an element of the
+        schematic, returns False for elements not taking part
+        """
+        schematic = self._schematic
+        if elem in schematic.netSegments():
+            self._segments[elem] = ((elem.x1(), elem.y1()), (elem.x2(), elem.y2()),
+                                    elem.attributeValue('netname'))
+        elif elem in schematic.pins():
+            self._pins[elem] = CPin(schematic, elem)
+        elif elem in schematic.instances():
+            self._instancePins[elem] = self.placeInstance(elem)
+        elif elem in schematic.labels():
+            name = labelName(elem)
+            if not name:
+                return False
+            self._labels[elem] = ((elem.x(), elem.y()), name)
+        else:
+            return False
+        return True
+
+    def removeElement(self, elem):
+        "forget an element, returns the nets it was part of"
+        if elem in self._segments:
+            del self._segments[elem]
+            return set([self._netBySegment.pop(elem)])
+        if elem in self._pins:
+            return set([self._pins.pop(elem).net()])
+        if elem in self._instancePins:
+            return set(item[0].net() for item in self._instancePins.pop(elem))
+        if elem in self._labels:
+            del self._labels[elem]
+            net = self._netByLabel.pop(elem, None)
+            if net:
+                return set([net])
+        return set()
+
+    def connect(self, segments, pins, instancePins, labels):
+        """
+        Join the connection points and names of the given elements,
+        returns a (points, names, segments, pins, instance pins, labels)
+        tuple for each net they make, floating labels are left out
+        """
+        sets = PointSets()
+        for n in segments:
+            (p1, p2, name) = self._segments[n]
+            sets.union(p1, p2)
+            if name:
+                sets.union(p1, name)
+        for pin in pins:
+            sets.add((pin.x(), pin.y()))
+        for (pin, key, name) in instancePins:
+            sets.add(key)
+            if name:
+                sets.union(key, name)
+        # points inside a segment are on its net
+        points = AxisPoints([k for k in sets.keys() if isinstance(k, tuple)])
+        labelPoints = {}
+        for l in labels:
+            labelPoints.setdefault(self._labels[l][0], []).append(l)
+        insideSegments = AxisPoints(labelPoints.keys())
+        placed = []
+        for n in segments:
+            (p1, p2, name) = self._segments[n]
+            for p in points.inside(p1[0], p1[1], p2[0], p2[1]):
+                sets.union(p1, p)
+            for p in insideSegments.inside(p1[0], p1[1], p2[0], p2[1]):
+                placed += [(p1, l) for l in labelPoints[p]]
+        for (p, ls) in labelPoints.iteritems():
+            if p in sets:
+                placed += [(p, l) for l in ls]
+        for (p, l) in placed:
+            sets.union(p, self._labels[l][1])
+        groups = {}
+        for (root, keys) in sets.groups().iteritems():
+            groups[root] = ([k for k in keys if isinstance(k, tuple)],
+                            sorted(k for k in keys if not isinstance(k, tuple)),
+                            [], [], [], [])
+        for n in segments:
+            groups[sets.find(self._segments[n][0])][2].append(n)
+        for pin in pins:
+            groups[sets.find((pin.x(), pin.y()))][3].append(pin)
+        for (pin, key, name) in instancePins:
+            groups[sets.find(key)][4].append(pin)
+        for (p, l) in placed:
+            group = groups[sets.find(p)]
+            if not l in group[5]:
+                group[5].append(l)
+        return groups.values()
+
+    def newName(self):
+        while True:
+            self._count += 1
+            name = 'net%d' % self._count
+            if not name in self._netByName:
+                return name
+
+    def makeNet(self, group, net=None):
+        "fill a new or a reused net with the members of a group"
+        (points, names, segments, pins, instancePins, labels) = group
+        if net is None:
+            net = CNet(self._schematic, None)
+        if names:
+            name = names[0]
+        elif net.name() and not net.isNamed():
+            name = net.name() # keeps its generated name
+        else:
+            name = self.newName()
+        net.setName(name, names)
+        net.clear()
+        self._nets.add(net)
+        self._netByName[name] = net
+        for n in names:
+            self._netByName[n] = net
+        for p in points:
+            net.addPoint(p)
+            self._netByPoint[p] = net
+        for n in segments:
+            net.addSegment(n)
+            self._netBySegment[n] = net
+        for pin in pins:
+            net.addPin(pin)
+        for pin in instancePins:
+            net.addInstancePin(pin)
+        for l in labels:
+            net.addLabel(l)
+            self._netByLabel[l] = net
+        return net
+
+    def dropNet(self, net):
+        self._nets.discard(net)
+        for p in net.points():
+            if self._netByPoint.get(p) is net:
+                del self._netByPoint[p]
+        for name in net.names() | set([net.name()]):
+            if self._netByName.get(name) is net:
+                del self._netByName[name]
+
+    def build(self):
+        schematic = self._schematic
+        for n in schematic.netSegments():
+            self.addElement(n)
+        for pin in schematic.pins():
+            self.addElement(pin)
+        for i in schematic.instances():
+            self.addElement(i)
+        for l in schematic.labels():
+            self.addElement(l)
+        groups = self.connect(self._segments.keys(), self._pins.values(),
+                              self.instancePinItems(self._instancePins.keys()),
+                              self._labels.keys())
+        groups.sort(key=lambda g: (min(g[0] or [None]), g[1]))
+        for group in groups:
+            self.makeNet(group)
+        self._symbols.clear()
+
+    def rebuild(self):
+        "extract all nets again, e.g. after the symbols changed"
+        removed = set(self._nets)
+        for attr in (self._nets, self._netByName, self._netByPoint,
+                     self._segments, self._netBySegment, self._pins,
+                     self._instancePins, self._labels, self._netByLabel):
+            attr.clear()
+        self.build()
+        self.notify(set(self._nets), set(), removed)
+
+    def instancePinItems(self, instances):
+        return [item for i in instances for item in self._instancePins[i]]
+
+    def touching(self, elem):
+        """
+        Nets and floating labels the connection points, segments and
+        names of a just recorded element join
+        """
+        index = self._schematic.spatialIndex()
+        nets = set()
+        labels = set()
+        points = []
+        names = []
+        segments = []
+        if elem in self._segments:
+            (p1, p2, name) = self._segments[elem]
+            points = [p1, p2]
+            names = [name]
+            segments = [elem]
+        elif elem in self._pins:
+            points = [(self._pins[elem].x(), self._pins[elem].y())]
+        elif elem in self._instancePins:
+            for (pin, key, name) in self._instancePins[elem]:
+                if isinstance(key, tuple):
+                    points.append(key)
+                else:
+                    names.append(key)
+                names.append(name)
+        elif elem in self._labels:
+            (p, name) = self._labels[elem]
+            points = [p]
+            names = [name]
+        def onto(label):
+            if label in self._netByLabel:
+                nets.add(self._netByLabel[label])
+            else:
+                labels.add(label)
+        for p in points:
+            if p in self._netByPoint:
+                nets.add(self._netByPoint[p])
+            for e in index.at(p[0], p[1], ['netSegments', 'labels']):
+                if e is elem:
+                    continue
+                if e in self._segments and e.containsInside(p[0], p[1]):
+                    nets.add(self._netBySegment[e])
+                elif e in self._labels and self._labels[e][0] == p:
+                    onto(e)
+        for n in segments:
+            (p1, p2, name) = self._segments[n]
+            for e in index.inRect(p1[0], p1[1], p2[0], p2[1],
+                                  ['netSegments', 'pins', 'instances', 'labels']):
+                if e is n:
+                    continue
+                if e in self._segments:
+                    if [q for q in self._segments[e][:2] if n.containsInside(q[0], q[1])]:
+                        nets.add(self._netBySegment[e])
+                elif e in self._pins:
+                    if n.containsInside(self._pins[e].x(), self._pins[e].y()):
+                        nets.add(self._pins[e].net())
+                elif e in self._instancePins:
+                    for (pin, key, name) in self._instancePins[e]:
+                        if isinstance(key, tuple) and n.containsInside(key[0], key[1]):
+                            nets.add(pin.net())
+                elif e in self._labels:
+                    if n.containsInside(e.x(), e.y()):
+                        onto(e)
+        for name in names + [self._labels[l][1] for l in labels]:
+            net = self._netByName.get(name)
+            if net and name in net.names():
+                nets.add(net)
+        return (nets, labels)
+
+    def update(self, elem, present=True):
+        """
+        Follow an added, moved or changed element, or with present
+        False an element being removed: its old nets and the nets it
+        now touches are joined again from their members
+        """
+        seeds = self.removeElement(elem)
+        labels = set()
+        if present and self.addElement(elem):
+            (nets, labels) = self.touching(elem)
+            seeds |= nets
+            if elem in self._labels:
+                labels.add(elem)
+        elif not seeds:
+            return
+        # members of the seed nets and the element, by the net they were on
+        segments = []
+        pins = []
+        instancePins = []
+        owner = {}
+        before = {}
+        for net in seeds:
+            before[net] = (net.name(), net.names(), frozenset(net.segments()),
+                           frozenset(net.pins()), frozenset(net.instancePins()),
+                           frozenset(net.labels()))
+            for n in net.segments():
+                if n in self._segments:
+                    segments.append(n)
+                    owner[n] = net
+            for pin in net.pins():
+                if self._pins.get(pin.pin()) is pin:
+                    pins.append(pin)
+                    owner[pin] = net
+            for pin in net.instancePins():
+                owner[pin] = net
+            for l in net.labels():
+                if l in self._labels:
+                    labels.add(l)
+                    owner[l] = net
+        instances = set(pin.instance() for pin in owner if isinstance(pin, CInstancePin)
+                        and pin.instance() in self._instancePins)
+        if elem in self._segments:
+            segments.append(elem)
+        elif elem in self._pins:
+            pins.append(self._pins[elem])
+        elif elem in self._instancePins:
+            instances.add(elem)
+        instancePins = [item for item in self.instancePinItems(instances)
+                        if item[0] in owner or item[0].instance() is elem]
+        groups = self.connect(segments, pins, instancePins, list(labels))
+        for net in seeds:
+            self.dropNet(net)
+        for l in labels:
+            self._netByLabel.pop(l, None)
+        # the biggest groups keep the nets most of their members were on
+        groups.sort(key=lambda g: -sum(len(m) for m in g[2:]))
+        claimed = {}
+        added = set()
+        for group in groups:
+            votes = {}
+            for m in group[2] + group[3] + group[4] + group[5]:
+                net = owner.get(m)
+                if net and not net in claimed:
+                    votes[net] = votes.get(net, 0) + 1
+            if votes:
+                net = max(votes, key=lambda net: (votes[net], net.name()))
+                claimed[net] = group
+            else:
+                added.add(self.makeNet(group))
+        for (net, group) in claimed.iteritems():
+            self.makeNet(group, net)
+        changed = set(net for net in claimed if before[net] !=
+                      (net.name(), net.names(), frozenset(net.segments()),
+                       frozenset(net.pins()), frozenset(net.instancePins()),
+                       frozenset(net.labels())))
+        removed = seeds - set(claimed)
+        self._symbols.clear()
+        self.notify(added, changed, removed)
+
+    def notify(self, added, changed, removed):
+        if added or changed or removed:
+            for listener in list(self._listeners):
+                listener.netsUpdated(added, changed, removed)
+
+    def schematic(self):
+        return self._schematic
+
+    def nets(self):
+        "nets sorted by name"
+        return sorted(self._nets, key=CNet.name)
+
+    def netCount(self):
+        return len(self._nets)
+
+    def netByName(self, name):
+        return self._netByName.get(name)
+
+    def netAt(self, x, y):
+        "net with a connection point at x, y or None"
+        return self._netByPoint.get((x, y))
+
+    def netOfSegment(self, segment):
+        return self._netBySegment.get(segment)
+
+    def pin(self, pin):
+        "CPin of a pin of the schematic"
+        return self._pins.get(pin)
+
+    def pins(self):
+        return self._pins.values()
+
+    def netOfPin(self, pin):
+        "net of a schematic pin or of a CPin or CInstancePin"
+        if self._pins.has_key(pin):
+            return self._pins[pin].net()
+        return pin.net()
+
+    def instancePins(self, instance):
+        "CInstancePins of an instance in pin number order"
+        return [item[0] for item in self._instancePins.get(instance, [])]
+
+    def instancePin(self, instance, name):
+        "CInstancePin of an instance by pin number"
+        for p in self.instancePins(instance):
+            if p.name() == name:
+                return p
+        return None
@@ -22,34 +22,85 @@
 #from Database.Layers import *
 from Database.Cells import *
 from Database.Attributes import *
+from Database.Geometry import transformBox
 from xml.etree import ElementTree as et
 
 #print 'Primitives out'
 
-class Element():
+def xmlValue(value):
+    "xml attribute text of a number, floats are kept exactly"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+class SharedDefault(object):
+    """
+    Element field whose default value is kept once by the class.
+    Only values differing from the default are stored, in the
+    element's _extra dictionary, which is created on first use.
+    """
+    __slots__ = ('_field', '_default')
+
+    def __init__(self, field, default):
+        self._field = field
+        self._default = default
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        if obj._extra is None:
+            return self._default
+        return obj._extra.get(self._field, self._default)
+
+    def __set__(self, obj, value):
+        if value is self._default or (
+            type(value) is type(self._default) and value == self._default):
+            if obj._extra:
+                obj._extra.pop(self._field, None)
+        else:
+            if obj._extra is None:
+                obj._extra = {}
+            obj._extra[self._field] = value
+
+
+class Element(object):
+    """
+    Elements use slots and share the usual values of the rarely changed
+    fields, the attributes and views sets are only created when needed.
+    """
+    __slots__ = ('_diagram', '_layers', '_layer', '_x', '_y',
+                 '_attributes', '_views', '_extra')
+    noItems = frozenset()
+    _name = SharedDefault('_name', 'element')
+    _angle = SharedDefault('_angle', 0)
+    _hmirror = SharedDefault('_hmirror', False)
+    _vmirror = SharedDefault('_vmirror', False)
+    _visible = SharedDefault('_visible', True)
+    _editable = SharedDefault('_editable', True)
+
     def __init__(self, diagram, layers):
-        self._attributes = set()
-        self._views = set()
+        self._extra = None
+        self._attributes = self.noItems
+        self._views = self.noItems
         self._layers = layers
         self._diagram = diagram
-        self._name = 'element'
         self._layer = None
         self._x = 0
         self._y = 0
-        self._angle = 0
-        self._hmirror = False
-        self._vmirror = False
-        self._visible = True
-        self._editable = True
-        diagram.elementAdded(self)
 
     def addAttribute(self, attrib):
+        if not self._attributes:
+            self._attributes = set()
         self._attributes.add(attrib)
+        attrib.setOwner(self)
+        self._diagram.elementChanged(self)
 
     def installUpdateHook(self, view):
-        self._views.add(view)
+        self.itemAdded(view)
 
     def itemAdded(self, item):
+        if not self._views:
+            self._views = set()
         self._views.add(item)
 
     def updateViews(self):
@@ -57,11 +108,36 @@ class Element():
             v.updateItem()
 
     def addToView(self, view):
-        view.addElem()
+        view.addElem(self)
 
-    def removeFromView(self):
-        for v in self._views:
-            v.removeElem()
+    def removeFromView(self, view):
+        "forget the items showing the element inside view"
+        for v in list(self._views):
+            if v.parentItem() is view:
+                self._views.remove(v)
+
+    def removeFromViews(self):
+        for v in list(self._views):
+            v.elementRemoved()
+        self._views = self.noItems
+
+    def addToDiagram(self, diagram):
+        pass
+
+    def removeFromDiagram(self, diagram):
+        pass
+
+    def addToGeometry(self, geometry):
+        pass
+
+    def boundingBox(self):
+        "(x1, y1, x2, y2) in database units, the anchor point by default"
+        return (self._x, self._y, self._x, self._y)
+
+    def addToDesignUnit(self, designUnit):
+        "add itself to the scene of a design unit"
+        if designUnit.scene():
+            self.addToView(designUnit.scene())
 
     def setName(self, name):
         if self._editable:
@@ -77,21 +153,25 @@ class Element():
         if self._editable:
             self._x = x
             self._y = y
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def setAngle(self, angle): #0, 90, 180, 270
         if self._editable:
             self._angle = angle
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def setVMirror(self, mirror): #bool
         if self._editable:
             self._vmirror = mirror
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def setHMirror(self, mirror): #bool
         if self._editable:
             self._hmirror = mirror
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def setVisible(self, visible): #bool
@@ -102,6 +182,13 @@ class Element():
     def attributes(self):
         return self._attributes
 
+    def attributeValue(self, key, default=None):
+        "value of an attached attribute, e.g. the netname of a net segment"
+        for a in self._attributes:
+            if a.key() == key:
+                return a.value()
+        return default
+
     def views(self):
         return self._views
 
@@ -148,20 +235,32 @@ class Element():
         return self._visible
         
     def toXml(self):
+        "the element as an xml element, the usual values are left out"
         elem = et.Element(self._name)
-        elem.attrib['x'] = str(self._x)
-        elem.attrib['y'] = str(self._y)
-        elem.attrib['angle'] = str(self._angle)
-        elem.attrib['hmirror'] = str(self._hmirror)
-        elem.attrib['vmirror'] = str(self._vmirror)
-        elem.attrib['visible'] = str(self._visible)
-        #elem.attrib['layer'] = str(self._layer)
+        elem.attrib['x'] = xmlValue(self._x)
+        elem.attrib['y'] = xmlValue(self._y)
+        if self._angle:
+            elem.attrib['angle'] = xmlValue(self._angle)
+        if self._hmirror:
+            elem.attrib['hmirror'] = str(self._hmirror)
+        if self._vmirror:
+            elem.attrib['vmirror'] = str(self._vmirror)
+        if not self._visible:
+            elem.attrib['visible'] = str(self._visible)
+        if self._layer:
+            elem.attrib['layer'] = self._layer.name()
+            elem.attrib['layerType'] = self._layer.ltype()
+        for a in self._attributes:
+            elem.append(a.toXml())
         return elem
 
     def remove(self):
-        pass
+        self.diagram().removeElem(self)
         
 class Line(Element):
+    __slots__ = ('_x2', '_y2')
+    _name = SharedDefault('_name', 'line')
+
     def __init__(self, diagram, layers, x1, y1, x2, y2):
         Element.__init__(self, diagram, layers)
         self._x = x1
@@ -169,8 +268,7 @@ class Line(Element):
         self._x2 = x2
         self._y2 = y2
         self._layer = self.layers().layerByName('annotation', 'drawing')
-        self._name = 'line'
-        diagram.lineAdded(self)
+        diagram.addElem(self)
 
     def x1(self):
         return self._x
@@ -184,26 +282,40 @@ class Line(Element):
     def y2(self):
         return self._y2
 
+    def boundingBox(self):
+        return (min(self._x, self._x2), min(self._y, self._y2),
+                max(self._x, self._x2), max(self._y, self._y2))
+
     def addToView(self, view):
         view.addLine(self)
 
+    def addToDiagram(self, diagram):
+        diagram.lineAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.lineRemoved(self)
+
+    def addToGeometry(self, geometry):
+        geometry.lineAdded(self)
+
     def toXml(self):
         elem = Element.toXml(self)
-        elem.attrib['x2'] = str(self._x2)
-        elem.attrib['y2'] = str(self._y2)
-        elem.attrib['layer'] = str(self._layer.name())
+        elem.attrib['x2'] = xmlValue(self._x2)
+        elem.attrib['y2'] = xmlValue(self._y2)
         return elem
         
 class Rect(Element):
+    __slots__ = ('_w', '_h')
+    _name = SharedDefault('_name', 'rect')
+
     def __init__(self, diagram, layers, x, y, w, h):
         Element.__init__(self, diagram, layers)
         self._x = x
         self._y = y
         self._w = w
         self._h = h
-        self._name = 'rect'
         self._layer = self.layers().layerByName('annotation', 'drawing')
-        diagram.rectAdded(self)
+        diagram.addElem(self)
 
     def w(self):
         return self._w
@@ -211,68 +323,107 @@ class Rect(Element):
     def h(self):
         return self._h
 
+    def boundingBox(self):
+        return (min(self._x, self._x + self._w), min(self._y, self._y + self._h),
+                max(self._x, self._x + self._w), max(self._y, self._y + self._h))
+
     def addToView(self, view):
         view.addRect(self)
 
+    def addToDiagram(self, diagram):
+        diagram.rectAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.rectRemoved(self)
+
+    def toXml(self):
+        elem = Element.toXml(self)
+        elem.attrib['w'] = xmlValue(self._w)
+        elem.attrib['h'] = xmlValue(self._h)
+        return elem
+
 class CustomPath(Element):
+    __slots__ = ('_path',)
+    _name = SharedDefault('_name', 'custom_path')
     move, line, curve, close = range(4)
     def __init__(self, diagram, layers):
         Element.__init__(self, diagram, layers)
-        self._name = 'custom_path'
         self._path = []
         self._layer = self.layers().layerByName('annotation', 'drawing')
-        diagram.customPathAdded(self)
+        diagram.addElem(self)
 
     def addToView(self, view):
         view.addCustomPath(self)
 
+    def addToDiagram(self, diagram):
+        diagram.customPathAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.customPathRemoved(self)
+
     def moveTo(self, x, y):
         if self._editable:
             self._path.append([self.move, x, y])
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def lineTo(self, x, y):
         if self._editable:
             self._path.append([self.line, x, y])
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def curveTo(self, xcp1, ycp1, xcp2, ycp2, x, y):
         if self._editable:
             self._path.append([self.curve, xcp1, ycp1, xcp2, ycp2, x, y])
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def closePath(self):
         if self._editable:
             self._path.append([self.close])
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def path(self):
         return self._path
 
-    def addToDesignUnit(self, designUnit):
-        "add itself to an design unit"
-        designUnit.view().addCustomPath(self)
-        
-    def removeFromOccurence(self, designUnit):
-        "remove itself from an design unit"
-        designUnit.view().removeCustomPath(self)
-        
-        
+    def boundingBox(self):
+        "box of the path points, curve control points included"
+        xs = [self._x]
+        ys = [self._y]
+        for p in self._path:
+            xs.extend(p[1::2])
+            ys.extend(p[2::2])
+        if len(xs) > 1:
+            (xs, ys) = (xs[1:], ys[1:])
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    def toXml(self):
+        "the path as the text of the element, one command per line"
+        elem = Element.toXml(self)
+        elem.text = '\n'.join(' '.join(xmlValue(v) for v in p) for p in self._path)
+        return elem
+
+
 class Ellipse(Element):
+    __slots__ = ('_radiusX', '_radiusY')
+    _name = SharedDefault('_name', 'ellipse')
+
     def __init__(self, diagram, layers, x, y, radiusX, radiusY):
         Element.__init__(self, diagram, layers)
         self._x = x
         self._y = y
         self._radiusX = radiusX
         self._radiusY = radiusY
-        self._name = 'ellipse'
         self._layer = self.layers().layerByName('annotation', 'drawing')
-        diagram.ellipseAdded(self)
+        diagram.addElem(self)
 
     def setRadius(self, radiusX, radiusY):
         if self._editable:
             self._radiusX = radiusX
             self._radiusY = radiusY
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def radiusX(self):
@@ -281,10 +432,31 @@ class Ellipse(Element):
     def radiusY(self):
         return self._radiusY
 
+    def boundingBox(self):
+        "radiusX and radiusY span the whole ellipse"
+        rx = self._radiusX / 2.0
+        ry = self._radiusY / 2.0
+        return (self._x - rx, self._y - ry, self._x + rx, self._y + ry)
+
     def addToView(self, view):
         view.addEllipse(self)
 
+    def addToDiagram(self, diagram):
+        diagram.ellipseAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.ellipseRemoved(self)
+
+    def toXml(self):
+        elem = Element.toXml(self)
+        elem.attrib['radiusX'] = xmlValue(self._radiusX)
+        elem.attrib['radiusY'] = xmlValue(self._radiusY)
+        return elem
+
 class EllipseArc(Element):
+    __slots__ = ('_radiusX', '_radiusY', '_startAngle', '_spanAngle')
+    _name = SharedDefault('_name', 'ellipse_arc')
+
     def __init__(self, diagram, layers, x, y, radiusX, radiusY,
                  startAngle, spanAngle):
         Element.__init__(self, diagram, layers)
@@ -294,20 +466,21 @@ class EllipseArc(Element):
         self._radiusY = radiusY
         self._startAngle = startAngle
         self._spanAngle = spanAngle
-        self._name = 'ellipse_arc '
         self._layer = self.layers().layerByName('annotation', 'drawing')
-        diagram.ellipseArcAdded(self)
+        diagram.addElem(self)
 
     def setRadius(self, radiusX, radiusY):
         if self._editable:
             self._radiusX = radiusX
             self._radiusY = radiusY
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def setAngles(self, startAngle, spanAngle):
         if self._editable:
             self._startAngle = startAngle
             self._spanAngle = spanAngle
+            self.diagram().elementMoved(self)
             self.updateViews()
 
     def radiusX(self):
@@ -322,28 +495,51 @@ class EllipseArc(Element):
     def spanAngle(self):
         return self._spanAngle
 
+    def boundingBox(self):
+        "box of the whole ellipse"
+        rx = self._radiusX / 2.0
+        ry = self._radiusY / 2.0
+        return (self._x - rx, self._y - ry, self._x + rx, self._y + ry)
+
     def addToView(self, view):
         view.addEllipseArc(self)
 
+    def addToDiagram(self, diagram):
+        diagram.ellipseArcAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.ellipseArcRemoved(self)
+
+    def toXml(self):
+        elem = Element.toXml(self)
+        elem.attrib['radiusX'] = xmlValue(self._radiusX)
+        elem.attrib['radiusY'] = xmlValue(self._radiusY)
+        elem.attrib['startAngle'] = xmlValue(self._startAngle)
+        elem.attrib['spanAngle'] = xmlValue(self._spanAngle)
+        return elem
+
 class Label(Element):
+    __slots__ = ('_textSize', '_text')
     AlignLeft = 0
     AlignCenter = 1
     AlignRight = 2
     AlignBottom = 0
     AlignTop = 2
+    _name = SharedDefault('_name', 'label')
+    _hAlign = SharedDefault('_hAlign', AlignLeft)
+    _vAlign = SharedDefault('_vAlign', AlignCenter)
+
     def __init__(self, diagram, layers):
         Element.__init__(self, diagram, layers)
         self._textSize = 1
         self._text = ''
-        self._hAlign = self.AlignLeft
-        self._vAlign = self.AlignCenter
-        self._name = 'label'
         self._layer = self.layers().layerByName('annotation', 'drawing')
-        diagram.labelAdded(self)
+        diagram.addElem(self)
 
     def setText(self, text):
         if self._editable:
             self._text = text
+            self.diagram().elementChanged(self)
             self.updateViews()
 
     def setHAlign(self, align):
@@ -376,38 +572,58 @@ class Label(Element):
     def addToView(self, view):
         view.addLabel(self)
 
+    def addToDiagram(self, diagram):
+        diagram.labelAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.labelRemoved(self)
+
     def toXml(self):
         elem = Element.toXml(self)
-        elem.text = str(self._text)
+        elem.text = self._text
         elem.attrib['halign'] = str(self._hAlign)
         elem.attrib['valign'] = str(self._vAlign)
-        elem.attrib['size'] = str(self._textSize)
+        elem.attrib['size'] = xmlValue(self._textSize)
         return elem
         
 class AttributeLabel(Label):
+    __slots__ = ('_attribute', '_owner')
     AlignLeft = 0
     AlignCenter = 1
     AlignRight = 2
     AlignBottom = 0
     AlignTop = 2
+    _name = SharedDefault('_name', 'attributeLabel')
+    _visibleKey = SharedDefault('_visibleKey', True)
+
     def __init__(self, diagram, layers, key, val):
         Element.__init__(self, diagram, layers)
         self._textSize = 1
         self._text = ''
-        self._hAlign = self.AlignLeft
-        self._vAlign = self.AlignCenter
 
         self._attribute = Attribute(key, val, Attribute.AInteger, self)
-        self._name = 'attributeLabel'
-        self._visibleKey = True
+        self._owner = None
         self._layer = self.layers().layerByName('attribute', 'drawing')
-        diagram.attributeLabelAdded(self)
+        diagram.addElem(self)
 
     def setText(self, text):
         if self._editable:
             self._attribute.setVal(text)
+            # nets read the attribute through the element it is attached to
+            if self._owner is not None:
+                self.diagram().elementChanged(self._owner)
+            else:
+                self.diagram().elementChanged(self)
             self.updateViews()
 
+    def setOwner(self, owner):
+        "element the attribute is attached to"
+        self._owner = owner
+
+    def owner(self):
+        "element the attribute is attached to, None for top level attributes"
+        return self._owner
+
     def setVisibleKey(self, visible):
         if self._editable:
             self._visibleKey = visible
@@ -419,6 +635,15 @@ class AttributeLabel(Label):
     def addToView(self, view):
         view.addAttributeLabel(self)
 
+    def addToDiagram(self, diagram):
+        diagram.attributeLabelAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.attributeLabelRemoved(self)
+
+    def attribute(self):
+        return self._attribute
+
     def key(self):
         return self._attribute.name()
 
@@ -430,16 +655,20 @@ class AttributeLabel(Label):
 
     def toXml(self):
         elem = Label.toXml(self)
+        elem.text = None
         elem.attrib['visibleKey'] = str(self._visibleKey)
         attr = et.Element('attribute')
         attr.attrib['name'] = self._attribute.name()
         attr.attrib['type'] = self._attribute.type()
         attr.text = self._attribute.val()
-        elem.append(attr)
+        elem.insert(0, attr)
         return elem
         
         
 class NetSegment(Element):
+    __slots__ = ('_x2', '_y2')
+    _name = SharedDefault('_name', 'net_segment')
+
     def __init__(self, diagram, layers, x1, y1, x2, y2):
         Element.__init__(self, diagram, layers)
         self._x = x1
@@ -447,8 +676,7 @@ class NetSegment(Element):
         self._y = y1
         self._y2 = y2
         self._layer = self.layers().layerByName('net', 'drawing')
-        self._name = 'net_segment'
-        diagram.netSegmentAdded(self)
+        diagram.addElem(self)
 
     def x1(self):
         return self._x
@@ -473,9 +701,27 @@ class NetSegment(Element):
         
     def maxY(self):
         return max(self._y, self._y2)
+
+    def boundingBox(self):
+        return (self.minX(), self.minY(), self.maxX(), self.maxY())
         
     def addToView(self, view):
         view.addNetSegment(self)
+
+    def addToDiagram(self, diagram):
+        diagram.netSegmentAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.netSegmentRemoved(self)
+
+    def toXml(self):
+        elem = Element.toXml(self)
+        elem.attrib['x2'] = xmlValue(self._x2)
+        elem.attrib['y2'] = xmlValue(self._y2)
+        return elem
+
+    def addToGeometry(self, geometry):
+        geometry.netSegmentAdded(self)
     
     def contains (self, x, y):
         c1 = (self._x == self._x2 and 
@@ -495,83 +741,84 @@ class NetSegment(Element):
         return (c1 or c2)
 
 class SolderDot(Element):
+    __slots__ = ()
+    _name = SharedDefault('_name', 'solder_dot')
+
     def __init__(self, diagram, layers, x, y):
         Element.__init__(self, diagram, layers)
         self._x = x
         self._y = y
         self._layer = self.layers().layerByName('net', 'drawing')
-        self._name = 'solder_dot'
-        diagram.solderDotAdded(self)
+        diagram.addElem(self)
 
     def addToView(self, view):
         view.addSolderDot(self)
+
+    def addToDiagram(self, diagram):
+        diagram.solderDotAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.solderDotRemoved(self)
         
     def radiusX(self):
         return self.diagram().uu()
         
     def radiusY(self):
         return self.diagram().uu()
+
+    def boundingBox(self):
+        r = self.diagram().uu()
+        return (self._x - r, self._y - r, self._x + r, self._y + r)
         
         
 class Instance(Element):
+    __slots__ = ('_instanceLibPath', '_instanceCellName', '_instanceCellViewName')
+    _name = SharedDefault('_name', 'instance')
+    fallbackCellView = ('/sym/analog', 'voltage-1', 'symbol')
+
     def __init__(self, diagram, layers):
         Element.__init__(self, diagram, layers)
         self._instanceLibPath = ''
         self._instanceCellName = ''
         self._instanceCellViewName = ''
-        self._name = 'instance'
-
-        self._instanceLibrary = None
-        self._instanceCell = None
-        self._instanceCellView = None
-        self._requestedInstanceCellView = None
         self._layer = self.layers().layerByName('instance', 'drawing')
-        diagram.instanceAdded(self)
+        diagram.addElem(self)
 
     def setInstanceCell(self, libPath, cellName, cellViewName): #string
         if self._editable:
             self._instanceLibPath = libPath
             self._instanceCellName = cellName
             self._instanceCellViewName = cellViewName
+            self.diagram().elementMoved(self)
             self.updateViews()
 
+    def resolutionKey(self):
+        "(absolute library path, cell name, cell view name) of the instance"
+        return (self.instanceAbsolutePath(), self._instanceCellName,
+                self._instanceCellViewName)
+
     def requestedInstanceCellView(self):
-        if self.instanceLibraryPath() == '':
-            self._requestedInstanceCellView = self.library().cellViewByName(self.instanceCellName(), self.instanceCellViewName())
-        else:
-            self._requestedInstanceCellView = self.database().cellViewByName(self.instanceAbsolutePath(), self.instanceCellName(), self.instanceCellViewName())
-        return self._requestedInstanceCellView
-        
+        "the instantiated cell view or None, see Database.resolveCellView"
+        return self.database().resolveCellView(*self.resolutionKey())
+
     def instanceLibrary(self):
-        if self._instanceLibrary:    #cache
-            return self._instanceLibrary
-        cv = self.requestedInstanceCellView()
+        cv = self.instanceCellView()
         if cv:
-            self._instanceLibrary = cv.library()
-        else:
-            self._instanceLibrary = self.database().libraryByPath('/sym/analog')
-        return self._instanceLibrary
+            return cv.library()
+        return self.database().libraryByPath(self.fallbackCellView[0])
 
     def instanceCell(self):
-        if self._instanceCell:    #cache
-            return self._instanceCell
-        cv = self.requestedInstanceCellView()
+        cv = self.instanceCellView()
         if cv:
-            self._instanceCell = cv.cell()
-        else:
-            self._instanceCell = self.database().cellByName('/sym/analog', 'voltage-1')
-        return self._instanceCell
-
+            return cv.cell()
+        return self.database().cellByName(*self.fallbackCellView[:2])
 
     def instanceCellView(self):
-        if self._instanceCellView:   #cache
-            return self._instanceCellView
+        "the instantiated cell view, a placeholder symbol if it is missing"
         cv = self.requestedInstanceCellView()
         if cv:
-            self._instanceCellView = cv
-        else:
-            self._instanceCellView = self.database().cellViewByName('/sym/analog', 'voltage-1', 'symbol')
-        return self._instanceCellView
+            return cv
+        return self.database().resolveCellView(*self.fallbackCellView)
 
     def instanceLibraryPath(self):
         return self._instanceLibPath
@@ -585,11 +832,35 @@ class Instance(Element):
         
     def instanceCellViewName(self):
         return self._instanceCellViewName
+
+    def boundingBox(self):
+        "box of the placed symbol"
+        cv = self.instanceCellView()
+        box = cv and cv.boundingBox()
+        if not box:
+            return Element.boundingBox(self)
+        return transformBox(box, self._angle, self._hmirror, self._x, self._y)
         
     def addToView(self, view):
         view.addInstance(self)
 
+    def addToDiagram(self, diagram):
+        diagram.instanceAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.instanceRemoved(self)
+
+    def toXml(self):
+        elem = Element.toXml(self)
+        elem.attrib['libPath'] = self._instanceLibPath
+        elem.attrib['cell'] = self._instanceCellName
+        elem.attrib['view'] = self._instanceCellViewName
+        return elem
+
 class Pin(Instance):
+    __slots__ = ('_x2', '_y2')
+    _name = SharedDefault('_name', 'pin')
+
     def __init__(self, diagram, layers, x1, y1, x2, y2):
         Element.__init__(self, diagram, layers)
         self._x = x1
@@ -597,18 +868,12 @@ class Pin(Instance):
         self._x2 = x2
         self._y2 = y2
         self._layer = self.layers().layerByName('pin', 'drawing')
-        self._name = 'pin'
 
         self._instanceLibPath = ''
         self._instanceCellName = ''
         self._instanceCellViewName = ''
-        self._name = 'instance'
 
-        self._instanceLibrary = None
-        self._instanceCell = None
-        self._instanceCellView = None
-        self._requestedInstanceCellView = None
-        diagram.pinAdded(self)
+        diagram.addElem(self)
         
         
     def x1(self):
@@ -623,10 +888,32 @@ class Pin(Instance):
     def y2(self):
         return self._y2
 
+    def boundingBox(self):
+        return (min(self._x, self._x2), min(self._y, self._y2),
+                max(self._x, self._x2), max(self._y, self._y2))
+
     def addToView(self, view):
         view.addPin(self)
 
+    def addToDiagram(self, diagram):
+        diagram.pinAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.pinRemoved(self)
+
+    def toXml(self):
+        elem = Element.toXml(self)
+        elem.attrib['x2'] = xmlValue(self._x2)
+        elem.attrib['y2'] = xmlValue(self._y2)
+        return elem
+
+    def addToGeometry(self, geometry):
+        geometry.pinAdded(self)
+
 class SymbolPin(Instance):
+    __slots__ = ('_x2', '_y2')
+    _name = SharedDefault('_name', 'symbol_pin')
+
     def __init__(self, diagram, layers, x1, y1, x2, y2):
         Element.__init__(self, diagram, layers)
         self._x = x1
@@ -634,18 +921,12 @@ class SymbolPin(Instance):
         self._x2 = x2
         self._y2 = y2
         self._layer = self.layers().layerByName('pin', 'drawing')
-        self._name = 'pin'
 
         self._instanceLibPath = ''
         self._instanceCellName = ''
         self._instanceCellViewName = ''
-        self._name = 'instance'
 
-        self._instanceLibrary = None
-        self._instanceCell = None
-        self._instanceCellView = None
-        self._requestedInstanceCellView = None
-        diagram.symbolPinAdded(self)
+        diagram.addElem(self)
         
     def x1(self):
         return self._x
@@ -659,21 +940,168 @@ class SymbolPin(Instance):
     def y2(self):
         return self._y2
 
+    def boundingBox(self):
+        return (min(self._x, self._x2), min(self._y, self._y2),
+                max(self._x, self._x2), max(self._y, self._y2))
+
     def addToView(self, view):
         view.addPin(self)
+
+    def addToDiagram(self, diagram):
+        diagram.symbolPinAdded(self)
+
+    def removeFromDiagram(self, diagram):
+        diagram.symbolPinRemoved(self)
+
+    def toXml(self):
+        elem = Element.toXml(self)
+        elem.attrib['x2'] = xmlValue(self._x2)
+        elem.attrib['y2'] = xmlValue(self._y2)
+        return elem
+
+    def addToGeometry(self, geometry):
+        geometry.symbolPinAdded(self)
         
 class Connectivity():
-    def __init__(self):
-        pass
+    "an object of the connectivity extracted from a schematic"
+    def __init__(self, schematic):
+        self._schematic = schematic
+
+    def schematic(self):
+        return self._schematic
 
 class CNet(Connectivity):
-    def __init__(self):
-        pass
+    """
+    Net segments, pins and instance pins connected together.
+    A net takes its name from netname attributes, net attributes of
+    the instances and labels on it, unnamed nets get a generated name.
+    """
+    def __init__(self, schematic, name, names=()):
+        Connectivity.__init__(self, schematic)
+        self._name = name
+        self._names = frozenset(names)
+        self._segments = set()
+        self._pins = set()
+        self._instancePins = set()
+        self._labels = set()
+        self._points = set()
+
+    def setName(self, name, names=()):
+        self._name = name
+        self._names = frozenset(names)
+
+    def clear(self):
+        "forget the members, the net is being joined again"
+        self._segments = set()
+        self._pins = set()
+        self._instancePins = set()
+        self._labels = set()
+        self._points = set()
+
+    def addSegment(self, segment):
+        self._segments.add(segment)
+
+    def addPin(self, pin):
+        self._pins.add(pin)
+        pin.setNet(self)
+
+    def addInstancePin(self, instancePin):
+        self._instancePins.add(instancePin)
+        instancePin.setNet(self)
+
+    def addLabel(self, label):
+        self._labels.add(label)
+
+    def addPoint(self, point):
+        self._points.add(point)
+
+    def name(self):
+        return self._name
+
+    def names(self):
+        "the names given to the net, empty if it is unnamed"
+        return self._names
+
+    def isNamed(self):
+        return bool(self._names)
+
+    def segments(self):
+        return self._segments
+
+    def pins(self):
+        return self._pins
+
+    def instancePins(self):
+        return self._instancePins
+
+    def labels(self):
+        "labels naming the net"
+        return self._labels
+
+    def points(self):
+        "connection points of the net"
+        return self._points
 
 class CPin(Connectivity):
-    def __init__(self):
-        pass
+    "a pin of the schematic and the net it connects to"
+    def __init__(self, schematic, pin):
+        Connectivity.__init__(self, schematic)
+        self._pin = pin
+        self._x = pin.x1()
+        self._y = pin.y1()
+        self._net = None
+
+    def setNet(self, net):
+        self._net = net
+
+    def pin(self):
+        return self._pin
+
+    def name(self):
+        pin = self._pin
+        return pin.attributeValue('pinlabel', pin.attributeValue('pinnumber'))
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def net(self):
+        return self._net
 
 class CInstancePin(Connectivity):
-    def __init__(self):
-        pass
+    """
+    A pin of an instance, the symbol pin placed by the instance.
+    Pins only named by net attributes have no symbol pin and no position.
+    """
+    def __init__(self, schematic, instance, symbolPin, name, x=None, y=None):
+        Connectivity.__init__(self, schematic)
+        self._instance = instance
+        self._symbolPin = symbolPin
+        self._name = name
+        self._x = x
+        self._y = y
+        self._net = None
+
+    def setNet(self, net):
+        self._net = net
+
+    def instance(self):
+        return self._instance
+
+    def symbolPin(self):
+        return self._symbolPin
+
+    def name(self):
+        "pin number of the symbol pin"
+        return self._name
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def net(self):
+        return self._net
@@ -21,10 +21,15 @@
 
 import re
 import os
+import time
+import multiprocessing
+import hashlib
+from xml.etree import cElementTree
 from Database.Primitives import *
 from Database.CellViews import *
 from Database.Cells import *
 from Database.Layers import *
+from Database.Snapshot import writeCellView, loadCellView, version as snapshotVersion
 #from Database.Primitives import Database
 
 #print 'Reader out'
@@ -49,6 +54,171 @@ class Reader():
         pass
         
     
+class GedaLineSource():
+    """
+    Lines of a gEDA file kept in a single buffer, read with one call
+    from a file, a pipe or an archive member, or given as a string.
+    Lines and multi-line blocks are served as slices of the buffer.
+    """
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    @classmethod
+    def fromFile(cls, fileName):
+        f = open(fileName, 'r')
+        data = f.read()
+        f.close()
+        return cls(data)
+
+    @classmethod
+    def fromSource(cls, source):
+        "line source of a file name, an open stream or a line source"
+        if isinstance(source, GedaLineSource):
+            return source
+        elif hasattr(source, 'read'):
+            return cls(source.read())
+        else:
+            return cls.fromFile(source)
+
+    def readline(self):
+        start = self._pos
+        end = self._data.find('\n', start) + 1
+        if end == 0:
+            end = len(self._data)
+        self._pos = end
+        return self._data[start:end]
+
+    def readLines(self, n):
+        "the next n lines as one string, including their newlines"
+        start = self._pos
+        end = start
+        for i in range(n):
+            end = self._data.find('\n', end) + 1
+            if end == 0:
+                end = len(self._data)
+                break
+        self._pos = end
+        return self._data[start:end]
+
+    def lineCount(self):
+        n = self._data.count('\n')
+        if self._data and not self._data.endswith('\n'):
+            n += 1
+        return n
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+    def close(self):
+        pass
+
+
+class GedaFileStats():
+    """
+    Timing and contents of one parsed file. seconds covers reading
+    or recording the file (recordSeconds) and building its elements,
+    including symbol resolution and the net checks, which are also
+    given on their own.
+    """
+    fields = ['fileName', 'mode', 'origin', 'lines', 'elements',
+              'seconds', 'recordSeconds', 'resolveSeconds',
+              'netSegmentsSeconds', 'solderDotsSeconds']
+
+    def __init__(self, fileName, mode):
+        self.fileName = fileName
+        self.mode = mode
+        self.origin = 'file'
+        self.lines = 0
+        self.elements = {}      # element class name -> count
+        self.seconds = 0.0
+        self.recordSeconds = 0.0
+        self.resolveSeconds = 0.0
+        self.netSegmentsSeconds = 0.0
+        self.solderDotsSeconds = 0.0
+
+    def elementCount(self):
+        return sum(self.elements.values())
+
+    def countElements(self, cellView):
+        self.elements = {}
+        for e in cellView.elems():
+            name = e.__class__.__name__
+            self.elements[name] = self.elements.get(name, 0) + 1
+
+    def asDict(self):
+        return dict((f, getattr(self, f)) for f in self.fields)
+
+    def __repr__(self):
+        return '<GedaFileStats %s %s %.3fs>' % (self.mode, self.fileName, self.seconds)
+
+
+class GedaImportStats():
+    """
+    Per-file statistics collected by a GedaImporter, e.g. from the console:
+        print window.importer.stats.report()
+        window.importer.stats.asDict()
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.files = []
+        self._recorded = {}     # (file name, mode) -> seconds spent recording
+
+    def recorded(self, fileName, mode, seconds):
+        "time spent recording a file in advance, e.g. in a worker process"
+        self._recorded[(fileName, mode)] = seconds
+
+    def begin(self, fileName, mode):
+        stats = GedaFileStats(fileName, mode)
+        stats.recordSeconds = self._recorded.pop((fileName, mode), 0.0)
+        stats.seconds = stats.recordSeconds
+        self.files.append(stats)
+        return stats
+
+    def totals(self):
+        totals = {'files': len(self.files), 'lines': 0, 'elements': {}}
+        for f in GedaFileStats.fields[5:]:
+            totals[f] = 0.0
+        for stats in self.files:
+            totals['lines'] += stats.lines
+            for f in GedaFileStats.fields[5:]:
+                totals[f] += getattr(stats, f)
+            for (name, n) in stats.elements.items():
+                totals['elements'][name] = totals['elements'].get(name, 0) + n
+        return totals
+
+    def slowest(self, n=10):
+        return sorted(self.files, key=lambda s: s.seconds, reverse=True)[:n]
+
+    def asDict(self):
+        return {
+            'totals': self.totals(),
+            'files': [s.asDict() for s in self.files],
+            }
+
+    def report(self, n=10):
+        "summary of the totals and of the n slowest files"
+        t = self.totals()
+        lines = ['%d files, %d lines, %d elements in %.3fs '
+                 '(record %.3fs, resolve %.3fs, net segments %.3fs, solder dots %.3fs)' % (
+                t['files'], t['lines'], sum(t['elements'].values()), t['seconds'],
+                t['recordSeconds'], t['resolveSeconds'],
+                t['netSegmentsSeconds'], t['solderDotsSeconds'])]
+        lines.append('%9s %9s %9s %9s %7s %7s  %s' % (
+            'seconds', 'resolve', 'segments', 'dots', 'lines', 'elems', 'file'))
+        for s in self.slowest(n):
+            lines.append('%9.4f %9.4f %9.4f %9.4f %7d %7d  %s (%s, %s)' % (
+                s.seconds, s.resolveSeconds, s.netSegmentsSeconds,
+                s.solderDotsSeconds, s.lines, s.elementCount(),
+                s.fileName, s.mode, s.origin))
+        return '\n'.join(lines)
+
+
 class GedaReader(Reader):
     uu = 100 #default database units / user units
     peof = re.compile(r'^$')
@@ -78,6 +248,22 @@ class GedaReader(Reader):
     pembed_stop = re.compile(r'^\s*\]\s*$')
 
 
+    # first-character dispatch table of the 'dispatch' engine:
+    # command -> (handler, number of integer fields, required mode)
+    commands = {
+        'L': ('parseLine', 10, None),
+        'C': ('parseComponent', 5, 'schematic'),
+        'N': ('parseNet', 5, 'schematic'),
+        'P': ('parsePin', 7, 'symbol'),
+        'B': ('parseBox', 16, None),
+        'H': ('parseCustomPath', 13, None),
+        'V': ('parseCircle', 15, None),
+        'A': ('parseArc', 11, None),
+        'T': ('parseText', 9, None),
+        }
+    engines = ['dispatch', 'regexp']
+    version = 1 # bump whenever the recorded commands change
+
     def __init__(self, importer):
         Reader.__init__(self, importer.database)
         self.importer = importer
@@ -86,9 +272,21 @@ class GedaReader(Reader):
         self.inAttribute = False
         self.view = None
         self.match = None
+        self.stats = GedaFileStats(None, None)
+        self.setEngine(importer.engine)
+
+    def setEngine(self, engine):
+        self.engine = engine
+        if self.engine == 'regexp':
+            self.parseCommandText = self.parseCommandRegExp
+        else:
+            self.parseCommandText = self.parseCommandDispatch
 
     def readLine(self):
         return self.f.readline()
+
+    def readLines(self, n):
+        return self.f.readLines(n)
     
     def parseVersion(self):
         pass
@@ -97,120 +295,112 @@ class GedaReader(Reader):
         #self.last = a
         #self.view.addElem(a)
 
-    def parseLine(self):
-        m=self.match
-        l = Line(self.view, self._database.layers(), int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)))
+    def parseLine(self, p):
+        l = Line(self.view, self._database.layers(), p[0], p[1], p[2], p[3])
         self.last = l
 
-    def parseArc(self):
-        m=self.match
-        radius = 2 * int(m.group(3))
-        e = EllipseArc(self.view, self._database.layers(), int(m.group(1)), int(m.group(2)), radius, radius, int(m.group(4)), int(m.group(5)))
+    def parseArc(self, p):
+        radius = 2 * p[2]
+        e = EllipseArc(self.view, self._database.layers(), p[0], p[1], radius, radius, p[3], p[4])
         self.last = e
 
-    def parsePin(self):
-        m=self.match
+    def parsePin(self, p):
+        if p[6] == 1: # whichend, x1, y1 is the end that connects
+            p = [p[2], p[3], p[0], p[1]] + list(p[4:])
         if self.inSymbol:
-            p = SymbolPin(self.view, self._database.layers(), int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)))
+            pin = SymbolPin(self.view, self._database.layers(), p[0], p[1], p[2], p[3])
         elif self.inSchematic:
-            p = Pin(self.view, self._database.layers(), int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)))
-        self.last = p
+            pin = Pin(self.view, self._database.layers(), p[0], p[1], p[2], p[3])
+        self.last = pin
 
-    def parseNet(self):
-        m=self.match
-        n = NetSegment(self.view, self._database.layers(), int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)))
+    def parseNet(self, p):
+        n = NetSegment(self.view, self._database.layers(), p[0], p[1], p[2], p[3])
         self.last = n
 
-    def parseBox(self):
-        m=self.match
-        r = Rect(self.view, self._database.layers(), int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)))
+    def parseBox(self, p):
+        r = Rect(self.view, self._database.layers(), p[0], p[1], p[2], p[3])
         self.last = r
 
-    def parseCustomPath(self):
-        m=self.match
-        p = CustomPath(self.view, self._database.layers())
-        #, int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)))
-        for n in range(int(m.group(13))):
+    def parseCustomPath(self, p):
+        path = CustomPath(self.view, self._database.layers())
+        for n in range(p[12]):
             line = self.readLine()
             line = self.pnewlineStrip.sub('', line)
-            if (self.regExpSearch(self.ppath_move, line)):
-                p.moveTo(int(self.match.group(1)),
-                         int(self.match.group(2)))
-            elif (self.regExpSearch(self.ppath_line, line)):
-                p.lineTo(int(self.match.group(1)),
-                         int(self.match.group(2)))
-            elif (self.regExpSearch(self.ppath_curve, line)):
-                p.curveTo(int(self.match.group(1)),
-                          int(self.match.group(2)),
-                          int(self.match.group(3)),
-                          int(self.match.group(4)),
-                          int(self.match.group(5)),
-                          int(self.match.group(6)))
-            elif (self.regExpSearch(self.ppath_close, line)):
-                p.closePath()
-        p.setLayer(self._database.layers().layerByName('annotation2', 'drawing'))
-        self.last = p
-
-    def parseCircle(self):
-        m=self.match
-        radius = 2 * int(m.group(3))
-        c = Ellipse(self.view, self._database.layers(), int(m.group(1)), int(m.group(2)), radius, radius)
+            # every path command is tried against its own pattern only
+            c = line[:1]
+            if (c == 'M' and self.regExpSearch(self.ppath_move, line)):
+                path.moveTo(int(self.match.group(1)),
+                            int(self.match.group(2)))
+            elif (c == 'L' and self.regExpSearch(self.ppath_line, line)):
+                path.lineTo(int(self.match.group(1)),
+                            int(self.match.group(2)))
+            elif (c == 'C' and self.regExpSearch(self.ppath_curve, line)):
+                path.curveTo(int(self.match.group(1)),
+                             int(self.match.group(2)),
+                             int(self.match.group(3)),
+                             int(self.match.group(4)),
+                             int(self.match.group(5)),
+                             int(self.match.group(6)))
+            elif ((c == 'z' or c == 'Z') and
+                  self.regExpSearch(self.ppath_close, line)):
+                path.closePath()
+        path.setLayer(self._database.layers().layerByName('annotation2', 'drawing'))
+        self.last = path
+
+    def parseCircle(self, p):
+        radius = 2 * p[2]
+        c = Ellipse(self.view, self._database.layers(), p[0], p[1], radius, radius)
         self.last = c
 
-    def parseComponent(self):
-        m=self.match
-        symbolName = m.group(6)
-        #r = GedaReader(self.importer.database, self.library)
-        #r = self
-        #c = r.parseSymbol(symbolName)
-        cellName = self.psymStrip.sub('', m.group(6))
+    def parseComponent(self, p):
+        """
+        p holds the five integer fields followed by the symbol file name
+        """
+        cellName = self.psymStrip.sub('', p[5])
+        start = time.time()
         lib = self.importer.findCellSymbolLibrary(cellName)
-        #print m.group(6)
-        #c = self.importer.getCellByName(m.group(6))
-        #c = lib.cellByName(m.group(6))
+        self.stats.resolveSeconds += time.time() - start
         i = Instance(self.view, self._database.layers())
         
-        i.setXY(int(m.group(1)), int(m.group(2)))
-        i.setAngle(int(m.group(4)))
-        i.setHMirror(int(m.group(5)) == 1)
+        i.setXY(p[0], p[1])
+        i.setAngle(p[3])
+        i.setHMirror(p[4] == 1)
 
         if not lib: # or lib == self.importer.library:
             i.setInstanceCell('', cellName, 'symbol')
-            #i = Instance(self.view, int(m.group(1)), int(m.group(2)), int(m.group(4)), int(m.group(5)), '', cellName, 'symbol')
         else:
             i.setInstanceCell(self.importer.libPathAbsToRel(lib.path()), cellName, 'symbol')
-            #i = Instance(self.view, int(m.group(1)), int(m.group(2)), int(m.group(4)), int(m.group(5)), lib.name(), cellName, 'symbol')
         self.last = i
-        #self.view.addComponent(c)
 
-    def parseAttribute(self, mAttr):
+    def parseAttribute(self, p):
         m=self.match
         key = m.group(1)
         val = m.group(2)
         if (self.inAttribute):
-            # to be fixed
+            # attached to the element it follows, e.g. netname of a net
             a = AttributeLabel(self.view, self._database.layers(), key, val)
             #self.view.addElem(a)
             #a = AttributeLabel(self.last.instanceCellView(), self._database.layers(), key, val)
-            #self.last.addAttribute(a)
+            if self.last:
+                self.last.addAttribute(a)
         else:
             a = AttributeLabel(self.view, self._database.layers(), key, val)
             #self.view.addElem(a)
-        a.setXY(int(mAttr.group(1)), int(mAttr.group(2)))
-        #a.setLayer(None)  #int(mAttr.group(3))
-        a.setTextSize(int(mAttr.group(4))*13.888)
-        a.setVisible(int(mAttr.group(5)) == 1)
-        a.setVisibleKey(int(mAttr.group(6)) != 1)
-        #a.setVisibleValue(int(mAttr.group(6)) < 2)
-        a.setAngle(int(mAttr.group(7)))
-        align = int(mAttr.group(8))/3
+        a.setXY(p[0], p[1])
+        #a.setLayer(None)  #p[2]
+        a.setTextSize(p[3]*13.888)
+        a.setVisible(p[4] == 1)
+        a.setVisibleKey(p[5] != 1)
+        #a.setVisibleValue(p[5] < 2)
+        a.setAngle(p[6])
+        align = p[7]/3
         if align == 0:
             a.setHAlign(AttributeLabel.AlignLeft)
         elif align == 1:
             a.setHAlign(AttributeLabel.AlignCenter)
         else:
             a.setHAlign(AttributeLabel.AlignRight)
-        align = int(mAttr.group(8))%3
+        align = p[7]%3
         if align == 0:
             a.setVAlign(AttributeLabel.AlignBottom)
         elif align == 1:
@@ -218,31 +408,33 @@ class GedaReader(Reader):
         else:
             a.setVAlign(AttributeLabel.AlignTop)
 
-    def parseText(self):
-        m=self.match
-        text = ''
-        for n in range(int(m.group(9))):
-            text += self.readLine()
+    def parseAttributeStart(self, p):
+        self.inAttribute = True
+
+    def parseAttributeStop(self, p):
+        self.inAttribute = False
+
+    def parseText(self, p):
+        text = self.readLines(p[8])
         text = self.pnewlineStrip.sub('', text)
         if (self.regExpSearch(self.pattr, text)):
-            self.parseAttribute(m)
+            self.parseAttribute(p)
         else:
             l = Label(self.view, self._database.layers())
-            #l = Label(self.view, int(m.group(1)), int(m.group(2)), int(int(m.group(4))*13.888))
             l.setText(text)
-            l.setXY(int(m.group(1)), int(m.group(2)))
-            #l.setLayer(None)  #int(m.group(3))
-            l.setTextSize(int(int(m.group(4))*13.888))
-            l.setVisible(int(m.group(5)) == 1)
-            l.setAngle(int(m.group(7)))
-            align = int(m.group(8))/3
+            l.setXY(p[0], p[1])
+            #l.setLayer(None)  #p[2]
+            l.setTextSize(int(p[3]*13.888))
+            l.setVisible(p[4] == 1)
+            l.setAngle(p[6])
+            align = p[7]/3
             if align == 0:
                 l.setHAlign(Label.AlignLeft)
             elif align == 1:
                 l.setHAlign(Label.AlignCenter)
             else:
                 l.setHAlign(Label.AlignRight)
-            align = int(m.group(8))%3
+            align = p[7]%3
             if align == 0:
                 l.setVAlign(Label.AlignBottom)
             elif align == 1:
@@ -255,42 +447,105 @@ class GedaReader(Reader):
         self.match = regExp.search(text)
         return self.match
 
+    def intGroups(self):
+        return map(int, self.match.groups())
+
+    def command(self, handler, p):
+        "called by the engines for every recognized command"
+        getattr(self, handler)(p)
+
     def parseCommand(self, mode):
-        text = self.readLine()
+        self.parseCommandText(self.readLine(), mode)
+
+    def parseCommandRegExp(self, text, mode):
+        """
+        Original engine: try the command patterns one after another
+        """
         if self.regExpSearch(self.pline, text):
-            self.parseLine()
+            self.command('parseLine', self.intGroups())
         elif (mode == 'schematic' and
               self.regExpSearch(self.pcomponent, text)):
-            self.parseComponent()
+            m = self.match
+            self.command('parseComponent',
+                         map(int, m.groups()[:5]) + [m.group(6)])
         elif (mode == 'schematic' and
               self.regExpSearch(self.pnet, text)):
-            self.parseNet()
+            self.command('parseNet', self.intGroups())
         elif (mode == 'symbol' and
               self.regExpSearch(self.ppin, text)):
-            self.parsePin()
+            self.command('parsePin', self.intGroups())
         elif (self.regExpSearch(self.pbox, text)):
-            self.parseBox()
+            self.command('parseBox', self.intGroups())
         elif (self.regExpSearch(self.ppath, text)):
-            self.parseCustomPath()
+            self.command('parseCustomPath', self.intGroups())
         elif (self.regExpSearch(self.pcircle, text)):
-            self.parseCircle()
+            self.command('parseCircle', self.intGroups())
         elif (self.regExpSearch(self.parc, text)):
-            self.parseArc()
+            self.command('parseArc', self.intGroups())
         elif (self.regExpSearch(self.ptext, text)):
-            self.parseText()
+            self.command('parseText', self.intGroups())
         elif (self.regExpSearch(self.pattr_start, text)):
-            self.inAttribute = True
+            self.command('parseAttributeStart', [])
         elif (self.regExpSearch(self.pattr_stop, text)):
-            self.inAttribute = False
+            self.command('parseAttributeStop', [])
         elif (self.regExpSearch(self.peof, text)):
             self.eof = True
         else:
             self.error = False
             return
 
+    def parseCommandDispatch(self, text, mode):
+        """
+        Dispatch on the first character of the line, split the fields
+        once and convert all integer fields in one pass.
+        Lines it cannot tokenize are handed over to the regexp engine,
+        so both engines build exactly the same elements.
+        """
+        fields = text.split()
+        if not fields:
+            if text == '' or text == '\n':
+                self.eof = True
+            return
+        c = fields[0]
+        if c != text[0]:    # command must start the line
+            if c == '{' or c == '}':
+                self.parseCommandRegExp(text, mode)
+            return
+        command = self.commands.get(c)
+        if command:
+            (handler, n, requiredMode) = command
+            if requiredMode and requiredMode != mode:
+                return
+            try:
+                p = map(int, fields[1:n+1])
+            except ValueError:
+                self.parseCommandRegExp(text, mode)
+                return
+            if len(p) < n:
+                self.parseCommandRegExp(text, mode)
+                return
+            if c == 'C':
+                if len(fields) < 7:
+                    return
+                p.append(fields[6])
+            self.command(handler, p)
+        elif c == '{':
+            if len(fields) == 1:
+                self.command('parseAttributeStart', [])
+        elif c == '}':
+            if len(fields) == 1:
+                self.command('parseAttributeStop', [])
+
 
-    def parseFile(self, fileName, mode):
-        self.f = open(fileName, 'r')
+    def parseFile(self, source, mode, records=None):
+        """
+        source is a file name, an open stream (e.g. a pipe or
+        an archive member) or a GedaLineSource
+        """
+        if records is not None:
+            return self.parseRecords(records)
+        self.f = GedaLineSource.fromSource(source)
+        self.stats.lines = self.f.lineCount()
         self.error = False
         self.eof = False
         self.last = None
@@ -305,8 +560,23 @@ class GedaReader(Reader):
             self.parseCommand(mode)
         self.f.close()
         return self.view
+
+    def parseRecords(self, records):
+        """
+        Build the elements from commands recorded by GedaRecorder,
+        the text lines each command consumes are served from its body
+        """
+        self.last = None
+        self.stats.origin = 'records'
+        # the version line, the commands and their bodies
+        self.stats.lines = 1 + len(records) + sum(
+            b.count('\n') for (handler, p, body) in records for b in body)
+        for (handler, p, body) in records:
+            self.f = GedaLineSource(''.join(body))
+            getattr(self, handler)(p)
+        return self.view
     
-    def parseSchematic(self, fileName, cellView):
+    def parseSchematic(self, fileName, cellView, records=None):
         self.inSchematic = True
         mode = 'schematic'
         self.view = cellView
@@ -324,12 +594,24 @@ class GedaReader(Reader):
         ##self.view = Schematic('schematic')
         #self.cell.addCellView(self.view)
         self.view.setUU(self.uu)
-        schematic = self.parseFile(fileName, mode)
+        self.beginStats(fileName, mode)
+        schematic = self.parseFile(fileName, mode, records)
+        start = time.time()
         schematic.checkNetSegments()
+        self.stats.netSegmentsSeconds = time.time() - start
+        start = time.time()
         schematic.checkSolderDots()
+        self.stats.solderDotsSeconds = time.time() - start
+        start = time.time()
+        missing = set(i.resolutionKey() for i in schematic.resolveInstances())
+        self.stats.resolveSeconds += time.time() - start
+        for (libPath, cellName, cellViewName) in sorted(missing):
+            print 'Missing symbol', libPath + '/' + cellName, 'in', \
+                schematic.library().path() + '/' + schematic.cell().name()
+        self.endStats()
         return schematic
 
-    def parseSymbol(self, fileName, cellView):
+    def parseSymbol(self, fileName, cellView, records=None):
         self.inSymbol = True
         mode = 'symbol'
         self.view = cellView
@@ -350,7 +632,182 @@ class GedaReader(Reader):
         ##self.view = Symbol('symbol')
         #self.cell.addCellView(self.view)
         self.view.setUU(self.uu)
-        return self.parseFile(fileName, mode)
+        self.beginStats(fileName, mode)
+        symbol = self.parseFile(fileName, mode, records)
+        self.endStats()
+        return symbol
+
+    def beginStats(self, source, mode):
+        if isinstance(source, basestring):
+            name = source
+        else:
+            name = self.view.library().path() + '/' + self.view.cell().name()
+        self.stats = self.importer.stats.begin(name, mode)
+        self.start = time.time()
+
+    def endStats(self):
+        self.stats.seconds += time.time() - self.start
+        self.stats.countElements(self.view)
+
+
+class GedaRecorder(GedaReader):
+    """
+    Tokenizes a gEDA file into a picklable list of
+    (handler, fields, body lines) commands instead of building elements,
+    so that files can be parsed in worker processes and the elements
+    built later by GedaReader.parseRecords
+    """
+    bodyLengths = {
+        'parseText': 8,
+        'parseCustomPath': 12,
+        }
+
+    def __init__(self, engine='dispatch'):
+        self.inAttribute = False
+        self.match = None
+        self.stats = GedaFileStats(None, None)
+        self.setEngine(engine)
+
+    def command(self, handler, p):
+        body = []
+        if self.bodyLengths.has_key(handler):
+            body.append(self.readLines(p[self.bodyLengths[handler]]))
+        self.records.append((handler, p, body))
+
+    def record(self, source, mode):
+        self.records = []
+        self.view = None
+        self.parseFile(source, mode)
+        return self.records
+
+
+class GedaCache():
+    """
+    On-disk cache of the cell views built from gEDA files, each kept
+    as a single cell view snapshot (see Database.Snapshot), so that a
+    later import only registers the cached cell views and reads their
+    elements back when they are first used, without parsing.
+    An entry is named after a hash of its key: the absolute file path,
+    mode, size, modification time, the reader and snapshot versions
+    and a context, the library path and for schematics the symbols
+    their instances resolve against. A changed file misses and its
+    old entry ages out: least recently used entries are evicted once
+    the cache grows over maxSize bytes. Failing to read or write the
+    cache only costs a miss, a directory that can't be created
+    disables it.
+    """
+    def __init__(self, directory, maxSize=256*1024*1024):
+        self._directory = os.path.expanduser(directory)
+        self._maxSize = maxSize
+        self._stored = False
+        if not os.path.isdir(self._directory):
+            try:
+                os.makedirs(self._directory)
+            except EnvironmentError:
+                self._directory = None
+
+    def directory(self):
+        return self._directory
+
+    def key(self, fileName, mode, context):
+        fileName = os.path.abspath(fileName)
+        st = os.stat(fileName)
+        return (fileName, mode, st.st_size, st.st_mtime,
+                GedaReader.version, snapshotVersion, context)
+
+    def entryFileName(self, key):
+        name = hashlib.sha1(repr(key)).hexdigest()
+        return os.path.join(self._directory, name + '.cache')
+
+    def entry(self, fileName, mode, context):
+        "the entry of a file or None if there is no valid one"
+        if not self._directory:
+            return None
+        entry = self.entryFileName(self.key(fileName, mode, context))
+        try:
+            os.utime(entry, None)
+        except EnvironmentError:
+            return None
+        return entry
+
+    def load(self, entry, cellView):
+        "fill a cell view from an entry, False if it can't be read"
+        try:
+            loadCellView(entry, cellView)
+        except Exception:
+            return False
+        return True
+
+    def store(self, fileName, mode, context, cellView):
+        if not self._directory:
+            return
+        entry = self.entryFileName(self.key(fileName, mode, context))
+        tmp = entry + '.' + str(os.getpid())
+        try:
+            writeCellView(cellView, tmp)
+            if os.path.exists(entry):
+                os.remove(entry)
+            os.rename(tmp, entry)
+        except Exception:
+            # e.g. a full disk, the file is just not cached
+            try:
+                os.remove(tmp)
+            except EnvironmentError:
+                pass
+            return
+        self._stored = True
+
+    def entries(self):
+        "(mtime, size, file name) of the entries, not of files being written"
+        entries = []
+        try:
+            names = os.listdir(self._directory)
+        except EnvironmentError:
+            return entries
+        for name in names:
+            if not name.endswith('.cache'):
+                continue
+            entry = os.path.join(self._directory, name)
+            try:
+                st = os.stat(entry)
+            except EnvironmentError:
+                continue # removed by another import meanwhile
+            entries.append((st.st_mtime, st.st_size, entry))
+        return entries
+
+    def evict(self):
+        "remove the least recently used entries above the size limit"
+        if not self._stored:
+            return
+        self._stored = False
+        entries = self.entries()
+        size = sum(entrySize for (mtime, entrySize, entry) in entries)
+        entries.sort()
+        for (mtime, entrySize, entry) in entries:
+            if size <= self._maxSize:
+                break
+            try:
+                os.remove(entry)
+            except EnvironmentError:
+                pass
+            size -= entrySize
+
+    def clear(self):
+        if not self._directory:
+            return
+        for (mtime, size, entry) in self.entries():
+            try:
+                os.remove(entry)
+            except EnvironmentError:
+                pass
+
+
+def recordGedaFile(args):
+    "worker process entry point of the parallel import"
+    (fileName, mode, engine) = args
+    start = time.time()
+    records = GedaRecorder(engine).record(fileName, mode)
+    return (records, time.time() - start)
 
 
 
@@ -358,19 +815,112 @@ class GedaImporter(Importer):
     pstrip = re.compile(r'(\.sch|\.sym)$')
     psymStrip = re.compile(r'\.sym$')
     pschStrip = re.compile(r'\.sch$')
-    def __init__(self, database):
+    def __init__(self, database, engine='dispatch', processes=1, lazy=False,
+                 cacheDirectory=None):
+        """
+        processes is the number of worker processes parsing the files,
+        1 imports serially, None uses one process per CPU.
+        With lazy set, symbols are only registered during the import
+        and parsed the first time their contents are needed.
+        With cacheDirectory set, the cell views built from the files are
+        kept in a GedaCache. Cached symbols and schematics are then only
+        registered, lazy or not, and read from the cache when first used.
+        """
         Importer.__init__(self, database)
         self.database = database
+        self.engine = engine
+        self.processes = processes
+        self.lazy = lazy
+        self.cache = None
+        if cacheDirectory:
+            self.cache = GedaCache(cacheDirectory)
         self.componentLibraryList = []
         self.sourceLibraryList = []
+        # imported file name -> (library path, mode, size, mtime)
+        self.manifest = {}
+        self.stats = GedaImportStats()
+        self._symbolSignature = None
         
     def importLibraryList(self, componentList, sourceList):
         self.componentLibraryList = componentList
         self.sourceLibraryList = sourceList
-        for l in self.componentLibraryList:
-            self.importComponentLibrary(l)
-        for l in self.sourceLibraryList:
-            self.importSourceLibrary(l)
+        self._symbolSignature = None
+        with self.database.bulkUpdate():
+            if self.processes != 1:
+                self.importLibraryListParallel()
+            else:
+                for l in self.componentLibraryList:
+                    self.importComponentLibrary(l)
+                for l in self.sourceLibraryList:
+                    self.importSourceLibrary(l)
+        if self.cache:
+            self.cache.evict()
+
+    def symbolSignature(self):
+        """
+        Hash of the symbol cells of all libraries, the instances of a
+        schematic resolve against them. Computed once per import, after
+        the symbols have been registered.
+        """
+        if self._symbolSignature is None:
+            names = []
+            libs = list(self.database.libraries())
+            while libs:
+                lib = libs.pop()
+                libs.extend(lib.libraries())
+                for c in lib.cells():
+                    if c.cellViewByName('symbol'):
+                        names.append(lib.path() + '/' + c.name())
+            names.sort()
+            self._symbolSignature = hashlib.sha1('\n'.join(names)).hexdigest()
+        return self._symbolSignature
+
+    def cacheContext(self, libraryPath, mode):
+        "what a cell view built from a file depends on besides the file"
+        if mode == 'schematic':
+            return libraryPath + '\n' + self.symbolSignature()
+        return libraryPath
+
+    def cachedCellView(self, f, mode, cv):
+        "let cv load from the cache when first used, False on a miss"
+        if not self.cache:
+            return False
+        entry = self.cache.entry(f, mode, self.cacheContext(cv.library().path(), mode))
+        if not entry:
+            return False
+        cv.setLoader(self.cacheLoader(f, mode, entry))
+        return True
+
+    def cacheLoader(self, fileName, mode, entry):
+        "loader of a cached cell view, parsing the file if the entry is unreadable"
+        def load(cv):
+            stats = self.stats.begin(fileName, mode)
+            stats.origin = 'cache'
+            start = time.time()
+            if self.cache.load(entry, cv):
+                stats.seconds += time.time() - start
+                stats.countElements(cv)
+            else:
+                self.stats.files.remove(stats)
+                cv.clear()
+                self.buildCellView(fileName, mode, cv)
+        return load
+
+    def fileLoader(self, fileName, mode):
+        "loader of a lazily imported cell view"
+        return lambda cv: self.buildCellView(fileName, mode, cv)
+
+    def buildCellView(self, fileName, mode, cv, records=None):
+        "parse a file, or replay its records, into cv and cache the result"
+        self.library = cv.library()
+        self.cell = cv.cell()
+        r = GedaReader(self)
+        if mode == 'symbol':
+            r.parseSymbol(fileName, cv, records)
+        else:
+            r.parseSchematic(fileName, cv, records)
+        if self.cache:
+            self.cache.store(fileName, mode, self.cacheContext(cv.library().path(), mode), cv)
                 
     def libPathAbsToRel(self, libPath):
         l = self.library.path()
@@ -384,27 +934,14 @@ class GedaImporter(Importer):
             return libPath
     
     def findCellSymbolLibrary(self, cellName, library=None, checkAbove=True):
+        """
+        Library of the symbol nearest to library (the current one by
+        default): first library itself and its sub-libraries, then
+        recursively the ones above it
+        """
         if not library:
             library = self.library
-        #print self.__class__.__name__, library.path()
-        #first current library
-        if library.cellViewByName(cellName, 'symbol'):
-            return library
-        #then recursively any sub-libraries (without going above)
-        for l in library.libraries():
-            lib = self.findCellSymbolLibrary(cellName, l, False)
-            if lib:
-                return lib
-        #if that fails try recursively one level above
-        if checkAbove:
-            if library.parentLibrary():
-                return self.findCellSymbolLibrary(cellName, library.parentLibrary())
-            else:
-                for l in library.database().libraries():
-                    lib = self.findCellSymbolLibrary(cellName, l, False)
-                    if lib:
-                        return lib
-        return None
+        return self.database.nearestLibrary(cellName, 'symbol', library, checkAbove)
 
     def findCellSymbolLibrary_(self, cellName):
         cell = self.database.cellViewByName(self.library.name(), cellName, 'symbol')
@@ -423,83 +960,402 @@ class GedaImporter(Importer):
         f = os.path.basename(fileName)
         return self.pstrip.sub('', f)
     
+    def libraryFiles(self, directory, pattern):
+        "sorted list of files in a library directory matching the pattern"
+        directory = os.path.expanduser(directory)
+        if not (os.path.exists(directory) and
+                os.path.isdir(directory)):
+            return []
+        files = os.listdir(directory)
+        files = map(
+            lambda f: os.path.join(directory, f),
+            files)
+        files = filter(
+            lambda f: os.path.isfile(f) and pattern.search(f),
+            files)
+        return sorted(files)
+
     def importComponentLibrary(self, lib):
         library = lib[0]
-        directory = lib[1]
-        directory = os.path.expanduser(directory)
+        for f in self.libraryFiles(lib[1], self.psymStrip):
+            self.importComponentFile(library, f)
 
-        if (os.path.exists(directory) and
-            os.path.isdir(directory)):
-            files = os.listdir(directory)
-            files = map(
-                lambda f: os.path.join(directory, f),
-                files)
-            files = filter(
-                lambda f: os.path.isfile(f) and self.psymStrip.search(f),
-                files)
-            for f in files:
-                #f = os.path.join(directory, f)
-                #print f, os.path.isfile(f) #, self.psymStrip.search(f)
-                #if os.path.isfile(f) and self.psymStrip.search(f):
-                if (not self.database.cellViewByName(library, self.cellName(f), 'symbol')):
-                    print 'Importing component symbol', f
-                    self.library = self.database.libraryByPath(library)
-                    if not self.library:
-                        #self.library = self.database.newLibrary(library)
-                        self.library = self.database.makeLibraryFromPath(library)
-                        #self.library = Library(library, self.database)
-                        #self.database.addLibrary(self.library)
-                    self.cell = self.library.cellByName(self.cellName(f))
-                    if not self.cell:
-                        self.cell = Cell(self.cellName(f), self.library)
-                        #self.library.addCell(self.cell)
-                    cv = self.cell.cellViewByName('symbol')
-                    if not cv:
-                        cv = Symbol('symbol', self.cell)
-                        #self.cell.addCellView(cv)
-                        r = GedaReader(self)
-                        cv = r.parseSymbol(f, cv)
-                    #cv = r.parseSymbol(f)
-                    #self.cell.addCellView(cv)
+    def importComponentFile(self, library, f, records=None):
+        if (not self.database.cellViewByName(library, self.cellName(f), 'symbol')):
+            print 'Importing component symbol', f
+            self.library = self.database.libraryByPath(library)
+            if not self.library:
+                self.library = self.database.makeLibraryFromPath(library)
+            self.cell = self.library.cellByName(self.cellName(f))
+            if not self.cell:
+                self.cell = Cell(self.cellName(f), self.library)
+            cv = self.cell.cellViewByName('symbol')
+            if not cv:
+                self.manifest[f] = (library, 'symbol') + self.fileStamp(f)
+                cv = Symbol('symbol', self.cell)
+                if records is None and self.cachedCellView(f, 'symbol', cv):
+                    return
+                if self.lazy and records is None:
+                    cv.setLoader(self.fileLoader(f, 'symbol'))
                 else:
-                    print 'Skipping component symbol', f
+                    self.buildCellView(f, 'symbol', cv, records)
+        else:
+            print 'Skipping component symbol', f
 
     def importSourceLibrary(self, lib):
         library = lib[0]
-        directory = lib[1]
-        directory = os.path.expanduser(directory)
-        
-        if (os.path.exists(directory) and
-            os.path.isdir(directory)):
-            files = os.listdir(directory)
-            files = map(
-                lambda f: os.path.join(directory, f),
-                files)
-            files = filter(
-                lambda f: os.path.isfile(f) and self.pschStrip.search(f),
-                files)
-            for f in files:
-                #f = os.path.join(directory, f)
-                if (not self.database.cellViewByName(library, self.cellName(f), 'schematic')):
-                    print 'Importing schematic', f
-                    self.library = self.database.libraryByPath(library)
-                    if not self.library:
-                        #self.library = self.database.newLibrary(library)
-                        self.library = self.database.makeLibraryFromPath(library)
-                        #self.library = Library(library)
-                        #self.database.addLibrary(self.library)
-                    self.cell = self.library.cellByName(self.cellName(f))
-                    if not self.cell:
-                        self.cell = Cell(self.cellName(f), self.library)
-                        #self.library.addCell(self.cell)
-                    cv = self.cell.cellViewByName('schematic')
-                    if not cv:
-                        cv = Schematic('schematic', self.cell)
-                        #self.cell.addCellView(cv)
-                        r = GedaReader(self)
-                        r.parseSchematic(f, cv)
-                    #self.cell.addCellView(cv)
-                else:
-                    print 'Skipping component schematic', f
+        for f in self.libraryFiles(lib[1], self.pschStrip):
+            self.importSourceFile(library, f)
+
+    def importSourceFile(self, library, f, records=None):
+        if (not self.database.cellViewByName(library, self.cellName(f), 'schematic')):
+            print 'Importing schematic', f
+            self.library = self.database.libraryByPath(library)
+            if not self.library:
+                self.library = self.database.makeLibraryFromPath(library)
+            self.cell = self.library.cellByName(self.cellName(f))
+            if not self.cell:
+                self.cell = Cell(self.cellName(f), self.library)
+            cv = self.cell.cellViewByName('schematic')
+            if not cv:
+                self.manifest[f] = (library, 'schematic') + self.fileStamp(f)
+                cv = Schematic('schematic', self.cell)
+                if records is None and self.cachedCellView(f, 'schematic', cv):
+                    return
+                self.buildCellView(f, 'schematic', cv, records)
+        else:
+            print 'Skipping component schematic', f
+
+    def importStream(self, library, cellName, mode, source):
+        """
+        Import a 'symbol' or 'schematic' cell view from an open stream
+        (e.g. a pipe or an archive member) or from a string holding
+        the file contents
+        """
+        if isinstance(source, str):
+            source = GedaLineSource(source)
+        with self.database.bulkUpdate():
+            self.library = self.database.libraryByPath(library)
+            if not self.library:
+                self.library = self.database.makeLibraryFromPath(library)
+            self.cell = self.library.cellByName(cellName)
+            if not self.cell:
+                self.cell = Cell(cellName, self.library)
+            cv = self.cell.cellViewByName(mode)
+            if cv:
+                print 'Skipping', mode, library + '/' + cellName
+                return cv
+            print 'Importing', mode, library + '/' + cellName
+            r = GedaReader(self)
+            if mode == 'symbol':
+                cv = Symbol('symbol', self.cell)
+                r.parseSymbol(source, cv)
+            else:
+                cv = Schematic('schematic', self.cell)
+                r.parseSchematic(source, cv)
+        return cv
+
+    def fileStamp(self, fileName):
+        st = os.stat(fileName)
+        return (st.st_size, st.st_mtime)
+
+    def refreshLibraryList(self):
+        """
+        Incrementally re-import the libraries of the previous
+        importLibraryList: files added or changed since then are
+        (re)parsed in place, cells of deleted files are removed
+        """
+        files = set()
+        self._symbolSignature = None
+        with self.database.bulkUpdate():
+            for l in self.componentLibraryList:
+                for f in self.libraryFiles(l[1], self.psymStrip):
+                    files.add(f)
+                    self.refreshFile(l[0], f, 'symbol')
+            for l in self.sourceLibraryList:
+                for f in self.libraryFiles(l[1], self.pschStrip):
+                    files.add(f)
+                    self.refreshFile(l[0], f, 'schematic')
+            for f in sorted(self.manifest.keys()):
+                if not f in files:
+                    self.removeFile(f)
+        if self.cache:
+            self.cache.evict()
+
+    def refreshFile(self, library, f, mode):
+        entry = self.manifest.get(f)
+        cv = self.database.cellViewByName(library, self.cellName(f), mode)
+        if not entry or not cv:
+            if mode == 'symbol':
+                self.importComponentFile(library, f)
+            else:
+                self.importSourceFile(library, f)
+            return
+        stamp = self.fileStamp(f)
+        if entry[2:] == stamp:
+            return
+        print 'Refreshing', f
+        self.manifest[f] = (library, mode) + stamp
+        if not cv.loaded():
+            if not self.cachedCellView(f, mode, cv):
+                cv.setLoader(self.fileLoader(f, mode))
+            return
+        # the elements are replaced through removeElem/addElem,
+        # so open scenes and instance items follow the change
+        cv.clear()
+        self.buildCellView(f, mode, cv)
+
+    def removeFile(self, f):
+        (library, mode) = self.manifest[f][:2]
+        del self.manifest[f]
+        cell = self.database.cellByName(library, self.cellName(f))
+        if not cell:
+            return
+        print 'Removing', f
+        cv = cell.cellViewByName(mode)
+        if cv:
+            cv.remove()
+        if len(cell.cellViews()) == 0:
+            cell.remove()
+
+    def importLibraryListParallel(self):
+        """
+        Tokenize all files in a pool of worker processes, then build
+        the cell views here in the same order as the serial import.
+        All symbols are built before any schematic, so that instances
+        resolve against the complete set of symbol libraries.
+        """
+        symbolFiles = []
+        for l in self.componentLibraryList:
+            for f in self.libraryFiles(l[1], self.psymStrip):
+                symbolFiles.append((l[0], f))
+        schematicFiles = []
+        for l in self.sourceLibraryList:
+            for f in self.libraryFiles(l[1], self.pschStrip):
+                schematicFiles.append((l[0], f))
+        # files whose cell views already exist are not worth sending over,
+        # neither are lazily imported symbols
+        symbolJobs = filter(
+            lambda (library, f): not self.database.cellViewByName(library, self.cellName(f), 'symbol'),
+            symbolFiles)
+        if self.lazy:
+            symbolJobs = []
+        schematicJobs = filter(
+            lambda (library, f): not self.database.cellViewByName(library, self.cellName(f), 'schematic'),
+            schematicFiles)
+        symbolRecords = {}
+        schematicRecords = {}
+        # cached cell views are registered by the import itself
+        symbolJobs = self.uncachedJobs(symbolJobs, 'symbol')
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            symbolResult = self.submitJobs(pool, symbolJobs, 'symbol')
+            if not self.cache:
+                schematicResult = self.submitJobs(pool, schematicJobs, 'schematic')
+            self.storeJobs(symbolJobs, 'symbol', symbolResult.get(), symbolRecords)
+            for (library, f) in symbolFiles:
+                self.importComponentFile(library, f, symbolRecords.get((library, f)))
+            if self.cache:
+                # the cache entries of schematics depend on the symbols
+                schematicJobs = self.uncachedJobs(schematicJobs, 'schematic')
+                schematicResult = self.submitJobs(pool, schematicJobs, 'schematic')
+            pool.close()
+            self.storeJobs(schematicJobs, 'schematic', schematicResult.get(), schematicRecords)
+            for (library, f) in schematicFiles:
+                self.importSourceFile(library, f, schematicRecords.get((library, f)))
+        except:
+            # a failed worker or file, don't leave the workers behind
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def submitJobs(self, pool, jobs, mode):
+        return pool.map_async(
+            recordGedaFile,
+            map(lambda (library, f): (f, mode, self.engine), jobs))
+
+    def uncachedJobs(self, jobs, mode):
+        "the jobs without a cache entry"
+        if not self.cache:
+            return jobs
+        return filter(
+            lambda (library, f): not normalizeLibraryPath(library) or not self.cache.entry(
+                f, mode, self.cacheContext(normalizeLibraryPath(library), mode)),
+            jobs)
+
+    def storeJobs(self, jobs, mode, results, records):
+        for (job, (r, seconds)) in zip(jobs, results):
+            records[job] = r
+            self.stats.recorded(job[1], mode, seconds)
+
+
+class NativeReader(Reader):
+    """
+    Reads the diagrams written by Diagram.save. The file is parsed
+    incrementally, every top level element is built as soon as its end
+    tag is read and then dropped, so memory does not grow with the file.
+    """
+    def __init__(self, database):
+        Reader.__init__(self, database)
+        self.view = None
+        self.layers = database.layers()
+        # tag -> handler building the element, None if it is not needed
+        self.handlers = {
+            'line': self.parseLine,
+            'rect': self.parseRect,
+            'custom_path': self.parseCustomPath,
+            'ellipse': self.parseEllipse,
+            'ellipse_arc': self.parseEllipseArc,
+            'label': self.parseLabel,
+            'attributeLabel': self.parseAttributeLabel,
+            'net_segment': self.parseNetSegment,
+            'solder_dot': self.parseSolderDot,
+            'pin': self.parsePin,
+            'symbol_pin': self.parseSymbolPin,
+            'instance': self.parseInstance,
+            }
+
+    def parseSchematic(self, fileName, cellView):
+        return self.parseDiagram(fileName, cellView)
+
+    def parseSymbol(self, fileName, cellView):
+        return self.parseDiagram(fileName, cellView)
+
+    def parseDiagram(self, source, cellView):
+        "source is a file name or an open stream"
+        self.view = cellView
+        root = None
+        depth = 0
+        for (event, x) in cElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if root is None:
+                    root = x
+                    self.parseDiagramAttributes(x)
+            else:
+                depth -= 1
+                if depth == 1:
+                    self.parseElement(x)
+                    root.clear()
+        return cellView
+
+    def parseDiagramAttributes(self, x):
+        for (key, value) in x.attrib.items():
+            if key == 'uu':
+                self.view.setUU(self.number(value))
+            else:
+                self.view.attributes()[key] = value
+
+    def number(self, text):
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+    def numbers(self, x, *keys):
+        return [self.number(x.get(k)) for k in keys]
+
+    def parseElement(self, x):
+        handler = self.handlers.get(x.tag)
+        if not handler:
+            print 'Unknown element', x.tag
+            return None
+        e = handler(x)
+        if e is None:
+            return None
+        if x.get('angle'):
+            e.setAngle(self.number(x.get('angle')))
+        if x.get('hmirror') == 'True':
+            e.setHMirror(True)
+        if x.get('vmirror') == 'True':
+            e.setVMirror(True)
+        if x.get('visible') == 'False':
+            e.setVisible(False)
+        layer = x.get('layer')
+        if layer is not None and self.layers:
+            layer = self.layers.layerByName(layer, x.get('layerType', 'drawing'))
+            if layer and layer is not e.layer():
+                e.setLayer(layer)
+        for child in x:
+            if child.tag == 'attributeLabel':
+                a = self.parseElement(child)
+                if a:
+                    e.addAttribute(a)
+        return e
+
+    def parseLine(self, x):
+        return Line(self.view, self.layers, *self.numbers(x, 'x', 'y', 'x2', 'y2'))
+
+    def parseRect(self, x):
+        return Rect(self.view, self.layers, *self.numbers(x, 'x', 'y', 'w', 'h'))
+
+    def parseCustomPath(self, x):
+        path = CustomPath(self.view, self.layers)
+        for line in (x.text or '').splitlines():
+            p = [self.number(v) for v in line.split()]
+            if not p:
+                continue
+            if p[0] == CustomPath.move:
+                path.moveTo(*p[1:])
+            elif p[0] == CustomPath.line:
+                path.lineTo(*p[1:])
+            elif p[0] == CustomPath.curve:
+                path.curveTo(*p[1:])
+            elif p[0] == CustomPath.close:
+                path.closePath()
+        (x0, y0) = self.numbers(x, 'x', 'y')
+        if (x0, y0) != (path.x(), path.y()):
+            path.setXY(x0, y0)
+        return path
+
+    def parseEllipse(self, x):
+        return Ellipse(self.view, self.layers,
+                       *self.numbers(x, 'x', 'y', 'radiusX', 'radiusY'))
+
+    def parseEllipseArc(self, x):
+        return EllipseArc(self.view, self.layers,
+                          *self.numbers(x, 'x', 'y', 'radiusX', 'radiusY',
+                                        'startAngle', 'spanAngle'))
+
+    def parseText(self, l, x):
+        l.setXY(*self.numbers(x, 'x', 'y'))
+        l.setTextSize(self.number(x.get('size')))
+        l.setHAlign(int(x.get('halign')))
+        l.setVAlign(int(x.get('valign')))
+
+    def parseLabel(self, x):
+        l = Label(self.view, self.layers)
+        l.setText(x.text or '')
+        self.parseText(l, x)
+        return l
+
+    def parseAttributeLabel(self, x):
+        attr = x.find('attribute')
+        a = AttributeLabel(self.view, self.layers, attr.get('name'), attr.text or '')
+        a.attribute().setType(attr.get('type'))
+        self.parseText(a, x)
+        a.setVisibleKey(x.get('visibleKey') == 'True')
+        return a
+
+    def parseNetSegment(self, x):
+        return NetSegment(self.view, self.layers, *self.numbers(x, 'x', 'y', 'x2', 'y2'))
+
+    def parseSolderDot(self, x):
+        "junction dots come back with the net segments, others are kept"
+        (x0, y0) = self.numbers(x, 'x', 'y')
+        if self.view.solderDotAt(x0, y0):
+            return None
+        return SolderDot(self.view, self.layers, x0, y0)
+
+    def parsePin(self, x):
+        return Pin(self.view, self.layers, *self.numbers(x, 'x', 'y', 'x2', 'y2'))
 
+    def parseSymbolPin(self, x):
+        return SymbolPin(self.view, self.layers, *self.numbers(x, 'x', 'y', 'x2', 'y2'))
 
+    def parseInstance(self, x):
+        i = Instance(self.view, self.layers)
+        i.setXY(*self.numbers(x, 'x', 'y'))
+        i.setInstanceCell(x.get('libPath'), x.get('cell'), x.get('view'))
+        return i
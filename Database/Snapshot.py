@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+# Headless use, e.g.:
+#   python -m Database.Snapshot -y /sym=../sym -s /sch=../sch -o libs.snap
+#   python -m Database.Snapshot libs.snap
+
+import sys
+import mmap
+import time
+import struct
+import optparse
+
+from Database.Primitives import *
+from Database.CellViews import *
+from Database.Cells import *
+
+# File layout, all little endian:
+#   header       magic, version, then (count, offset) of every table
+#   strings      (offset, length, unicode) per string, then the string
+#                bytes, unicode strings UTF-8 encoded
+#   libraries    (name, parent library or -1) per library, parents first
+#   cells        (name, library) per cell
+#   cellViews    (cell, name, class name, uu, elements offset, count)
+#   elements     one record per element of a cell view, see packElement
+# Names are indices into the string table.
+
+magic = 'PSCHSNAP'
+version = 2
+header = struct.Struct('<8sI8I')
+stringEntry = struct.Struct('<IIB')
+libraryEntry = struct.Struct('<Ii')
+cellEntry = struct.Struct('<II')
+cellViewEntry = struct.Struct('<IIIdII')
+# kind, flags, owner (record index or -1), layer name, layer type,
+# number count, string count; followed by the numbers as doubles, the
+# string indices and a bit mask of the numbers that are floats,
+# (number count + 7) / 8 bytes
+recordHeader = struct.Struct('<BBiIIHH')
+noString = 0xffffffff
+
+# record kinds, the element names
+kinds = ['line', 'rect', 'custom_path', 'ellipse', 'ellipse_arc', 'label',
+         'attributeLabel', 'net_segment', 'solder_dot', 'pin', 'symbol_pin',
+         'instance']
+kindCodes = dict((k, n) for (n, k) in enumerate(kinds))
+HMirror, VMirror, Hidden, VisibleKey = 1, 2, 4, 8
+
+diagramClasses = {'Schematic': Schematic, 'Symbol': Symbol}
+pathArguments = {CustomPath.move: 2, CustomPath.line: 2,
+                 CustomPath.curve: 6, CustomPath.close: 0}
+
+
+class SnapshotWriter():
+    """
+    Writes all libraries, cells and diagrams of a database to a
+    snapshot file, or only the given cell views and the libraries and
+    cells holding them. Lazy cell views are loaded on the way.
+    """
+    def __init__(self, database, cellViews=None):
+        self._database = database
+        if cellViews is not None:
+            cellViews = set(cellViews)
+        self._cellViews = cellViews
+        self._strings = []
+        self._stringIds = {}
+
+    def string(self, s):
+        "string table index of s"
+        if s is None:
+            return noString
+        if isinstance(s, unicode):
+            s = (s.encode('utf-8'), True)
+        else:
+            s = (str(s), False)
+        n = self._stringIds.get(s)
+        if n is None:
+            n = len(self._strings)
+            self._strings.append(s)
+            self._stringIds[s] = n
+        return n
+
+    def libraries(self):
+        "the libraries written, parents ahead of their sub-libraries"
+        if self._cellViews is not None:
+            libs = set()
+            for cv in self._cellViews:
+                lib = cv.library()
+                while lib and not lib in libs:
+                    libs.add(lib)
+                    lib = lib.parentLibrary()
+            return sorted(libs, key=lambda l: (l.path().count('/'), l.path()))
+        result = []
+        libs = sorted(self._database.libraries(), key=Library.name)
+        while libs:
+            lib = libs.pop(0)
+            result.append(lib)
+            libs.extend(sorted(lib.libraries(), key=Library.name))
+        return result
+
+    def write(self, fileName):
+        libraries = self.libraries()
+        libraryIndex = dict((l, n) for (n, l) in enumerate(libraries))
+        cells = []
+        for l in libraries:
+            cells.extend(sorted(l.cells(), key=Cell.name))
+        if self._cellViews is not None:
+            wanted = set(cv.cell() for cv in self._cellViews)
+            cells = [c for c in cells if c in wanted]
+        cellIndex = dict((c, n) for (n, c) in enumerate(cells))
+        f = open(fileName, 'wb')
+        try:
+            f.write('\0' * header.size) # filled in at the end
+            # element records first, they add to the string table
+            views = []
+            for c in cells:
+                for cv in sorted(c.cellViews(), key=lambda cv: cv.name()):
+                    if not cv.__class__.__name__ in diagramClasses:
+                        continue
+                    if self._cellViews is not None and not cv in self._cellViews:
+                        continue
+                    offset = f.tell()
+                    count = self.writeElements(f, cv)
+                    views.append((cellIndex[c], self.string(cv.name()),
+                                  self.string(cv.__class__.__name__),
+                                  float(cv.uu()), offset, count))
+            libraryTable = [(self.string(l.name()),
+                             libraryIndex.get(l.parentLibrary(), -1))
+                            for l in libraries]
+            cellTable = [(self.string(c.name()), libraryIndex[c.library()])
+                         for c in cells]
+            tables = []
+            tables.append((len(libraryTable), f.tell()))
+            for e in libraryTable:
+                f.write(libraryEntry.pack(*e))
+            tables.append((len(cellTable), f.tell()))
+            for e in cellTable:
+                f.write(cellEntry.pack(*e))
+            tables.append((len(views), f.tell()))
+            for e in views:
+                f.write(cellViewEntry.pack(*e))
+            stringsOffset = f.tell()
+            position = stringsOffset + stringEntry.size * len(self._strings)
+            for (s, isUnicode) in self._strings:
+                f.write(stringEntry.pack(position, len(s), isUnicode))
+                position += len(s)
+            for (s, isUnicode) in self._strings:
+                f.write(s)
+            tables.insert(0, (len(self._strings), stringsOffset))
+            f.seek(0)
+            f.write(header.pack(magic, version, *[v for t in tables for v in t]))
+        finally:
+            f.close()
+
+    def writeElements(self, f, diagram):
+        "element records of a diagram, owners ahead of their attributes"
+        present = diagram.kinds()
+        kindOrder = [k for k in Diagram.saveOrder if k in present and k != 'attributeLabels']
+        kindOrder += [k for k in present if not k in Diagram.saveOrder]
+        kindOrder.append('attributeLabels')
+        elems = []
+        for kind in kindOrder:
+            elems.extend(sorted(diagram.iterElems(kind), key=lambda e: (e.x(), e.y())))
+        owners = {}
+        count = 0
+        for e in elems:
+            if not kindCodes.has_key(e.name()):
+                continue
+            for a in e.attributes():
+                owners[a] = count
+            f.write(self.packElement(e, owners.get(e, -1)))
+            count += 1
+        return count
+
+    def packElement(self, e, owner):
+        kind = e.name()
+        numbers = [e.angle(), e.x(), e.y()]
+        strings = []
+        flags = 0
+        if e.hMirror():
+            flags |= HMirror
+        if e.vMirror():
+            flags |= VMirror
+        if not e.visible():
+            flags |= Hidden
+        if kind in ('line', 'net_segment', 'pin', 'symbol_pin'):
+            numbers += [e.x2(), e.y2()]
+        elif kind == 'rect':
+            numbers += [e.w(), e.h()]
+        elif kind == 'ellipse':
+            numbers += [e.radiusX(), e.radiusY()]
+        elif kind == 'ellipse_arc':
+            numbers += [e.radiusX(), e.radiusY(), e.startAngle(), e.spanAngle()]
+        elif kind == 'custom_path':
+            for p in e.path():
+                numbers.extend(p)
+        elif kind == 'label':
+            numbers += [e.textSize(), e.hAlign(), e.vAlign()]
+            strings = [e.text()]
+        elif kind == 'attributeLabel':
+            numbers += [e.textSize(), e.hAlign(), e.vAlign()]
+            strings = [e.key(), e.value(), e.attribute().type()]
+            if e.visibleKey():
+                flags |= VisibleKey
+        elif kind == 'instance':
+            strings = [e.instanceLibraryPath(), e.instanceCellName(),
+                       e.instanceCellViewName()]
+        floatMask = [0] * ((len(numbers) + 7) / 8)
+        for (n, v) in enumerate(numbers):
+            if isinstance(v, float):
+                floatMask[n >> 3] |= 1 << (n & 7)
+        layer = e.layer()
+        if layer:
+            (layerName, layerType) = (self.string(layer.name()), self.string(layer.ltype()))
+        else:
+            (layerName, layerType) = (noString, noString)
+        return (recordHeader.pack(kindCodes[kind], flags, owner, layerName, layerType,
+                                  len(numbers), len(strings)) +
+                struct.pack('<%dd%dI%dB' % (len(numbers), len(strings), len(floatMask)),
+                            *(numbers + [self.string(s) for s in strings] + floatMask)))
+
+
+class DatabaseSnapshot():
+    """
+    A snapshot file opened with mmap. open() creates the libraries,
+    cells and (empty) cell views, the elements of a cell view are read
+    from the mapped file the first time the cell view is used. The
+    pages are shared by all processes opening the same snapshot.
+    """
+    def __init__(self, fileName):
+        self._file = open(fileName, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = header.unpack_from(self._map, 0)
+        if fields[0] != magic or fields[1] != version:
+            self.close()
+            raise ValueError('%s is not a version %d snapshot' % (fileName, version))
+        ((self._stringCount, self._stringsOffset),
+         (self._libraryCount, self._librariesOffset),
+         (self._cellCount, self._cellsOffset),
+         (self._cellViewCount, self._cellViewsOffset)) = zip(fields[2::2], fields[3::2])
+        self._strings = {} # string table index -> string, as they are read
+        self.loadedCellViews = 0
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def string(self, n):
+        if n == noString:
+            return None
+        s = self._strings.get(n)
+        if s is None:
+            (offset, length, isUnicode) = stringEntry.unpack_from(
+                self._map, self._stringsOffset + n * stringEntry.size)
+            s = self._map[offset:offset + length]
+            if isUnicode:
+                s = s.decode('utf-8')
+            self._strings[n] = s
+        return s
+
+    def open(self, database):
+        "add the contents of the snapshot to database, the cell views lazily"
+        libraries = []
+        cells = []
+        with database.bulkUpdate():
+            for n in range(self._libraryCount):
+                (name, parent) = libraryEntry.unpack_from(
+                    self._map, self._librariesOffset + n * libraryEntry.size)
+                name = self.string(name)
+                if parent < 0:
+                    lib = database.libraryByPath('/' + name) or Library(name, database)
+                else:
+                    parent = libraries[parent]
+                    lib = parent.libraryByPath(name) or Library(name, database, parent)
+                libraries.append(lib)
+            for n in range(self._cellCount):
+                (name, library) = cellEntry.unpack_from(
+                    self._map, self._cellsOffset + n * cellEntry.size)
+                name = self.string(name)
+                lib = libraries[library]
+                cells.append(lib.cellByName(name) or Cell(name, lib))
+            for n in range(self._cellViewCount):
+                (cell, name, cls, uu, offset, count) = cellViewEntry.unpack_from(
+                    self._map, self._cellViewsOffset + n * cellViewEntry.size)
+                cell = cells[cell]
+                name = self.string(name)
+                if cell.cellViewByName(name):
+                    continue # the database's own is kept
+                cv = diagramClasses[self.string(cls)](name, cell)
+                if uu == int(uu):
+                    uu = int(uu)
+                cv.setUU(uu)
+                cv.setLoader(self.loader(offset, count))
+        return database
+
+    def loadCellView(self, diagram):
+        "fill diagram with the elements of a snapshot of a single cell view"
+        if self._cellViewCount != 1:
+            raise ValueError('not a single cell view snapshot')
+        (cell, name, cls, uu, offset, count) = cellViewEntry.unpack_from(
+            self._map, self._cellViewsOffset)
+        if uu == int(uu):
+            uu = int(uu)
+        diagram.setUU(uu)
+        self.loadElements(diagram, offset, count)
+
+    def loader(self, offset, count):
+        return lambda cv: self.loadElements(cv, offset, count)
+
+    def loadElements(self, diagram, offset, count):
+        "create the elements of a cell view from its records"
+        layers = diagram.database().layers()
+        elems = []
+        for n in range(count):
+            (kind, flags, owner, layerName, layerType,
+             numberCount, stringCount) = recordHeader.unpack_from(self._map, offset)
+            offset += recordHeader.size
+            numbers = list(struct.unpack_from('<%dd' % numberCount, self._map, offset))
+            offset += 8 * numberCount
+            strings = [self.string(s) for s in
+                       struct.unpack_from('<%dI' % stringCount, self._map, offset)]
+            offset += 4 * stringCount
+            floatMask = self._map[offset:offset + (numberCount + 7) / 8]
+            offset += len(floatMask)
+            for (i, v) in enumerate(numbers):
+                if not ord(floatMask[i >> 3]) & (1 << (i & 7)):
+                    numbers[i] = int(v)
+            e = self.makeElement(diagram, layers, kinds[kind], flags, numbers, strings)
+            elems.append(e)
+            if e is None:
+                continue
+            if layerName != noString and layers:
+                layer = layers.layerByName(self.string(layerName), self.string(layerType))
+                if layer and layer is not e.layer():
+                    e.setLayer(layer)
+            if owner >= 0 and elems[owner]:
+                elems[owner].addAttribute(e)
+        self.loadedCellViews += 1
+
+    def makeElement(self, diagram, layers, kind, flags, numbers, strings):
+        (angle, x, y) = numbers[:3]
+        p = numbers[3:]
+        if kind == 'line':
+            e = Line(diagram, layers, x, y, p[0], p[1])
+        elif kind == 'rect':
+            e = Rect(diagram, layers, x, y, p[0], p[1])
+        elif kind == 'ellipse':
+            e = Ellipse(diagram, layers, x, y, p[0], p[1])
+        elif kind == 'ellipse_arc':
+            e = EllipseArc(diagram, layers, x, y, p[0], p[1], p[2], p[3])
+        elif kind == 'net_segment':
+            e = NetSegment(diagram, layers, x, y, p[0], p[1])
+        elif kind == 'pin':
+            e = Pin(diagram, layers, x, y, p[0], p[1])
+        elif kind == 'symbol_pin':
+            e = SymbolPin(diagram, layers, x, y, p[0], p[1])
+        elif kind == 'solder_dot':
+            if diagram.solderDotAt(x, y):
+                return None # came back with the net segments
+            e = SolderDot(diagram, layers, x, y)
+        elif kind == 'custom_path':
+            e = CustomPath(diagram, layers)
+            while p:
+                (command, n) = (p[0], pathArguments[p[0]])
+                args = p[1:1 + n]
+                p = p[1 + n:]
+                if command == CustomPath.move:
+                    e.moveTo(*args)
+                elif command == CustomPath.line:
+                    e.lineTo(*args)
+                elif command == CustomPath.curve:
+                    e.curveTo(*args)
+                else:
+                    e.closePath()
+            if (x, y) != (e.x(), e.y()):
+                e.setXY(x, y)
+        elif kind == 'label':
+            e = Label(diagram, layers)
+            e.setText(strings[0])
+        elif kind == 'attributeLabel':
+            e = AttributeLabel(diagram, layers, strings[0], strings[1])
+            e.attribute().setType(strings[2])
+            e.setVisibleKey(bool(flags & VisibleKey))
+        elif kind == 'instance':
+            e = Instance(diagram, layers)
+            e.setXY(x, y)
+            e.setInstanceCell(*strings)
+        if kind in ('label', 'attributeLabel'):
+            e.setXY(x, y)
+            e.setTextSize(p[0])
+            e.setHAlign(p[1])
+            e.setVAlign(p[2])
+        if angle:
+            e.setAngle(angle)
+        if flags & HMirror:
+            e.setHMirror(True)
+        if flags & VMirror:
+            e.setVMirror(True)
+        if flags & Hidden:
+            e.setVisible(False)
+        return e
+
+
+def writeSnapshot(database, fileName):
+    SnapshotWriter(database).write(fileName)
+
+def writeCellView(cellView, fileName):
+    "snapshot of a single cell view, see loadCellView"
+    SnapshotWriter(cellView.database(), [cellView]).write(fileName)
+
+def loadCellView(fileName, diagram):
+    "fill diagram from a snapshot written by writeCellView"
+    snapshot = DatabaseSnapshot(fileName)
+    try:
+        snapshot.loadCellView(diagram)
+    finally:
+        snapshot.close()
+
+def openSnapshot(fileName, database):
+    "add a snapshot to database, returns the open DatabaseSnapshot"
+    snapshot = DatabaseSnapshot(fileName)
+    snapshot.open(database)
+    return snapshot
+
+def main(argv=None):
+    from Database.Reader import GedaImporter
+    from Database.Layers import Layers
+    parser = optparse.OptionParser(
+        usage='%prog [options] [snapshot]')
+    parser.add_option('-y', '--symbols', action='append', default=[],
+                      help='symbol library as path=directory, may be repeated')
+    parser.add_option('-s', '--schematics', action='append', default=[],
+                      help='schematic library as path=directory, may be repeated')
+    parser.add_option('-o', '--output', help='write a snapshot of the imported libraries')
+    (opts, args) = parser.parse_args(argv)
+    database = Database()
+    database.setLayers(Layers())
+    if opts.output:
+        importer = GedaImporter(database, lazy=True)
+        stdout = sys.stdout
+        sys.stdout = sys.stderr # the importer reports on stdout
+        try:
+            importer.importLibraryList([l.split('=', 1) for l in opts.symbols],
+                                       [l.split('=', 1) for l in opts.schematics])
+        finally:
+            sys.stdout = stdout
+        start = time.time()
+        writeSnapshot(database, opts.output)
+        print 'written %s in %.3fs' % (opts.output, time.time() - start)
+    for fileName in args:
+        start = time.time()
+        database = Database()
+        database.setLayers(Layers())
+        snapshot = openSnapshot(fileName, database)
+        print 'opened %s in %.3fs' % (fileName, time.time() - start)
+        snapshot.close()
+
+if __name__ == "__main__":
+    main()
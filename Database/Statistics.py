@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2009 PSchem Contributors (see CONTRIBUTORS for details)
+
+# This file is part of PSchem Database
+
+# PSchem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# PSchem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with PSchem Database.  If not, see <http://www.gnu.org/licenses/>.
+
+# Console use, e.g.:
+#   window.hierarchyStatistics()
+#   HierarchyStatistics().occurrences(design.cellView().cell())
+
+
+class CellStatistics():
+    "what a single cell holds, below it and how deep, see HierarchyStatistics"
+    def __init__(self, cell, children):
+        self._cell = cell
+        self._children = children # child cell -> instances of it in the cell
+        self._instances = 0
+        self._leaves = 0
+        self._depth = 0
+
+    def cell(self):
+        return self._cell
+
+    def children(self):
+        return self._children
+
+    def isLeaf(self):
+        "cells without a schematic are leaf devices"
+        return self._children is None
+
+    def instances(self):
+        "instance occurrences below the cell"
+        return self._instances
+
+    def leaves(self):
+        "leaf device occurrences below the cell, the cell itself if it is a leaf"
+        return self._leaves
+
+    def depth(self):
+        "levels of schematics below the cell, 0 for leaves"
+        return self._depth
+
+
+class HierarchyStatistics():
+    """
+    Counts the occurrences in a design hierarchy without expanding it
+    into DesignUnits. The schematic -> instance -> cell graph is walked
+    once per cell: a cell's counts are computed from the counts of the
+    cells it instantiates, so the cost depends on the number of cells
+    and not on the number of occurrences. A cell is descended through
+    its schematic view, like DesignUnit.childDesignUnits does.
+
+    The counts are kept until clear(), create a new HierarchyStatistics
+    (or clear it) after the design has been edited. Cells instantiating
+    themselves, directly or not, are reported in recursive() and are
+    not descended again.
+    """
+    def __init__(self):
+        self._cells = {} # cell -> CellStatistics
+        self._recursive = set()
+
+    def clear(self):
+        self._cells = {}
+        self._recursive = set()
+
+    def recursive(self):
+        return self._recursive
+
+    def children(self, cell):
+        "child cell -> instance count of the schematic of a cell, None for leaves"
+        schematic = cell.cellViewByName('schematic')
+        if not schematic:
+            return None
+        children = {}
+        for i in schematic.instances():
+            cellView = i.instanceCellView()
+            if cellView:
+                child = cellView.cell()
+                children[child] = children.get(child, 0) + 1
+        return children
+
+    def cellStatistics(self, cell):
+        "CellStatistics of a cell, computed bottom up without recursion"
+        if self._cells.has_key(cell):
+            return self._cells[cell]
+        onStack = set([cell])
+        stack = [(cell, None)]
+        while stack:
+            (c, pending) = stack[-1]
+            if pending is None:
+                stats = CellStatistics(c, self.children(c))
+                pending = list(stats.children() or ())
+                stack[-1] = (c, pending)
+                self._cells[c] = stats
+            while pending and (self._cells.has_key(pending[-1]) or pending[-1] in onStack):
+                if pending[-1] in onStack:
+                    self._recursive.add(pending[-1])
+                pending.pop()
+            if pending:
+                child = pending.pop()
+                onStack.add(child)
+                stack.append((child, None))
+            else:
+                onStack.discard(c)
+                self.count(self._cells[c], onStack)
+                stack.pop()
+        return self._cells[cell]
+
+    def count(self, stats, onStack):
+        "counts of a cell from the finished counts of its children"
+        if stats.isLeaf():
+            stats._leaves = 1
+            return
+        for (child, n) in stats.children().iteritems():
+            stats._instances += n
+            if child in onStack: # recursive, not descended again
+                continue
+            s = self._cells[child]
+            stats._instances += n * s.instances()
+            stats._leaves += n * s.leaves()
+            stats._depth = max(stats._depth, 1 + s.depth())
+
+    def occurrences(self, cell):
+        """
+        cell -> occurrences of the cell in the hierarchy below a cell,
+        children multiplied down in topological order
+        """
+        self.cellStatistics(cell)
+        order = []
+        visited = set([cell])
+        stack = [(cell, iter(self._cells[cell].children() or ()))]
+        while stack:
+            (c, children) = stack[-1]
+            for child in children:
+                if not child in visited:
+                    visited.add(child)
+                    stack.append((child, iter(self._cells[child].children() or ())))
+                    break
+            else:
+                order.append(c)
+                stack.pop()
+        order.reverse()
+        occurrences = dict((c, 0) for c in order)
+        occurrences[cell] = 1
+        position = dict((c, n) for (n, c) in enumerate(order))
+        for c in order:
+            for (child, n) in (self._cells[c].children() or {}).iteritems():
+                if position[child] > position[c]: # not back to a recursive cell
+                    occurrences[child] += n * occurrences[c]
+        del occurrences[cell]
+        return occurrences
+
+    def designStatistics(self, design):
+        "instances, leaves, depth and cell occurrences of a Design or DesignUnit"
+        cell = design.cellView().cell()
+        stats = self.cellStatistics(cell)
+        occurrences = self.occurrences(cell)
+        return {'cell': cell,
+                'instances': stats.instances(),
+                'leaves': stats.leaves(),
+                'depth': stats.depth(),
+                'cells': len(occurrences),
+                'occurrences': occurrences}
+
+    def report(self, design, stream):
+        "write the statistics of a design to a stream"
+        s = self.designStatistics(design)
+        cell = s['cell']
+        stream.write('%s/%s: %d instances, %d leaf devices, depth %d, %d cells\n' %
+                     (cell.library().path(), cell.name(), s['instances'],
+                      s['leaves'], s['depth'], s['cells']))
+        occurrences = s['occurrences'].items()
+        occurrences.sort(key=lambda (c, n): (-n, c.library().path(), c.name()))
+        for (c, n) in occurrences:
+            kind = 'leaf'
+            if not self._cells[c].isLeaf():
+                kind = '%d below' % self._cells[c].instances()
+            stream.write('  %10d %s/%s (%s)\n' % (n, c.library().path(), c.name(), kind))
+        if self._recursive:
+            stream.write('  recursive: %s\n' %
+                         ', '.join(sorted(c.name() for c in self._recursive)))
@@ -46,6 +46,14 @@ class BaseItem(QtGui.QGraphicsItem):
 
     def preSelected(self):
         return self._preSelected
+
+    def elementRemoved(self):
+        "the element shown by the item was removed from its diagram"
+        parent = self.parentItem()
+        if self.scene():
+            self.scene().removeItem(self)
+        if parent:
+            parent.updateBoundingRect()
         
 class TextItemInt(QtGui.QGraphicsSimpleTextItem):
     def __init__(self, parent):
@@ -566,6 +574,10 @@ class InstanceItem(BaseItem):
         self.model = None
         self._cellView = None
         self.scene().removeItem(self)
+
+    def elementRemoved(self):
+        self.cellView().removedInstanceItem(self)
+        BaseItem.elementRemoved(self)
         
     def paint(self, painter, option, widget):
         if not self.parentItem():
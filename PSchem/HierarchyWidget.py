@@ -20,21 +20,100 @@
 from PyQt4 import QtCore, QtGui
 from Database.Primitives import *
 from Database.Design import *
+from Database.Statistics import HierarchyStatistics
 #import sys
 
 class HierarchyModel(QtCore.QAbstractItemModel):
     def __init__(self, designs, parent=None):
         QtCore.QAbstractItemModel.__init__(self, parent)
         self._designs = designs
+        self._statistics = HierarchyStatistics()
+        # The indices refer to design units by key, the model holds the
+        # units it has handed out until their parent is collapsed.
+        self._nodes = {} # key -> design unit
+        self._keys = {}  # design unit -> key
+        self._nextKey = 1
+        self._connectivities = {} # followed nets of the Nets column -> schematic
         designs.installUpdateHierarchyViewsHook(self)
 
     def designs(self):
         return self._designs
-        
+
+    def node(self, index):
+        "design unit of an index or None if it has been released"
+        if not index.isValid():
+            return None
+        return self._nodes.get(index.internalId())
+
+    def nodeIndex(self, row, column, designUnit):
+        key = self._keys.get(designUnit)
+        if key is None:
+            key = self._nextKey
+            self._nextKey += 1
+            self._keys[designUnit] = key
+            self._nodes[key] = designUnit
+        return self.createIndex(row, column, key)
+
+    def release(self, index):
+        "drop the design units below a collapsed index"
+        designUnit = self.node(index)
+        if designUnit is None:
+            return
+        for d in self._keys.keys():
+            p = d.parentDesignUnit()
+            while p is not None and p is not designUnit:
+                p = p.parentDesignUnit()
+            if p is designUnit:
+                del self._nodes[self._keys.pop(d)]
+        self.releaseConnectivities()
+
+    def alive(self, designUnit):
+        "the design unit's instances are all still there"
+        while designUnit.parentDesignUnit():
+            if designUnit.row() < 0:
+                return False
+            designUnit = designUnit.parentDesignUnit()
+        return designUnit in self.designs()
+
     def update(self):
+        # designs were added or removed or the instances of a schematic changed
+        self._statistics.clear()
+        for d in self._keys.keys():
+            if not self.alive(d):
+                del self._nodes[self._keys.pop(d)]
+        self.releaseConnectivities()
         self.emit(QtCore.SIGNAL("layoutChanged()"))
         #self.reset()
 
+    def netCount(self, designUnit):
+        """
+        nets of the schematic below a design unit if they have been
+        extracted already, they are followed while the unit is shown
+        """
+        schematic = designUnit.schematic()
+        if not schematic:
+            return None
+        connectivity = schematic.extractedConnectivity()
+        if connectivity is None:
+            return None
+        if not connectivity in self._connectivities:
+            self._connectivities[connectivity] = schematic
+            connectivity.installUpdateHook(self)
+            self.releaseConnectivities() # e.g. the nets it had before
+        return connectivity.netCount()
+
+    def releaseConnectivities(self):
+        "stop following the nets of schematics no longer shown or released"
+        shown = set(d.schematic() for d in self._keys)
+        for (connectivity, schematic) in self._connectivities.items():
+            if not schematic in shown or schematic.extractedConnectivity() is not connectivity:
+                connectivity.removeUpdateHook(self)
+                del self._connectivities[connectivity]
+
+    def netsUpdated(self, added, changed, removed):
+        if added or removed:
+            self.emit(QtCore.SIGNAL("layoutChanged()"))
+
     def data(self, index, role):
         if not index.isValid():
             return QtCore.QVariant()
@@ -45,7 +124,17 @@ class HierarchyModel(QtCore.QAbstractItemModel):
         row = index.row()
 
         col = index.column()
-        data = index.internalPointer()
+        data = self.node(index)
+        if col == 3 and isinstance(data, DesignUnit):
+            cellView = data.cellView()
+            if cellView:
+                return QtCore.QVariant(self._statistics.cellStatistics(cellView.cell()).leaves())
+            return QtCore.QVariant()
+        if col == 4 and isinstance(data, DesignUnit):
+            nets = self.netCount(data)
+            if nets is not None:
+                return QtCore.QVariant(nets)
+            return QtCore.QVariant()
         if isinstance(data, Design):
             if col == 0:
                 return QtCore.QVariant('')
@@ -65,53 +154,38 @@ class HierarchyModel(QtCore.QAbstractItemModel):
 
 
     def index(self, row, column, parent):
-
-        data = None
-        if parent.isValid():
-            data = parent.internalPointer()
-
         if not parent.isValid():
-        #if isinstance(data, Design):
             children = list(self.designs())
-        elif isinstance(data, DesignUnit):
-            children = data.childDesignUnits().values() #+ list(data.pins()) + list(data.nets() - data.pins())
-        else:
+            if row >= 0 and len(children) > row:
+                return self.nodeIndex(row, column, children[row])
             return QtCore.QModelIndex()
 
-        if row >= 0 and len(children) > row:
-            return self.createIndex(row, column, children[row])
-        else:
-            return QtCore.QModelIndex()
+        data = self.node(parent)
+        if isinstance(data, DesignUnit):
+            child = data.childDesignUnitAt(row)
+            if child:
+                return self.nodeIndex(row, column, child)
+        return QtCore.QModelIndex()
 
     def parent(self, index):
-        if not index.isValid():
-            return QtCore.QModelIndex()
-
-        data = index.internalPointer()
-        if isinstance(data, Design):
-            return QtCore.QModelIndex()
+        data = self.node(index)
         if isinstance(data, DesignUnit):
             parent = data.parentDesignUnit()
-            #sys.stderr.write('parent' + parent.cellView().cell().name() + "\n")
             if parent:
-                pparent = parent.parentDesignUnit()
-                if pparent:
-                    #sys.stderr.write('pparent' + pparent.cellView().cell().name() + "\n")
-                    d = pparent.childDesignUnits().values()
-                    n = d.index(parent)
-                    return self.createIndex(n, 0, parent)
+                if parent.parentDesignUnit():
+                    return self.nodeIndex(parent.row(), 0, parent)
                 else:
                     d = list(self.designs())
                     n = d.index(parent)
-                    return self.createIndex(n, 0, parent)
+                    return self.nodeIndex(n, 0, parent)
         return QtCore.QModelIndex()
 
     def hasChildren(self, parent):
         if not parent.isValid():
             return True
-        data = parent.internalPointer()
+        data = self.node(parent)
         if isinstance(data, DesignUnit):
-            return len(data.childDesignUnits()) > 0
+            return data.childCount() > 0
         else:
             return False
 
@@ -122,17 +196,17 @@ class HierarchyModel(QtCore.QAbstractItemModel):
         if not parent.isValid():
             return len(self.designs())
 
-        data = parent.internalPointer()
+        data = self.node(parent)
         if isinstance(data, DesignUnit):
-            return len(data.childDesignUnits()) #+ list(data.pins()) + list(data.nets() - data.pins())
+            return data.childCount() #+ list(data.pins()) + list(data.nets() - data.pins())
         return 0
 
     def columnCount(self, parent):
         if not parent.isValid():
-            return 3
-        data = parent.internalPointer()
+            return 5
+        data = self.node(parent)
         if isinstance(data, DesignUnit):
-            return 3
+            return 5
         return 0
 
 
@@ -144,6 +218,10 @@ class HierarchyModel(QtCore.QAbstractItemModel):
                 return QtCore.QVariant(self.tr("Cell"))
             elif section == 2:
                 return QtCore.QVariant(self.tr("Library"))
+            elif section == 3:
+                return QtCore.QVariant(self.tr("Leaves"))
+            elif section == 4:
+                return QtCore.QVariant(self.tr("Nets"))
             else:
                 return QtCore.QVariant()
 
@@ -225,5 +303,17 @@ class HierarchyWidget(QtGui.QWidget):
     def setSourceModel(self, model):
         self.proxyModel.setSourceModel(model)
         self.treeView.setModel(self.proxyModel)
+        self.connect(self.treeView,
+                     QtCore.SIGNAL("collapsed(const QModelIndex &)"),
+                     self.release)
+
+    def release(self, index):
+        "let the design units below a collapsed item go"
+        current = self.treeView.currentIndex().parent()
+        while current.isValid() and current != index:
+            current = current.parent()
+        if current.isValid():
+            self.treeView.setCurrentIndex(index)
+        self.proxyModel.sourceModel().release(self.proxyModel.mapToSource(index))
 
 
@@ -32,7 +32,9 @@ from PSchem.GraphicsScene import *
 from PSchem.LayerView import *
 from PSchem.Resources_rc import *
 from Database import Cells, Reader
+from Database.Statistics import HierarchyStatistics
 import os
+import sys
 
 class SubWindow(QtGui.QMdiSubWindow):
     def __init__(self, window):
@@ -51,6 +53,7 @@ class PWindow(QtGui.QMainWindow):
         self._currentView = None
 
         self.database = Database()
+        self.importer = None
 
         #print os.path.join(os.getcwd(), 'pschem.ini')
         self.settings = QtCore.QSettings('pschem', 'pschem')
@@ -403,6 +406,11 @@ class PWindow(QtGui.QMainWindow):
         self.connect(self.toggleDocksAct, QtCore.SIGNAL("triggered()"),
                     lambda: self.controller.execute(self.toggleDocksCmd))
 
+        self.hierarchyStatisticsAct = QtGui.QAction(self.tr("Hierarchy Statistics"), self)
+        self.hierarchyStatisticsAct.setStatusTip(self.tr("Count the instances and leaf devices below the current design"))
+        self.hierarchyStatisticsCmd = Command("window.hierarchyStatistics()")
+        self.connect(self.hierarchyStatisticsAct, QtCore.SIGNAL("triggered()"),
+                    lambda: self.controller.execute(self.hierarchyStatisticsCmd))
 
         self.aboutAct = QtGui.QAction(self.tr("&About"), self)
         self.aboutAct.setStatusTip(self.tr("Show the application's About box"))
@@ -611,6 +619,7 @@ class PWindow(QtGui.QMainWindow):
         self.databaseMenu.addAction(self.openCellViewAct)
         self.databaseMenu.addAction(self.newSchematicAct)
         self.databaseMenu.addAction(self.toggleDocksAct)
+        self.databaseMenu.addAction(self.hierarchyStatisticsAct)
         self.databaseMenu.addAction(self.zoomInAct)
         self.databaseMenu.addAction(self.zoomPrevAct)
         self.databaseMenu.addAction(self.moveAct)
@@ -713,6 +722,13 @@ class PWindow(QtGui.QMainWindow):
                     d.hide()
                     self.hiddenDocks.add(d)
 
+    def hierarchyStatistics(self, design=None):
+        "print the hierarchy statistics of a design, the current one by default"
+        if not design and self._currentView and self._currentView.scene():
+            design = self._currentView.scene().design()
+        if design:
+            HierarchyStatistics().report(design, sys.stdout)
+
     def detachCurrentView(self):
         subwin = self.mdiArea.activeSubWindow()
         if subwin:
@@ -778,7 +794,9 @@ class PWindow(QtGui.QMainWindow):
     def newSchematic(self):
         #lib = self.database.makeLibrary('work')
         #self.database.addLibrary(lib)
-        importer = Reader.GedaImporter(self.database)
+        importer = Reader.GedaImporter(self.database, processes=None, lazy=True,
+                                       cacheDirectory='~/.pschem/cache')
+        self.importer = importer
         importer.importLibraryList(
             [
                 ['/spnet/latch', '../spNet/latch'],
@@ -801,6 +819,11 @@ class PWindow(QtGui.QMainWindow):
                 ['/examples/gTAG', '../geda/examples/gTAG'],
             ])
         
+    def refreshLibraries(self):
+        "re-import library files changed outside PSchem"
+        if self.importer:
+            self.importer.refreshLibraryList()
+
     def openCellView(self, cellView):
         if cellView:
             design = Design(cellView, self.database.designs())